@@ -0,0 +1,168 @@
+"""Бенчмарк синхронизации с Google Календарем на поддельном API.
+
+Поднимает FakeCalendarServer с задержкой ответа --api-latency и вставляет
+--events событий тремя способами:
+
+- blocking: как scheduler.book_timeslot -- строит сервис и вызывает
+  insert().execute() прямо в цикле событий, по одному;
+- threaded: GoogleCalendarClient без пакетов (batch_size=1), вызовы
+  идут в пуле потоков;
+- batched: GoogleCalendarClient с пакетными запросами.
+
+И два способа загрузить изменения --accounts календарей по --events
+событий, из которых --changed изменено в Google:
+
+- pull_full: полный список событий каждого календаря;
+- pull_delta: только изменения после syncToken, как в CalendarSync.
+
+Для каждого способа выводится общее время, число HTTP-запросов к API, число
+полученных событий и
+задержка цикла событий: насколько позже положенного просыпалась задача,
+которая каждые 10 мс вызывает asyncio.sleep. Сервер работает в отдельном
+потоке, чтобы синхронные вызовы blocking не ждали сами себя.
+Запуск из корня репозитория:
+
+    python -m benchmarks.calendar_sync --events 500 --api-latency 50
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from benchmarks.common import summarize, git_commit, probe_loop_lag, write_results
+from benchmarks.fake_calendar import FakeCalendarServer
+
+MODES = ["blocking", "threaded", "batched", "pull_full", "pull_delta"]
+
+
+def make_events(count: int) -> list[dict]:
+    from utils.google_calendar import build_event
+
+    return [
+        build_event({"note_text": f"Заметка {i}", "note_date": "01-06-2026", "note_time": "10:00"}, "user@example.com")
+        for i in range(count)
+    ]
+
+
+async def run_blocking(root_url: str, events: list[dict]):
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+
+    for event in events:
+        service = build("calendar", "v3", credentials=AnonymousCredentials(),
+                        client_options={"api_endpoint": root_url + "calendar/v3/"},
+                        static_discovery=True, cache_discovery=False)
+        service.events().insert(calendarId="primary", body=event).execute()
+        await asyncio.sleep(0)
+
+
+async def run_client(root_url: str, events: list[dict], batch_size: int, threads: int):
+    from google.auth.credentials import AnonymousCredentials
+    from utils.google_calendar import GoogleCalendarClient
+
+    client = GoogleCalendarClient(root_url=root_url, threads=threads, batch_size=batch_size,
+                                  credentials=AnonymousCredentials())
+    try:
+        results = await client.insert_events(events)
+    finally:
+        await client.close()
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        raise failed[0]
+
+
+async def run_pull(root_url: str, server: FakeCalendarServer, args, delta: bool) -> tuple[int, float]:
+    """Загружает изменения календарей; возвращает число полученных событий и время загрузки."""
+    from google.auth.credentials import AnonymousCredentials
+    from utils.google_calendar import GoogleCalendarClient
+
+    calendars = [f"user{index}@gmail.com" for index in range(args.accounts)]
+    ids = {calendar: [server.add_event(calendar, event) for event in make_events(args.events)]
+           for calendar in calendars}
+    client = GoogleCalendarClient(root_url=root_url, threads=args.threads, batch_size=args.batch_size,
+                                  credentials=AnonymousCredentials())
+    try:
+        tokens = {}
+        if delta:
+            # Начальная полная синхронизация -- один раз, до замера
+            results = await asyncio.gather(*(client.list_changes(calendar) for calendar in calendars))
+            tokens = {calendar: token for calendar, (_, token) in zip(calendars, results)}
+        for calendar in calendars:
+            for event_id in ids[calendar][:args.changed]:
+                server.edit_event(calendar, event_id, summary="Изменено в календаре")
+        server.http_requests = 0
+        started = time.perf_counter()
+        results = await asyncio.gather(*(client.list_changes(calendar, tokens.get(calendar)) for calendar in calendars))
+        duration = time.perf_counter() - started
+    finally:
+        await client.close()
+    return sum(len(events) for events, _ in results), duration
+
+
+async def run_mode(mode: str, args) -> dict:
+    server = FakeCalendarServer(latency=args.api_latency / 1000)
+    root_url = server.start_in_thread()
+    events = make_events(args.events)
+    lags: list[float] = []
+    probe = asyncio.create_task(probe_loop_lag(lags))
+    started = time.perf_counter()
+    received = None
+    try:
+        if mode.startswith("pull_"):
+            received, duration = await run_pull(root_url, server, args, delta=mode == "pull_delta")
+        elif mode == "blocking":
+            await run_blocking(root_url, events)
+        elif mode == "threaded":
+            await run_client(root_url, events, batch_size=1, threads=args.threads)
+        else:
+            await run_client(root_url, events, batch_size=args.batch_size, threads=args.threads)
+        if received is None:
+            duration = time.perf_counter() - started
+    finally:
+        probe.cancel()
+        server.stop_in_thread()
+    return {
+        "mode": mode,
+        "duration_s": round(duration, 3),
+        "events_per_s": round(args.events / duration, 1),
+        "http_requests": server.http_requests,
+        "stored_events": sum(len(events) for events in server.events.values()),
+        "received_events": received,
+        "loop_lag": summarize(lags),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    results = [await run_mode(mode, args) for mode in args.modes]
+    return {
+        "benchmark": "calendar_sync",
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args) | {"output": None},
+        "modes": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200, help="сколько событий вставить")
+    parser.add_argument("--api-latency", type=float, default=50.0, help="задержка ответа поддельного API, мс")
+    parser.add_argument("--threads", type=int, default=4, help="потоков в пуле клиента")
+    parser.add_argument("--batch-size", type=int, default=50, help="событий в пакетном запросе")
+    parser.add_argument("--accounts", type=int, default=20, help="календарей в замере загрузки изменений")
+    parser.add_argument("--changed", type=int, default=5, help="событий, измененных в каждом календаре")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/calendar_sync-<commit>.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args))
+    print(f"{'mode':<10} {'time, s':>8} {'requests':>9} {'received':>9} {'lag p99, ms':>11} {'lag max, ms':>11}")
+    for mode in result["modes"]:
+        print(f"{mode['mode']:<10} {mode['duration_s']:>8} {mode['http_requests']:>9} {mode['received_events'] or '-':>9} "
+              f"{mode['loop_lag']['p99_ms']:>11.1f} {mode['loop_lag']['max_ms']:>11.1f}")
+    output = write_results("calendar_sync", result, args.output)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Общие функции бенчмарков: перцентили, задержка цикла событий, коммит и запись результатов."""
+import asyncio
+import json
+import os
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# Период задачи, измеряющей задержку цикла событий, секунд
+LAG_PROBE_INTERVAL = 0.01
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль q (0..100) по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def summarize(values: list[float], unit: str = "ms") -> dict:
+    return {
+        "count": len(values),
+        f"p50_{unit}": round(percentile(values, 50), 3),
+        f"p95_{unit}": round(percentile(values, 95), 3),
+        f"p99_{unit}": round(percentile(values, 99), 3),
+        f"max_{unit}": round(max(values, default=0.0), 3),
+    }
+
+
+async def probe_loop_lag(lags: list[float]):
+    """Записывает, на сколько миллисекунд позже положенного просыпается задача."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - LAG_PROBE_INTERVAL) * 1000)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name: str, result: dict, output: str | None = None) -> str:
+    """Пишет результаты в JSON (по умолчанию benchmarks/results/<name>-<commit>.json)."""
+    output = output or os.path.join(RESULTS_DIR, f"{name}-{result['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return output
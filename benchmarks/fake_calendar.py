@@ -0,0 +1,230 @@
+"""Поддельный Google Calendar API для бенчмарков и ручной проверки.
+
+Отвечает на вставку, изменение и удаление событий
+(/calendar/v3/calendars/{id}/events[/{eventId}]) и на пакетные запросы
+(POST /batch/calendar/v3) так же, как Google: multipart/mixed с частями
+application/http. События хранятся в памяти; удаленные остаются со
+status="cancelled", и повторная вставка их ID отвечает 409. Список событий
+(GET .../events) поддерживает syncToken и pageToken: с токеном отдаются
+только события, измененные после него. fail_rate -- доля вызовов, на
+которые сервер отвечает 503, чтобы проверять повторы.
+
+Изменения "со стороны пользователя" делаются методами add_event,
+edit_event и cancel_event; expire_sync_tokens() заставляет клиентов
+заново выполнить полную синхронизацию (ответ 410).
+GoogleCalendarClient направляется на сервер через root_url и
+AnonymousCredentials:
+
+    server = FakeCalendarServer(latency=0.05)
+    root_url = await server.start()
+    client = GoogleCalendarClient(root_url=root_url, credentials=AnonymousCredentials())
+
+Чтобы проверять синхронные вызовы в цикле событий, сервер можно запустить
+в отдельном потоке со своим циклом: start_in_thread() / stop_in_thread().
+"""
+import asyncio
+import email.parser
+import email.policy
+import json
+import random
+import re
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote
+
+from aiohttp import web
+
+
+def _error(code: int, message: str) -> dict:
+    return {"error": {"code": code, "message": message}}
+
+
+class FakeCalendarServer:
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 seed: int = 0):
+        # Задержка ответа на один HTTP-запрос, секунд
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self.host = host
+        self.port = port
+        # ID календаря -> ID события -> событие
+        self.events: dict[str, dict[str, dict]] = defaultdict(dict)
+        # Номер последнего изменения; он же etag события и syncToken
+        self._version = 0
+        # ID календаря -> ID события -> номер его последнего изменения
+        self._changed: dict[str, dict[str, int]] = defaultdict(dict)
+        # Токены меньше этого номера устарели
+        self._min_sync_token = 0
+        self.http_requests = 0
+        self.batch_requests = 0
+        # Вызовы API, в том числе вложенные в пакеты, по методу
+        self.calls: dict[str, int] = defaultdict(int)
+        self._runner: web.AppRunner | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def _store(self, calendar_id: str, event: dict) -> dict:
+        self._version += 1
+        event["etag"] = f'"{self._version}"'
+        event["updated"] = datetime.now(timezone.utc).isoformat()
+        self.events[calendar_id][event["id"]] = event
+        self._changed[calendar_id][event["id"]] = self._version
+        return event
+
+    def add_event(self, calendar_id: str, event: dict) -> str:
+        """Создает событие, как если бы его добавили в Google Календаре; возвращает ID."""
+        event = {**event, "id": event.get("id") or uuid.uuid4().hex, "status": "confirmed"}
+        return self._store(calendar_id, event)["id"]
+
+    def edit_event(self, calendar_id: str, event_id: str, **fields):
+        self._store(calendar_id, {**self.events[calendar_id][event_id], **fields})
+
+    def cancel_event(self, calendar_id: str, event_id: str):
+        self.edit_event(calendar_id, event_id, status="cancelled")
+
+    def expire_sync_tokens(self):
+        self._min_sync_token = self._version + 1
+
+    def _list(self, calendar_id: str, query: str) -> tuple[int, dict]:
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        max_results = int(params.get("maxResults", 250))
+        if "pageToken" in params:
+            offset, snapshot, since = map(int, params["pageToken"].split("."))
+            since = None if since < 0 else since
+        else:
+            offset, snapshot = 0, self._version
+            since = int(params["syncToken"]) if "syncToken" in params else None
+            if since is not None and since < self._min_sync_token:
+                return 410, _error(410, "Sync token is no longer valid, a full sync is required.")
+        changed = self._changed[calendar_id]
+        ids = sorted(
+            (event_id for event_id, version in changed.items()
+             if version <= snapshot and (since is None or version > since)),
+            key=changed.get,
+        )
+        events = self.events[calendar_id]
+        if since is None and params.get("showDeleted") != "true":
+            ids = [event_id for event_id in ids if events[event_id]["status"] != "cancelled"]
+        response = {"kind": "calendar#events", "items": [events[event_id] for event_id in ids[offset:offset + max_results]]}
+        if offset + max_results < len(ids):
+            response["nextPageToken"] = f"{offset + max_results}.{snapshot}.{-1 if since is None else since}"
+        else:
+            response["nextSyncToken"] = str(snapshot)
+        return 200, response
+
+    def _call(self, method: str, path: str, body: bytes) -> tuple[int, dict | None]:
+        """Выполняет один вызов API; возвращает HTTP-статус и тело ответа."""
+        path, _, query = path.partition("?")
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        # calendar/v3/calendars/{calendarId}/events[/{eventId}]
+        if len(parts) not in (5, 6) or parts[:3] != ["calendar", "v3", "calendars"] or parts[4] != "events":
+            return 404, _error(404, "Not Found")
+        events = self.events[parts[3]]
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            return 503, _error(503, "Backend Error")
+        if len(parts) == 5 and method == "GET":
+            self.calls["list"] += 1
+            return self._list(parts[3], query)
+        if len(parts) == 5 and method == "POST":
+            self.calls["insert"] += 1
+            event = json.loads(body)
+            event_id = event.setdefault("id", uuid.uuid4().hex)
+            if event_id in events:
+                return 409, _error(409, "The requested identifier already exists.")
+            return 200, self._store(parts[3], {**event, "status": "confirmed"})
+        if len(parts) != 6:
+            return 404, _error(404, "Not Found")
+        event = events.get(parts[5])
+        if method == "PUT":
+            self.calls["update"] += 1
+            if event is None:
+                return 404, _error(404, "Not Found")
+            return 200, self._store(parts[3], {"status": "confirmed", **json.loads(body), "id": parts[5]})
+        if method == "DELETE":
+            self.calls["delete"] += 1
+            if event is None:
+                return 404, _error(404, "Not Found")
+            if event["status"] == "cancelled":
+                return 410, _error(410, "Resource has been deleted")
+            self._store(parts[3], {**event, "status": "cancelled"})
+            return 204, None
+        return 404, _error(404, "Not Found")
+
+    async def _handle_call(self, request: web.Request):
+        self.http_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status, response = self._call(request.method, request.path_qs, await request.read())
+        if response is None:
+            return web.Response(status=status)
+        return web.json_response(response, status=status)
+
+    def _handle_part(self, payload: bytes) -> tuple[int, dict | None]:
+        """Выполняет один вложенный HTTP-запрос пакета."""
+        # googleapiclient отделяет строки вложенного запроса одним \n
+        head, body = re.split(rb"\r?\n\r?\n", payload, maxsplit=1)
+        method, path, _ = head.splitlines()[0].decode().split(" ", 2)
+        return self._call(method, path, body)
+
+    async def _handle_batch(self, request: web.Request):
+        self.http_requests += 1
+        self.batch_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        raw = await request.read()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {request.headers['Content-Type']}\r\n\r\n".encode() + raw
+        )
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for part in message.iter_parts():
+            content_id = part["Content-ID"].strip("<>")
+            status, response = self._handle_part(part.get_payload(decode=True))
+            chunks.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(response) if response is not None else ''}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return web.Response(body="".join(chunks).encode(),
+                            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"})
+
+    async def start(self) -> str:
+        """Запускает сервер и возвращает его адрес для root_url."""
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/batch/calendar/v3", self._handle_batch)
+        app.router.add_route("*", "/calendar/v3/{path:.*}", self._handle_call)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{self.host}:{port}/"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> str:
+        """Запускает сервер в отдельном потоке и возвращает его адрес."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-calendar", daemon=True)
+        self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+
+    def stop_in_thread(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
@@ -0,0 +1,439 @@
+"""Бенчмарк обработчиков: полный сценарий пользователей через настоящий Dispatcher.
+
+Синтетические Update подаются в Dispatcher с handlers.router и хранилищем
+SQLiteStorage на временной базе. Вместо Telegram ответы принимает
+FakeSession: она записывает вызовы API и отвечает без сети. Каждый
+пользователь добавляет заметки через мастер (текст, категория, час,
+минуты, дата), открывает список и заметку, ищет по категории и по тексту
+и удаляет заметку. Пользователи работают одновременно.
+
+Результат -- задержка обработки одного Update (p50/p95/p99) по шагам и
+всего, и число Update в секунду. JSON с результатами пишется в
+benchmarks/results/, чтобы сравнивать коммиты. Запуск из корня репозитория:
+
+    python -m benchmarks.handlers --users 2000 --concurrency 500
+
+С --workers N обновления идут не в Dispatcher этого процесса, а через
+utils.workers.WorkerPool в N рабочих процессов, как при BOT_WORKERS = N в
+режиме polling. Тогда задержка -- от отправки Update в очередь до ответа
+процесса, включая передачу между процессами. Заодно проверяется, что все
+обновления пользователя -- и сообщения, и нажатия кнопок -- попали в один
+процесс (split_users; иначе бенчмарк считает это ошибкой). Чтобы сравнить
+один процесс с несколькими, запустите с --workers 1 и --workers N:
+
+    python -m benchmarks.handlers --users 2000 --workers 1
+    python -m benchmarks.handlers --users 2000 --workers 4
+
+Рост пропускной способности ограничен числом ядер и тем, что запись в
+SQLite идет по одной транзакции за раз на все процессы.
+"""
+import argparse
+import asyncio
+import functools
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import config
+from benchmarks.common import summarize, git_commit, write_results
+
+WORDS = (
+    "купить", "молоко", "позвонить", "маме", "отчет", "сдать", "встреча",
+    "врач", "записаться", "оплатить", "квартира", "подарок", "билеты",
+    "проект", "презентация", "тренировка", "книга", "прочитать",
+)
+CATEGORIES = ("Работа", "Дом", "Учёба", "Здоровье", "Покупки", "Спорт")
+
+
+def _load_bot_modules():
+    """Импортирует модули бота после подмены config.DATABASE_NAME.
+
+    Обработчики и кэши берут имя базы из config при импорте, поэтому
+    импортировать их можно только после того, как выбрана временная база.
+    """
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage, EditMessageText, EditMessageReplyMarkup
+    from aiogram.types import Message, Update
+    from database import init_db, open_pool, close_pool
+    from handlers import router
+    from utils.fsm_storage import SQLiteStorage
+
+    class FakeSession(BaseSession):
+        """Сессия бота, которая записывает вызовы API вместо отправки в Telegram."""
+
+        def __init__(self, api_latency: float = 0.0):
+            super().__init__()
+            self.api_latency = api_latency
+            self.calls: Counter = Counter()
+            # ID чата -> последняя отправленная или измененная клавиатура
+            self.markups: dict[int, object] = {}
+            # URL файла -> содержимое для bot.download; по умолчанию файлы пустые
+            self.files: dict[str, bytes] = {}
+            self._message_ids = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if self.api_latency:
+                await asyncio.sleep(self.api_latency)
+            if isinstance(method, (SendMessage, EditMessageText, EditMessageReplyMarkup)):
+                if method.reply_markup is not None:
+                    self.markups[method.chat_id] = method.reply_markup
+                if isinstance(method, SendMessage):
+                    self._message_ids += 1
+                    message_id = self._message_ids
+                else:
+                    message_id = method.message_id
+                return Message(
+                    message_id=message_id,
+                    date=datetime.now(),
+                    chat={"id": method.chat_id, "type": "private"},
+                    text=getattr(method, "text", None),
+                )
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            self.calls["stream_content"] += 1
+            if self.api_latency:
+                await asyncio.sleep(self.api_latency)
+            content = self.files.get(url, b"")
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+
+        async def close(self):
+            pass
+
+    return {
+        "Bot": Bot,
+        "Dispatcher": Dispatcher,
+        "Update": Update,
+        "FakeSession": FakeSession,
+        "SQLiteStorage": SQLiteStorage,
+        "router": router,
+        "init_db": init_db,
+        "open_pool": open_pool,
+        "close_pool": close_pool,
+    }
+
+
+class UserSimulator:
+    """Проводит одного пользователя по сценарию, подавая Update в Dispatcher."""
+
+    def __init__(self, bench: "HandlerBenchmark", user_id: int, rng: random.Random):
+        self.bench = bench
+        self.user_id = user_id
+        self.rng = rng
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+        # Сообщение бота, к которому привязаны кнопки
+        self.message_id = 0
+
+    def _buttons(self, prefix: str) -> list[str]:
+        markup = self.bench.session.markups.get(self.user_id)
+        if markup is None:
+            return []
+        return [
+            button.callback_data
+            for row in markup.inline_keyboard for button in row
+            if button.callback_data and button.callback_data.startswith(prefix)
+        ]
+
+    async def send_text(self, step: str, text: str):
+        self.message_id += 1
+        await self.bench.feed(step, {"message": {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": self.chat,
+            "from": self.user,
+            "text": text,
+        }})
+
+    async def tap(self, step: str, data: str):
+        await self.bench.feed(step, {"callback_query": {
+            "id": f"{self.user_id}-{self.bench.next_update_id()}",
+            "from": self.user,
+            "chat_instance": str(self.user_id),
+            "data": data,
+            "message": {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": self.chat,
+                "text": "...",
+            },
+        }})
+
+    async def add_note(self):
+        await self.tap("add_note", "add_note")
+        words = self.rng.sample(WORDS, 3)
+        await self.send_text("note_text", " ".join(words))
+        existing = self._buttons("note_category_")
+        if existing and self.rng.random() < 0.5:
+            await self.tap("note_category", self.rng.choice(existing))
+        else:
+            await self.send_text("note_type", self.rng.choice(CATEGORIES))
+        await self.tap("select_hour", f"select_hour_{self.rng.randrange(24)}")
+        await self.tap("select_minute", f"select_minute_{self.rng.randrange(0, 60, 5)}")
+        day = datetime.now().date() + timedelta(days=self.rng.randrange(1, 20))
+        await self.tap("select_day", f"select_day_{day.year}_{day.month}_{day.day}")
+        return words
+
+    async def run(self, notes: int):
+        words = []
+        for _ in range(notes):
+            words = await self.add_note()
+        await self.tap("list_notes", "list_notes")
+        views = self._buttons("view_")
+        for data in views[:2]:
+            await self.tap("view", data)
+            await self.tap("list_notes", "list_notes")
+        await self.tap("show_by_type", "show_by_type")
+        categories = self._buttons("type_search_")
+        if categories:
+            await self.tap("type_search", self.rng.choice(categories))
+        await self.tap("show_by_text", "show_by_text")
+        await self.send_text("text_search", words[0][:4])
+        if views:
+            await self.tap("delete", "delete_" + views[0].split("_")[1])
+
+
+class HandlerBenchmark:
+    def __init__(self, modules: dict, db_name: str, api_latency: float):
+        self.modules = modules
+        self.db_name = db_name
+        self.session = modules["FakeSession"](api_latency)
+        self.bot = modules["Bot"](token="42:BENCHMARK", session=self.session)
+        self.storage = modules["SQLiteStorage"](db_name)
+        self.dp = modules["Dispatcher"](storage=self.storage)
+        self.dp.include_router(modules["router"])
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors = 0
+        self._update_id = 0
+
+    def next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    async def feed(self, step: str, payload: dict):
+        update = self.modules["Update"].model_validate(
+            {"update_id": self.next_update_id(), **payload}, context={"bot": self.bot}
+        )
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors += 1
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+
+    async def run(self, users: int, concurrency: int, notes: int, seed: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def simulate(user_id: int):
+            async with semaphore:
+                await UserSimulator(self, user_id, random.Random(seed + user_id)).run(notes)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate(user_id) for user_id in range(1, users + 1)))
+        return time.perf_counter() - started
+
+    async def close(self):
+        await self.storage.close()
+        await self.bot.session.close()
+
+
+def _pool_worker(index: int, queue, results, db_name: str, api_latency: float):
+    """Рабочий процесс режима --workers (цель WorkerPool вместо utils.workers.worker_process)."""
+    asyncio.run(_pool_worker_main(index, queue, results, db_name, api_latency))
+
+
+async def _pool_worker_main(index: int, queue, results, db_name: str, api_latency: float):
+    config.DATABASE_NAME = db_name
+    modules = _load_bot_modules()
+    await modules["open_pool"](db_name)
+    bench = HandlerBenchmark(modules, db_name, api_latency)
+    loop = asyncio.get_running_loop()
+    handling = set()
+
+    async def handle(raw: str):
+        update = modules["Update"].model_validate_json(raw, context={"bot": bench.bot})
+        error = False
+        try:
+            await bench.dp.feed_update(bench.bot, update)
+        except Exception:
+            error = True
+        # Клавиатура ответа нужна симулятору, чтобы выбрать следующую кнопку
+        markup = bench.session.markups.get(update.event.from_user.id)
+        results.put(("update", update.update_id, index, error, markup.model_dump_json() if markup else None))
+
+    results.put(("ready", index))
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            task = asyncio.create_task(handle(raw))
+            handling.add(task)
+            task.add_done_callback(handling.discard)
+        await asyncio.gather(*handling)
+    finally:
+        calls = dict(bench.session.calls)
+        await bench.close()
+        await modules["close_pool"](db_name)
+        results.put(("done", index, calls))
+
+
+class PoolBenchmark(HandlerBenchmark):
+    """Тот же сценарий, но обновления обрабатывают рабочие процессы WorkerPool."""
+
+    def __init__(self, modules: dict, db_name: str, api_latency: float, workers: int):
+        from utils.workers import WorkerPool
+
+        self.modules = modules
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors = 0
+        self._update_id = 0
+        # Клавиатуры и вызовы API приходят из рабочих процессов
+        self.session = SimpleNamespace(markups={}, calls=Counter())
+        self.workers = workers
+        self.results = multiprocessing.get_context("spawn").Queue()
+        self.pool = WorkerPool(workers, target=functools.partial(
+            _pool_worker, results=self.results, db_name=db_name, api_latency=api_latency
+        ))
+        # ID пользователя -> процессы, в которые попали его обновления
+        self.workers_by_user: dict[int, set[int]] = defaultdict(set)
+        self.updates_by_worker: Counter = Counter()
+        self._waiting: dict[int, asyncio.Future] = {}
+        self._ready = 0
+        self._done = 0
+        self._all_ready = asyncio.Event()
+        self._all_done = asyncio.Event()
+        self._collector = None
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while self._done < self.workers:
+            kind, *data = await loop.run_in_executor(None, self.results.get)
+            if kind == "ready":
+                self._ready += 1
+                if self._ready == self.workers:
+                    self._all_ready.set()
+            elif kind == "update":
+                update_id, *result = data
+                self._waiting.pop(update_id).set_result(result)
+            else:
+                self.session.calls.update(data[1])
+                self._done += 1
+        self._all_done.set()
+
+    async def start(self):
+        """Запускает процессы и ждет, пока все будут готовы (время запуска не замеряется)."""
+        self._collector = asyncio.create_task(self._collect())
+        self.pool.start()
+        await self._all_ready.wait()
+
+    async def feed(self, step: str, payload: dict):
+        from aiogram.types import InlineKeyboardMarkup
+
+        update = self.modules["Update"].model_validate({"update_id": self.next_update_id(), **payload})
+        user_id = update.event.from_user.id
+        future = self._waiting[update.update_id] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        self.pool.dispatch_update(update)
+        worker, error, markup = await future
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+        self.errors += error
+        self.workers_by_user[user_id].add(worker)
+        self.updates_by_worker[worker] += 1
+        if markup is not None:
+            self.session.markups[user_id] = InlineKeyboardMarkup.model_validate_json(markup)
+
+    async def close(self):
+        for queue in self.pool.queues:
+            queue.put(None)
+        await self._all_done.wait()
+        await self._collector
+        self.pool.stop()
+
+
+async def run_benchmark(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        config.DATABASE_NAME = db_name
+        modules = _load_bot_modules()
+        await modules["init_db"](db_name)
+        if args.workers:
+            bench = PoolBenchmark(modules, db_name, args.api_latency / 1000, args.workers)
+            await bench.start()
+        else:
+            await modules["open_pool"](db_name)
+            bench = HandlerBenchmark(modules, db_name, args.api_latency / 1000)
+        try:
+            duration = await bench.run(args.users, args.concurrency, args.notes, args.seed)
+        finally:
+            await bench.close()
+            if not args.workers:
+                await modules["close_pool"](db_name)
+
+    all_latencies = [value for values in bench.latencies.values() for value in values]
+    result = {
+        "benchmark": "handlers",
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args) | {"output": None},
+        "updates": len(all_latencies),
+        "errors": bench.errors,
+        "duration_s": round(duration, 3),
+        "updates_per_s": round(len(all_latencies) / duration, 1),
+        "latency": summarize(all_latencies),
+        "latency_by_step": {step: summarize(values) for step, values in sorted(bench.latencies.items())},
+        "api_calls": dict(bench.session.calls),
+    }
+    if args.workers:
+        # Пользователи, чьи обновления обработали разные процессы: их FSM
+        # разошелся бы между кэшами процессов
+        split_users = sum(len(workers) > 1 for workers in bench.workers_by_user.values())
+        result.update(
+            workers=args.workers,
+            cpu_count=os.cpu_count(),
+            split_users=split_users,
+            updates_by_worker={str(index): count for index, count in sorted(bench.updates_by_worker.items())},
+        )
+        result["errors"] += split_users
+    return result
+
+
+def print_report(result: dict):
+    print(f"commit {result['commit']}: {result['updates']} updates in {result['duration_s']} s, "
+          f"{result['updates_per_s']} updates/s, {result['errors']} errors")
+    if "workers" in result:
+        print(f"{result['workers']} worker processes on {result['cpu_count']} CPUs, "
+              f"updates by worker: {result['updates_by_worker']}, users split between workers: {result['split_users']}")
+    print(f"{'step':<15} {'count':>7} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}")
+    for step, stats in [("all", result["latency"]), *result["latency_by_step"].items()]:
+        print(f"{step:<15} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="число пользователей")
+    parser.add_argument("--concurrency", type=int, default=200, help="сколько пользователей действуют одновременно")
+    parser.add_argument("--notes", type=int, default=3, help="заметок, которые добавляет каждый пользователь")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа поддельного API, мс")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="рабочих процессов WorkerPool; 0 -- Dispatcher в этом же процессе")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/handlers-<commit>.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+    output = write_results("handlers", result, args.output)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Микробенчмарк построения клавиатур календаря и выбора времени.
+
+Сравнивает стоимость вызова до кэширования (клавиатура строится заново)
+и после (готовая клавиатура из кэша). Запуск из корня репозитория:
+
+    python -m benchmarks.keyboards
+"""
+import timeit
+from datetime import datetime
+from keyboards.calendar import generate_calendar, _build_calendar
+from keyboards.time import (
+    generate_hours_keyboard,
+    generate_minutes_keyboard,
+    _build_hours_keyboard,
+    _build_minutes_keyboard,
+)
+
+NUMBER = 2000
+
+
+def _per_call(func) -> float:
+    """Лучшее из пяти время одного вызова func, в микросекундах."""
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def main():
+    today = datetime.now().date()
+    cases = (
+        ("calendar", lambda: _build_calendar.__wrapped__(today.year, today.month, today), generate_calendar),
+        ("hours", _build_hours_keyboard, generate_hours_keyboard),
+        ("minutes", _build_minutes_keyboard, generate_minutes_keyboard),
+    )
+    print(f"{'keyboard':<10} {'before, us':>12} {'after, us':>12} {'speedup':>10}")
+    for name, before, after in cases:
+        before_us, after_us = _per_call(before), _per_call(after)
+        print(f"{name:<10} {before_us:>12.2f} {after_us:>12.2f} {before_us / after_us:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""Бенчмарк планировщика напоминаний на больших таблицах заметок.
+
+Для каждого набора параметров во временном файле SQLite создается
+таблица заметок нужного размера с напоминаниями, как их создает
+add_note. Затем ReminderScheduler проходит --horizon секунд по
+виртуальным часам: как и в run(), каждый такт -- это перечитывание окна
+(если пора) и отправка наступивших напоминаний, после чего часы
+переводятся сразу на следующий срок. Сообщения принимает FakeBot.
+
+Для каждого набора выводится длительность такта и перечитывания окна,
+пиковая память процесса, число прочитанных из базы строк и шагов
+виртуальной машины SQLite и опоздание напоминаний (реальное время
+отправки минус запланированное). Каждый набор считается в отдельном
+процессе, чтобы пиковая память не смешивалась. Запуск из корня репозитория:
+
+    python -m benchmarks.reminders --sizes 1000 100000 1000000
+
+С --drain вместо прохода по окну измеряется разбор очереди: в базе
+создаются N заметок разных пользователей, все напоминания которых уже
+наступили (например, бот лежал), и планировщик отправляет их в реальном
+времени, пока очередь не опустеет. FakeBot отвечает через --send-latency
+секунд, как сеть до Telegram. Выводится время разбора и скорость в
+сообщениях в секунду -- с --telegram-limits и без:
+
+    python -m benchmarks.reminders --drain 10000
+    python -m benchmarks.reminders --drain 10000 --telegram-limits
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.common import summarize, git_commit, write_results
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DAY = 24 * 60 * 60
+# Заметки раскладываются по сроку в пределах этого промежутка от текущего момента
+SPREAD_RANGE = 30 * DAY
+# Сколько заметок в среднем у одного пользователя
+NOTES_PER_USER = 30
+# Сколько шагов виртуальной машины SQLite между вызовами счетчика
+VM_STEP_GRANULARITY = 100
+
+SPREADS = {
+    # Сроки равномерно в пределах SPREAD_RANGE
+    "uniform": lambda rng, now: now + rng.randrange(1, SPREAD_RANGE),
+    # Сроки в начале часа, как их обычно выбирают на клавиатуре
+    "hourly": lambda rng, now: now - now % 3600 + 3600 * rng.randrange(1, SPREAD_RANGE // 3600),
+    # Все сроки в пределах одного часа через сутки: напоминания за сутки
+    # наступают всплеском в первый час -- худший случай для окна планировщика
+    "burst": lambda rng, now: now + DAY + rng.randrange(1, 3600),
+}
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss в Linux в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def generate_notes(db_name: str, size: int, spread: str, past_ratio: float, now: int, seed: int):
+    """Заполняет таблицы notes и reminders синтетическими заметками.
+
+    Напоминания создаются по DEFAULT_REMINDER_LEADS, как в add_note; те,
+    чье время отправки уже прошло, считаются отправленными. Триггеры
+    полнотекстового индекса снимаются, чтобы ускорить загрузку: планировщик
+    этим индексом не пользуется.
+    """
+    from config import DEFAULT_REMINDER_LEADS
+
+    rng = random.Random(seed)
+    pick_due = SPREADS[spread]
+    users = max(1, size // NOTES_PER_USER)
+    db = sqlite3.connect(db_name)
+    db.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+    db.executemany(
+        "INSERT INTO categories (id, user_id, name, key) VALUES (?, ?, 'Работа', 'работа')",
+        ((user_id, user_id) for user_id in range(1, users + 1)),
+    )
+
+    def notes():
+        for note_id in range(1, size + 1):
+            if rng.random() < past_ratio:
+                due_at = now - rng.randrange(1, SPREAD_RANGE)
+            else:
+                due_at = pick_due(rng, now)
+            due = datetime.fromtimestamp(due_at)
+            user_id = rng.randrange(1, users + 1)
+            yield (note_id, user_id, f"Заметка {note_id}", "Работа", user_id,
+                   due.strftime("%d-%m-%Y"), due.strftime("%H:%M"), due_at)
+
+    reminders = []
+    cursor = db.cursor()
+    for note in notes():
+        cursor.execute(
+            """INSERT INTO notes (id, user_id, note_text, note_type, category_id, note_date, note_time, due_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", note)
+        note_id, due_at = note[0], note[-1]
+        reminders.extend(
+            (note_id, lead, due_at - lead, now if due_at - lead <= now else None)
+            for lead in DEFAULT_REMINDER_LEADS
+        )
+        if len(reminders) >= 100000:
+            db.executemany("INSERT INTO reminders (note_id, lead, fire_at, sent_at) VALUES (?, ?, ?, ?)", reminders)
+            reminders.clear()
+    db.executemany("INSERT INTO reminders (note_id, lead, fire_at, sent_at) VALUES (?, ?, ?, ?)", reminders)
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+
+def generate_backlog(db_name: str, size: int, now: int):
+    """Создает size заметок с наступившими, но не отправленными напоминаниями.
+
+    У каждой заметки свой пользователь, чтобы разбор очереди упирался в
+    общий лимит Telegram, а не в лимит одного чата. У заметки одно
+    напоминание с наименьшим упреждением из DEFAULT_REMINDER_LEADS, и срок
+    заметки выбран так, что оно уже наступило: по каждой заметке
+    отправляется ровно одно сообщение.
+    """
+    from config import DEFAULT_REMINDER_LEADS
+
+    lead = min(DEFAULT_REMINDER_LEADS)
+    due_at = now + lead // 2
+    due = datetime.fromtimestamp(due_at)
+    db = sqlite3.connect(db_name)
+    db.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+    db.executemany(
+        "INSERT INTO categories (id, user_id, name, key) VALUES (?, ?, 'Работа', 'работа')",
+        ((user_id, user_id) for user_id in range(1, size + 1)),
+    )
+    db.executemany(
+        """INSERT INTO notes (id, user_id, note_text, note_type, category_id, note_date, note_time, due_at)
+           VALUES (?, ?, ?, 'Работа', ?, ?, ?, ?)""",
+        ((note_id, note_id, f"Заметка {note_id}", note_id, due.strftime("%d-%m-%Y"), due.strftime("%H:%M"), due_at)
+         for note_id in range(1, size + 1)),
+    )
+    db.executemany(
+        "INSERT INTO reminders (note_id, lead, fire_at) VALUES (?, ?, ?)",
+        ((note_id, lead, due_at - lead) for note_id in range(1, size + 1)),
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+
+class FakeBot:
+    """Принимает сообщения планировщика вместо Telegram; latency -- время ответа в секундах."""
+
+    def __init__(self, latency: float = 0.0):
+        self.sent = 0
+        self.latency = latency
+
+    async def send_message(self, chat_id: int, text: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+async def _run_scheduler(db_name: str, now: int, horizon: int, telegram_limits: bool) -> dict:
+    import database
+    from utils.scheduler import ReminderScheduler
+    from utils.rate_limit import SendRateLimiter
+
+    pool = await database.open_pool(db_name)
+    vm_steps = 0
+
+    def count_steps():
+        nonlocal vm_steps
+        vm_steps += VM_STEP_GRANULARITY
+
+    for db in pool._connections:
+        await db.set_progress_handler(count_steps, VM_STEP_GRANULARITY)
+
+    bot = FakeBot()
+    scheduler = ReminderScheduler(bot, db_name)
+    if not telegram_limits:
+        scheduler._limiter = SendRateLimiter(global_rate=1e9, chat_rate=1e9)
+
+    rows_read = 0
+    refill = scheduler._refill
+    refill_ms: list[float] = []
+
+    async def timed_refill(at: int):
+        nonlocal rows_read
+        started = time.perf_counter()
+        await refill(at)
+        refill_ms.append((time.perf_counter() - started) * 1000)
+        rows_read += len(scheduler._pending)
+
+    scheduler._refill = timed_refill
+
+    # Опоздание: сколько прошло от запланированного времени до отправки,
+    # где "сейчас" -- виртуальное время такта плюс реальное время с его начала
+    lateness: list[float] = []
+    tick_started = 0.0
+    deliver = scheduler._deliver
+
+    async def timed_deliver(note_id, reminders, at, done):
+        fire_at = min(reminders, key=lambda r: r["lead"])["fire_at"]
+        delivered = await deliver(note_id, reminders, at, done)
+        if delivered:
+            lateness.append(at - fire_at + time.perf_counter() - tick_started)
+        return delivered
+
+    scheduler._deliver = timed_deliver
+
+    tick_ms: list[float] = []
+    clock = now
+    try:
+        while clock < now + horizon:
+            tick_started = time.perf_counter()
+            if clock >= scheduler._refill_at:
+                await scheduler._refill(clock)
+            await scheduler._fire_due(clock)
+            tick_ms.append((time.perf_counter() - tick_started) * 1000)
+            heap = scheduler._heap
+            next_at = min(heap[0][0], scheduler._refill_at) if heap else scheduler._refill_at
+            clock = max(next_at, clock + 1)
+
+        async with database._connect(db_name) as db:
+            cursor = await db.execute(
+                """EXPLAIN QUERY PLAN
+                   SELECT r.id FROM reminders r JOIN notes n ON n.id = r.note_id
+                   WHERE r.sent_at IS NULL AND r.fire_at <= ? ORDER BY r.fire_at LIMIT ?""",
+                (now, 1))
+            plan = [row["detail"] for row in await cursor.fetchall()]
+            await cursor.close()
+    finally:
+        await database.close_pool(db_name)
+
+    return {
+        "ticks": len(tick_ms),
+        "tick": summarize(tick_ms),
+        "refills": len(refill_ms),
+        "refill": summarize(refill_ms),
+        "rows_read": rows_read,
+        "vm_steps": vm_steps,
+        "sent": bot.sent,
+        "lateness": summarize(lateness, unit="s"),
+        "refill_query_plan": plan,
+    }
+
+
+async def _run_drain(db_name: str, size: int, send_latency: float, telegram_limits: bool) -> dict:
+    """Отправляет очередь наступивших напоминаний в реальном времени, как run()."""
+    import database
+    from utils.scheduler import ReminderScheduler
+    from utils.rate_limit import SendRateLimiter
+
+    await database.open_pool(db_name)
+    bot = FakeBot(send_latency)
+    scheduler = ReminderScheduler(bot, db_name)
+    if not telegram_limits:
+        scheduler._limiter = SendRateLimiter(global_rate=1e9, chat_rate=1e9)
+
+    # Сколько прошло от начала разбора до отправки каждого сообщения
+    waited: list[float] = []
+    deliver = scheduler._deliver
+
+    async def timed_deliver(note_id, reminders, at, done):
+        delivered = await deliver(note_id, reminders, at, done)
+        if delivered:
+            waited.append(time.perf_counter() - started)
+        return delivered
+
+    scheduler._deliver = timed_deliver
+
+    started = time.perf_counter()
+    batches = 0
+    try:
+        while bot.sent < size:
+            now = int(time.time())
+            if now >= scheduler._refill_at:
+                await scheduler._refill(now)
+            if not scheduler._heap:
+                break
+            await scheduler._fire_due(now)
+            batches += 1
+        drain_s = time.perf_counter() - started
+        async with database._connect(db_name) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM reminders WHERE sent_at IS NULL")
+            (unsent,) = await cursor.fetchone()
+            await cursor.close()
+    finally:
+        await database.close_pool(db_name)
+
+    return {
+        "sent": bot.sent,
+        "unsent_reminders": unsent,
+        "batches": batches,
+        "drain_s": round(drain_s, 2),
+        "rate_per_s": round(bot.sent / drain_s, 1) if drain_s else None,
+        "waited": summarize(waited, unit="s"),
+    }
+
+
+def run_case(case: dict) -> dict:
+    """Считает один набор параметров; вызывается в отдельном процессе."""
+    import database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "reminders.db")
+        asyncio.run(database.init_db(db_name))
+        now = int(time.time())
+        started = time.perf_counter()
+        if case["scenario"] == "drain":
+            generate_backlog(db_name, case["size"], now)
+        else:
+            generate_notes(db_name, case["size"], case["spread"], case["past_ratio"], now, case["seed"])
+        generated_s = time.perf_counter() - started
+        if case["scenario"] == "drain":
+            result = asyncio.run(_run_drain(db_name, case["size"], case["send_latency"], case["telegram_limits"]))
+        else:
+            result = asyncio.run(_run_scheduler(db_name, now, case["horizon"], case["telegram_limits"]))
+    return {**case, "generate_s": round(generated_s, 1), **result, "peak_rss_mb": peak_rss_mb()}
+
+
+def print_drain_row(result: dict):
+    print(f"{result['size']:>8} {result['send_latency']:>8} {str(result['telegram_limits']):>7} "
+          f"{result['sent']:>7} {result['unsent_reminders']:>7} {result['batches']:>7} "
+          f"{result['drain_s']:>8.1f} {result['rate_per_s'] or 0:>8.1f} {result['waited']['p99_s']:>8.1f}")
+
+
+def print_window_row(result: dict):
+    print(f"{result['size']:>8} {result['spread']:>8} {result['past_ratio']:>5} "
+          f"{result['ticks']:>6} {result['tick']['p50_ms']:>8.2f} {result['tick']['p99_ms']:>8.2f} "
+          f"{result['refill']['p99_ms']:>9.2f} {result['rows_read']:>9} {result['sent']:>7} "
+          f"{result['lateness']['p99_s']:>8.3f} {result['peak_rss_mb'] or 0:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="число заметок в таблице")
+    parser.add_argument("--spreads", nargs="+", choices=sorted(SPREADS), default=sorted(SPREADS),
+                        help="распределение сроков будущих заметок")
+    parser.add_argument("--past-ratios", type=float, nargs="+", default=[0.5],
+                        help="доля заметок с прошедшим сроком")
+    parser.add_argument("--horizon", type=int, default=DAY, help="сколько секунд виртуального времени прогонять")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="соблюдать лимиты Telegram на отправку (медленно на больших всплесках)")
+    parser.add_argument("--drain", type=int, nargs="+", metavar="N",
+                        help="вместо прохода по окну измерить разбор очереди из N наступивших напоминаний")
+    parser.add_argument("--send-latency", type=float, default=0.05,
+                        help="время ответа FakeBot на одно сообщение в режиме --drain, в секундах")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/reminders-<commit>.json)")
+    args = parser.parse_args()
+
+    if args.drain:
+        cases = [
+            {"scenario": "drain", "size": size, "send_latency": args.send_latency,
+             "telegram_limits": args.telegram_limits}
+            for size in args.drain
+        ]
+        print(f"{'backlog':>8} {'latency':>8} {'limits':>7} {'sent':>7} {'unsent':>7} {'batches':>7} "
+              f"{'drain, s':>8} {'msg/s':>8} {'wait p99':>8}")
+        print_row = print_drain_row
+    else:
+        cases = [
+            {"scenario": "window", "size": size, "spread": spread, "past_ratio": past_ratio,
+             "horizon": args.horizon, "telegram_limits": args.telegram_limits, "seed": args.seed}
+            for size in args.sizes for spread in args.spreads for past_ratio in args.past_ratios
+        ]
+        print(f"{'notes':>8} {'spread':>8} {'past':>5} {'ticks':>6} {'tick p50':>8} {'tick p99':>8} "
+              f"{'refill p99':>9} {'rows read':>9} {'sent':>7} {'late p99':>8} {'RSS, MB':>7}")
+        print_row = print_window_row
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (case,))
+        print_row(result)
+        results.append(result)
+
+    output = write_results("reminders", {
+        "benchmark": "reminders",
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "cases": results,
+    }, args.output)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
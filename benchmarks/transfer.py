@@ -0,0 +1,171 @@
+"""Бенчмарк выгрузки и загрузки заметок файлом (/export и /import).
+
+Создает файлы CSV и iCalendar с --events заметками и загружает их во
+временную базу SQLite:
+
+- per_row: как по одной через мастер добавления -- add_note и фиксация
+  транзакции на каждую заметку; выполняется для первых --per-row заметок,
+  полное время пересчитывается по скорости;
+- import_csv, import_ics: import_notes с NoteReader, пачками по --chunk-size.
+
+Затем загруженные заметки выгружаются обратно (export_csv, export_ics)
+из курсора без отправки в Telegram. Для каждого режима выводится время,
+заметок в секунду и наибольшая задержка цикла событий (насколько позже
+положенного просыпалась задача, которая каждые 10 мс вызывает
+asyncio.sleep), а с --memory -- пик памяти Python (tracemalloc),
+который при потоковом чтении и записи не должен расти с размером файла.
+tracemalloc замедляет код в несколько раз, поэтому время с --memory с
+обычными замерами не сравнивается. Запуск из корня репозитория:
+
+    python -m benchmarks.transfer --events 50000
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.common import git_commit, probe_loop_lag, summarize, write_results
+
+USER_ID = 1
+MODES = ["per_row", "import_csv", "import_ics", "export_csv", "export_ics"]
+
+
+def make_files(directory: str, count: int) -> dict[str, str]:
+    """Пишет файлы с count заметками на ближайший год; возвращает пути по формату."""
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    paths = {"csv": os.path.join(directory, "notes.csv"), "ics": os.path.join(directory, "notes.ics")}
+    with open(paths["csv"], "w", encoding="utf-8", newline="") as csv_file, \
+            open(paths["ics"], "w", encoding="utf-8", newline="") as ics_file:
+        csv_file.write("date,time,category,text\r\n")
+        ics_file.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//benchmark//RU\r\n")
+        for index in range(count):
+            due = start + timedelta(minutes=10 * index)
+            category = f"Категория {index % 20}"
+            csv_file.write(f'{due:%d-%m-%Y},{due:%H:%M},{category},"Заметка {index}, из файла"\r\n')
+            ics_file.write(
+                f"BEGIN:VEVENT\r\nUID:bench{index}@example.com\r\nDTSTART:{due:%Y%m%dT%H%M%S}\r\n"
+                f"SUMMARY:Заметка {index}\\, из файла\r\nCATEGORIES:{category}\r\nEND:VEVENT\r\n"
+            )
+        ics_file.write("END:VCALENDAR\r\n")
+    return paths
+
+
+async def run_per_row(db_name: str, path: str, limit: int) -> int:
+    from database import add_note
+    from utils.transfer import NoteReader
+
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        for count, note in enumerate(NoteReader(stream, "csv"), 1):
+            await add_note(db_name, USER_ID, note["note_text"], note["note_type"], note["note_date"], note["note_time"])
+            if count >= limit:
+                return count
+    return count
+
+
+async def run_import(db_name: str, path: str, fmt: str, chunk_size: int) -> int:
+    from database import import_notes
+    from utils.transfer import NoteReader
+
+    with open(path, "rb") as data:
+        reader = NoteReader(io.TextIOWrapper(data, encoding="utf-8-sig", newline=""), fmt)
+        imported = await import_notes(db_name, USER_ID, reader, chunk_size)
+    if reader.error or reader.skipped:
+        raise RuntimeError(f"Файл {path} прочитан с ошибками: {reader.error}, пропущено {reader.skipped}")
+    return imported
+
+
+async def run_export(db_name: str, fmt: str) -> int:
+    from utils.transfer import export_chunks
+
+    size = 0
+    async for chunk in export_chunks(USER_ID, fmt, db_name):
+        size += len(chunk)
+    return size
+
+
+async def run_mode(mode: str, args, paths: dict[str, str], directory: str) -> dict:
+    from database import init_db, open_pool, close_pool
+
+    # Выгрузка читает базу, заполненную загрузкой того же формата
+    db_name = os.path.join(directory, f"{mode.replace('export', 'import')}.db")
+    if not mode.startswith("export"):
+        await init_db(db_name)
+    await open_pool(db_name)
+    if args.memory:
+        tracemalloc.start()
+    lags: list[float] = []
+    probe = asyncio.create_task(probe_loop_lag(lags))
+    started = time.perf_counter()
+    result = {"mode": mode}
+    try:
+        if mode == "per_row":
+            notes = await run_per_row(db_name, paths["csv"], args.per_row)
+        elif mode.startswith("import"):
+            notes = await run_import(db_name, paths[mode[-3:]], mode[-3:], args.chunk_size)
+        else:
+            result["bytes"] = await run_export(db_name, mode[-3:])
+            notes = args.events
+        duration = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        probe.cancel()
+        if args.memory:
+            tracemalloc.stop()
+        await close_pool(db_name)
+    result.update(
+        notes=notes,
+        duration_s=round(duration, 3),
+        notes_per_s=round(notes / duration, 1),
+        # Время на все --events заметок при той же скорости
+        full_duration_s=round(duration * args.events / notes, 1),
+        peak_python_mb=round(peak / 1024 / 1024, 1) if args.memory else None,
+        loop_lag=summarize(lags),
+    )
+    return result
+
+
+async def run_benchmark(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_files(directory, args.events)
+        sizes = {fmt: os.path.getsize(path) for fmt, path in paths.items()}
+        modes = [await run_mode(mode, args, paths, directory) for mode in args.modes]
+    return {
+        "benchmark": "transfer",
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args) | {"output": None},
+        "file_bytes": sizes,
+        "modes": modes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=50000, help="заметок в файле")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="заметок в одной транзакции загрузки")
+    parser.add_argument("--per-row", type=int, default=2000, help="заметок, загружаемых по одной в режиме per_row")
+    parser.add_argument("--memory", action="store_true", help="замерить пик памяти (медленнее)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/transfer-<commit>.json)")
+    args = parser.parse_args()
+    if any(mode.startswith("export") for mode in args.modes):
+        # Выгрузке нужна база, заполненная загрузкой того же формата
+        args.modes = sorted(set(args.modes) | {m.replace("export", "import") for m in args.modes if m.startswith("export")},
+                            key=MODES.index)
+
+    result = asyncio.run(run_benchmark(args))
+    print(f"{'mode':<11} {'notes':>7} {'time, s':>8} {'notes/s':>9} {'full, s':>8} {'peak, MB':>9} "
+          f"{'lag max, ms':>11}")
+    for mode in result["modes"]:
+        print(f"{mode['mode']:<11} {mode['notes']:>7} {mode['duration_s']:>8} {mode['notes_per_s']:>9} "
+              f"{mode['full_duration_s']:>8} {mode['peak_python_mb'] or '-':>9} {mode['loop_lag']['max_ms']:>11.1f}")
+    output = write_results("transfer", result, args.output)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,106 @@
 import asyncio
 import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN, DATABASE_NAME
-from database import init_db
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    BOT_TOKEN,
+    DATABASE_NAME,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBAPP_KEEPALIVE_TIMEOUT,
+    BOT_WORKERS,
+    METRICS_HOST,
+    METRICS_PORT,
+    GOOGLE_CALENDAR_ENABLED,
+    ARCHIVE_AFTER_DAYS,
+)
+from database import init_db, open_pool, close_pool
 from handlers import router
 from utils.scheduler import check_reminders
+from utils.fsm_storage import SQLiteStorage
+from utils.workers import run_workers
+from utils.metrics_server import start_metrics_server
+from utils.log import setup_logging
+from utils.google_calendar import close_calendar_client
+from utils.calendar_sync import run_calendar_sync
+from utils.archive import run_archiver
+from utils.digest import run_digests
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Получает обновления long polling'ом (режим для разработки)."""
+    await bot.delete_webhook()
+    await dp.start_polling(bot)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Принимает обновления от Telegram на HTTP-сервере aiohttp."""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    # Без WEBHOOK_URL сервер можно проверять локально, отправляя на него
+    # сохраненные Update в JSON, не регистрируя вебхук в Telegram
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET
+        )
+
+    runner = web.AppRunner(app, keepalive_timeout=WEBAPP_KEEPALIVE_TIMEOUT)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logging.info(f"Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 
 async def main():
     await init_db(DATABASE_NAME)
+    await open_pool(DATABASE_NAME)
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    storage = SQLiteStorage(DATABASE_NAME)
+    dp = Dispatcher(storage=storage)
     dp.include_router(router)
 
     asyncio.create_task(check_reminders(bot))
-    await dp.start_polling(bot)
+    asyncio.create_task(run_digests(bot))
+    if GOOGLE_CALENDAR_ENABLED:
+        asyncio.create_task(run_calendar_sync())
+    if ARCHIVE_AFTER_DAYS:
+        asyncio.create_task(run_archiver())
+    metrics = None
+    if METRICS_PORT:
+        metrics = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        if metrics is not None:
+            await metrics.cleanup()
+        await close_calendar_client()
+        await storage.close()
+        await close_pool(DATABASE_NAME)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+    log_listener = setup_logging()
     try:
-        asyncio.run(main())
+        if BOT_WORKERS > 1:
+            run_workers(BOT_WORKERS)
+        else:
+            asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        logging.info("Bot stopped")
\ No newline at end of file
+        logging.info("Bot stopped")
+    finally:
+        log_listener.stop()
\ No newline at end of file
@@ -1,2 +1,60 @@
 BOT_TOKEN = "your_token"
-DATABASE_NAME = "notes.db"
\ No newline at end of file
+DATABASE_NAME = "notes.db"
+DB_POOL_SIZE = 4  # количество долгоживущих соединений с базой
+DB_STATEMENT_CACHE_SIZE = 128  # размер кэша подготовленных выражений на соединение
+SLOW_QUERY_MS = 100  # выражения SQL дольше этого попадают в лог с текстом и параметрами; 0 -- не записывать
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"  # "text" или "json" (одна запись -- один объект JSON)
+DEFAULT_REMINDER_LEADS = (24 * 60 * 60, 60 * 60)  # напоминания новой заметки: за сутки и за час
+TELEGRAM_GLOBAL_RATE = 30  # сообщений в секунду на всех пользователей (лимит Telegram)
+TELEGRAM_CHAT_RATE = 1  # сообщений в секунду в один чат
+REMINDER_SEND_CONCURRENCY = 20  # одновременных запросов на отправку напоминаний
+
+BOT_MODE = "polling"  # "polling" для разработки или "webhook" для продакшена
+WEBHOOK_URL = ""  # внешний адрес, например "https://bot.example.com"; пустой -- вебхук не регистрируется
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = "change_me"  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = "0.0.0.0"
+WEBAPP_PORT = 8080
+WEBAPP_KEEPALIVE_TIMEOUT = 75  # секунд; Telegram переиспользует соединения
+FSM_CACHE_SIZE = 10000  # состояний FSM, которые держатся в памяти
+FSM_FLUSH_INTERVAL = 1.0  # секунд между записями изменений FSM в базу
+
+BOT_WORKERS = 1  # рабочих процессов; больше 1 -- обновления делятся между ними по user_id
+LEADER_LEASE_TTL = 30  # секунд, через которые аренда лидера-планировщика истекает без продления
+LEADER_RENEW_INTERVAL = 10  # секунд между продлениями аренды
+METRICS_HOST = "127.0.0.1"  # адрес HTTP-сервера метрик Prometheus (/metrics)
+METRICS_PORT = 9100  # 0 -- не запускать; в многопроцессном режиме процесс i слушает METRICS_PORT + i
+REMINDER_REFRESH_INTERVAL = 5  # секунд между перечитываниями окна напоминаний в многопроцессном режиме
+CATEGORY_CACHE_SIZE = 10000  # пользователей, чьи списки категорий держатся в памяти
+CATEGORY_CACHE_TTL = 60  # секунд, после которых список категорий пользователя перечитывается из базы
+NOTE_CACHE_SIZE = 10000  # пользователей, чьи прочитанные заметки держатся в памяти
+NOTE_CACHE_TTL = 60  # секунд, после которых кэш заметок пользователя перечитывается из базы
+GOOGLE_CALENDAR_ENABLED = False  # True -- кнопка синхронизации добавляет событие в Google Календарь (нужен token.pickle)
+GOOGLE_TOKEN_FILE = "token.pickle"  # учетные данные Google, полученные по инструкции в wiki
+GOOGLE_API_ROOT = "https://www.googleapis.com/"  # для проверки на локальном поддельном сервере -- его адрес
+GOOGLE_CALENDAR_THREADS = 4  # потоков для синхронных вызовов библиотеки Google
+GOOGLE_CALENDAR_BATCH_SIZE = 50  # событий в одном пакетном запросе (не больше 50)
+GOOGLE_CALENDAR_BATCH_DELAY = 0.05  # секунд, в течение которых вставки собираются в один пакет
+GOOGLE_CALENDAR_TIMEZONE = "Europe/Moscow"
+CALENDAR_SYNC_BATCH = 200  # изменений заметок, которые читаются из очереди и отправляются за один проход
+CALENDAR_SYNC_POLL_INTERVAL = 5  # секунд между проверками очереди, если о новых изменениях не сообщили
+CALENDAR_SYNC_RETRY_BASE = 5  # секунд до первого повтора неудачной отправки; дальше интервал удваивается
+CALENDAR_SYNC_RETRY_MAX = 3600  # наибольший интервал между повторами, секунд
+CALENDAR_PULL_INTERVAL = 60  # секунд между загрузками изменений из календаря пользователя
+CALENDAR_PULL_BATCH = 50  # календарей, изменения которых загружаются за один проход
+CALENDAR_IMPORT_CATEGORY = "Google Календарь"  # категория заметок из событий, созданных в календаре
+EXPORT_FETCH_SIZE = 500  # заметок, которые читаются из курсора базы за раз при выгрузке
+IMPORT_CHUNK_SIZE = 1000  # заметок, которые добавляются одной транзакцией при загрузке из файла
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024  # байт; больше Bot API ботам файлы не отдает
+IMPORT_CATEGORY = "Импорт"  # категория заметок из файла, в котором категория не указана
+RECURRENCE_LIST_DAYS = 30  # на сколько дней вперед повторяющиеся заметки раскрываются в списке заметок
+ARCHIVE_AFTER_DAYS = 30  # дней после срока, через которые заметка уходит в архив; 0 -- не архивировать
+ARCHIVE_BATCH = 500  # заметок, которые переносятся в архив одной транзакцией
+ARCHIVE_BATCH_PAUSE = 0.5  # секунд между транзакциями архивации, чтобы не задерживать запись обработчиков
+ARCHIVE_INTERVAL = 3600  # секунд между запусками архивации
+ARCHIVE_VACUUM_PAGES = 1000  # свободных страниц файла базы, которые возвращаются ОС за один шаг (нужен auto_vacuum = INCREMENTAL, см. README)
+DIGEST_TIMES = ("06:00", "07:00", "08:00", "09:00", "10:00", "11:00")  # варианты времени ежедневной сводки
+DIGEST_REPLACES_LEAD = 24 * 60 * 60  # упреждение напоминаний, которые не отправляются пользователям со сводкой
+DIGEST_POLL_INTERVAL = 60  # секунд между проверками, не пора ли отправить сводки
+DIGEST_BATCH = 500  # сводок, которые считаются одним запросом и отправляются за один проход
@@ -1,16 +1,552 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from itertools import islice
+from datetime import date, datetime, timedelta
+
 import aiosqlite
-from datetime import datetime
+
+from config import (
+    DB_POOL_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+    DEFAULT_REMINDER_LEADS,
+    SLOW_QUERY_MS,
+    EXPORT_FETCH_SIZE,
+    IMPORT_CHUNK_SIZE,
+    RECURRENCE_LIST_DAYS,
+)
+from utils.metrics import timed_query
+from utils.google_calendar import EVENT_ID_PREFIX
+from utils.recurrence import next_occurrence, occurrences, parse_rule, series_end
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(__name__ + ".slow_query")
+
+# Настройки, применяемые к каждому соединению пула
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с базой данных.
+
+    Соединения открываются один раз при старте бота, а не на каждый запрос.
+    sqlite3 кэширует подготовленные выражения внутри соединения, поэтому
+    повторные запросы не разбираются заново.
+    """
+
+    def __init__(self, db_name: str, size: int = DB_POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._connections: list[aiosqlite.Connection] = []
+
+    async def open(self) -> "ConnectionPool":
+        for _ in range(self.size):
+            db = await aiosqlite.connect(
+                self.db_name, cached_statements=DB_STATEMENT_CACHE_SIZE
+            )
+            db.row_factory = aiosqlite.Row
+            for pragma in PRAGMAS:
+                await db.execute(pragma)
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+        return self
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Выдает свободное соединение и возвращает его в пул после использования."""
+        db = await self._idle.get()
+        try:
+            yield db
+        except BaseException:
+            # Незавершенная транзакция не должна достаться следующему запросу
+            await db.rollback()
+            raise
+        finally:
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+
+
+_pools: dict[str, ConnectionPool] = {}
+
+
+async def open_pool(db_name: str, size: int = DB_POOL_SIZE) -> ConnectionPool:
+    """Открывает пул соединений для базы; вызывается один раз после init_db."""
+    if db_name not in _pools:
+        _pools[db_name] = await ConnectionPool(db_name, size).open()
+    return _pools[db_name]
+
+
+async def close_pool(db_name: str):
+    """Закрывает пул соединений базы, если он был открыт."""
+    pool = _pools.pop(db_name, None)
+    if pool is not None:
+        await pool.close()
+
+
+class SlowQueryLog:
+    """Обертка соединения, которая пишет в лог выражения дольше threshold_ms.
+
+    В запись попадают текст SQL, параметры и время выполнения execute
+    (для SELECT -- до первой строки результата). Остальные атрибуты
+    берутся у исходного соединения.
+    """
+
+    def __init__(self, db: aiosqlite.Connection, threshold_ms: float):
+        self._db = db
+        self._threshold = threshold_ms / 1000
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def _check(self, started: float, sql: str, params):
+        duration = time.perf_counter() - started
+        if duration >= self._threshold:
+            slow_query_logger.warning("Медленный запрос", extra={
+                "duration_ms": round(duration * 1000, 1),
+                "sql": " ".join(sql.split()),
+                "params": params,
+            })
+
+    async def execute(self, sql: str, parameters=None):
+        started = time.perf_counter()
+        cursor = await self._db.execute(sql, parameters)
+        self._check(started, sql, parameters)
+        return cursor
+
+    async def executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        cursor = await self._db.executemany(sql, parameters)
+        # Для пачки в лог идут число строк и первая из них
+        self._check(started, sql, {"rows": len(parameters), "first": parameters[0] if parameters else None})
+        return cursor
+
+
+@asynccontextmanager
+async def _connect(db_name: str):
+    """Соединение из пула, а если пул не открыт -- временное соединение."""
+    pool = _pools.get(db_name)
+    if pool is not None:
+        async with pool.acquire() as db:
+            yield SlowQueryLog(db, SLOW_QUERY_MS) if SLOW_QUERY_MS else db
+        return
+    async with aiosqlite.connect(db_name) as db:
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA foreign_keys = ON")
+        yield SlowQueryLog(db, SLOW_QUERY_MS) if SLOW_QUERY_MS else db
+
+
+# Подписчики на изменения заметок (например, планировщик напоминаний).
+# Вызываются после фиксации транзакции как listener(event, note),
+# где event -- "add", "edit", "delete", "reminders", "calendar" или "import"
+# (пачка заметок из файла: {"user_id", "count"}, без самих заметок).
+_note_listeners: list = []
+
+
+def add_note_listener(listener):
+    """Подписывает listener на добавление, изменение и удаление заметок."""
+    _note_listeners.append(listener)
+
+
+def remove_note_listener(listener):
+    if listener in _note_listeners:
+        _note_listeners.remove(listener)
+
+
+def _notify(event: str, note: dict):
+    for listener in _note_listeners:
+        listener(event, note)
+
+
+DATE_FORMAT = "%d-%m-%Y"
+TIME_FORMAT = "%H:%M"
+
+
+def note_start(note_date: str, note_time: str) -> datetime:
+    """Срок заметки по дате (DD-MM-YYYY) и времени (HH:MM), без часового пояса.
+
+    Строки разбираются вручную: datetime.strptime в несколько раз медленнее,
+    а при загрузке заметок из файла вызывается для каждой строки.
+    """
+    day, month, year = note_date.split("-")
+    hour, minute = note_time.split(":")
+    return datetime(int(year), int(month), int(day), int(hour), int(minute))
+
+
+def to_due_at(note_date: str, note_time: str) -> int:
+    """Переводит дату (DD-MM-YYYY) и время (HH:MM) заметки в epoch UTC."""
+    return int(note_start(note_date, note_time).timestamp())
+
+
+# Повторяющаяся заметка (серия) хранится одной строкой: note_date, note_time
+# и due_at -- первое повторение, rrule -- правило, until_at -- срок последнего
+# повторения (NULL, если серия бесконечна). Отдельные повторения в базе не
+# хранятся и вычисляются только для нужного окна времени.
+
+def _series_bounds(note_date: str, note_time: str, rrule: str | None) -> tuple[str | None, int | None]:
+    """Нормализованное правило и until_at серии; для однократной заметки (None, None).
+
+    Raises:
+        RecurrenceError: правило не разобрано или не поддерживается.
+    """
+    if not rrule:
+        return None, None
+    rule = parse_rule(rrule)
+    end = series_end(note_start(note_date, note_time), rule)
+    return str(rule), None if end is None else int(end.timestamp())
+
+
+def _series(note) -> tuple:
+    """Первый срок, правило и последний срок серии для функций utils.recurrence."""
+    end = None if note["until_at"] is None else datetime.fromtimestamp(note["until_at"])
+    return note_start(note["note_date"], note["note_time"]), parse_rule(note["rrule"]), end
+
+
+def _occurrence(note, moment: datetime) -> dict:
+    """Повторение серии в виде заметки со своими датой, временем и сроком."""
+    return {**dict(note), "note_date": moment.strftime(DATE_FORMAT), "note_time": moment.strftime(TIME_FORMAT),
+            "due_at": int(moment.timestamp())}
+
+
+def _series_occurrences(note, since: float, until: float) -> list[dict]:
+    """Повторения серии со сроком в [since, until).
+
+    Периоды до since пропускаются арифметикой, поэтому стоимость зависит
+    от ширины окна, а не от того, как далеко оно от начала серии.
+    """
+    start, rule, end = _series(note)
+    moments = occurrences(start, rule, datetime.fromtimestamp(since), datetime.fromtimestamp(until - 1), end)
+    return [_occurrence(note, moment) for moment in moments]
+
+
+def _next_due(note, after: float) -> int | None:
+    """Срок первого повторения серии позже after, epoch UTC; None -- серия закончилась."""
+    start, rule, end = _series(note)
+    moment = next_occurrence(start, rule, datetime.fromtimestamp(after), end)
+    return None if moment is None else int(moment.timestamp())
+
+
+async def _migrate_due_at(db: aiosqlite.Connection):
+    """v1: сортируемый столбец due_at и составные индексы."""
+    await db.execute("ALTER TABLE notes ADD COLUMN due_at INTEGER")
+    # Модификатор 'utc' считает исходное значение локальным временем,
+    # как и datetime.timestamp() в to_due_at
+    await db.execute('''
+        UPDATE notes SET due_at = CAST(strftime('%s',
+            substr(note_date, 7, 4) || '-' || substr(note_date, 4, 2) || '-' ||
+            substr(note_date, 1, 2) || ' ' || note_time, 'utc') AS INTEGER)
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_due ON notes (user_id, due_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_type ON notes (user_id, note_type, due_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_due ON notes (due_at)")
+
+
+async def _migrate_reminders(db: aiosqlite.Connection):
+    """v2: таблица напоминаний с произвольным упреждением."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+            lead INTEGER NOT NULL, -- За сколько секунд до срока напомнить
+            fire_at INTEGER NOT NULL, -- Время отправки, epoch UTC
+            sent_at INTEGER -- NULL: не отправлено
+        )
+    ''')
+    # Частичный индекс содержит только неотправленные напоминания,
+    # поэтому прошедшие заметки не замедляют выборку планировщика
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders (fire_at) WHERE sent_at IS NULL")
+    await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_note ON reminders (note_id, lead)")
+    # Переносим неотправленные напоминания будущих заметок из флагов notes
+    for column, lead in (("reminder_24h_sent", 24 * 60 * 60), ("reminder_1h_sent", 60 * 60)):
+        await db.execute(f'''
+            INSERT INTO reminders (note_id, lead, fire_at)
+            SELECT id, ?, due_at - ? FROM notes
+            WHERE due_at > CAST(strftime('%s', 'now') AS INTEGER) AND {column} = 0
+        ''', (lead, lead))
+
+
+async def _migrate_fsm_storage(db: aiosqlite.Connection):
+    """v3: хранилище состояний FSM (незаконченные черновики заметок)."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}' -- JSON
+        ) WITHOUT ROWID
+    ''')
+
+
+async def _migrate_leases(db: aiosqlite.Connection):
+    """v4: аренды для выбора единственного исполнителя фоновых задач."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL -- epoch UTC
+        ) WITHOUT ROWID
+    ''')
+
+
+async def _migrate_fulltext(db: aiosqlite.Connection):
+    """v5: полнотекстовый поиск по тексту заметок (FTS5)."""
+    # Владелец индексируется как отдельный токен "u<user_id>", чтобы поиск
+    # сразу ограничивался заметками пользователя. Буква ё приводится к е
+    # (длина строки при этом не меняется, см. _restore_highlight).
+    await db.execute('''
+        CREATE VIEW IF NOT EXISTS notes_fts_source AS
+        SELECT id, replace(replace(note_text, 'ё', 'е'), 'Ё', 'Е') AS note_text, 'u' || user_id AS owner
+        FROM notes
+    ''')
+    await db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            note_text, owner,
+            content='notes_fts_source', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    fts_row = "{0}.id, replace(replace({0}.note_text, 'ё', 'е'), 'Ё', 'Е'), 'u' || {0}.user_id"
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, note_text, owner) VALUES ({fts_row.format("new")});
+        END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, note_text, owner) VALUES ('delete', {fts_row.format("old")});
+        END
+    ''')
+    await db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF note_text, user_id ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, note_text, owner) VALUES ('delete', {fts_row.format("old")});
+            INSERT INTO notes_fts (rowid, note_text, owner) VALUES ({fts_row.format("new")});
+        END
+    ''')
+    await db.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+
+def category_name(name: str) -> str:
+    """Приводит введенное название категории к виду для показа: без лишних пробелов."""
+    return " ".join(name.split())
+
+
+def category_key(name: str) -> str:
+    """Ключ категории для сравнения: без лишних пробелов, регистра и различия е/ё."""
+    return category_name(name).casefold().replace("ё", "е")
+
+
+async def _migrate_categories(db: aiosqlite.Connection):
+    """v6: таблица категорий с нормализованным ключом вместо свободного текста."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL, -- Название, как его ввел пользователь в первый раз
+            key TEXT NOT NULL, -- category_key(name)
+            UNIQUE (user_id, key)
+        )
+    ''')
+    await db.execute("ALTER TABLE notes ADD COLUMN category_id INTEGER REFERENCES categories (id)")
+    # lower() в SQLite не меняет регистр кириллицы, поэтому ключи считаются в Python
+    cursor = await db.execute("SELECT DISTINCT user_id, note_type FROM notes")
+    types = await cursor.fetchall()
+    await cursor.close()
+    for user_id, note_type in types:
+        await db.execute(
+            "INSERT OR IGNORE INTO categories (user_id, name, key) VALUES (?, ?, ?)",
+            (user_id, category_name(note_type), category_key(note_type))
+        )
+        # Варианты написания ("работа ", "Работа") показываются под одним
+        # названием категории
+        await db.execute('''
+            UPDATE notes SET (category_id, note_type) =
+                (SELECT id, name FROM categories WHERE user_id = ? AND key = ?)
+            WHERE user_id = ? AND note_type = ?
+        ''', (user_id, category_key(note_type), user_id, note_type))
+    await db.execute("DROP INDEX IF EXISTS idx_notes_user_type")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_category ON notes (user_id, category_id, due_at)")
+
+
+async def _migrate_calendar_outbox(db: aiosqlite.Connection):
+    """v7: подключенные Google Календари и очередь изменений для синхронизации."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS calendar_accounts (
+            user_id INTEGER PRIMARY KEY,
+            email TEXT NOT NULL,
+            linked_at INTEGER NOT NULL -- epoch UTC
+        )
+    ''')
+    # Одна строка на заметку: новое изменение заменяет еще не отправленное.
+    # Внешнего ключа на notes нет -- строка об удалении переживает заметку
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            note_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            op TEXT NOT NULL, -- "upsert" или "delete"
+            seq INTEGER NOT NULL DEFAULT 0, -- растет при каждом изменении заметки
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL, -- epoch UTC
+            last_error TEXT
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox (next_attempt_at)")
+
+
+async def _migrate_calendar_pull(db: aiosqlite.Connection):
+    """v8: календарь пользователя, токен синхронизации и связь заметок с событиями."""
+    # События создаются в календаре самого пользователя (его ID -- адрес
+    # Gmail), чтобы он мог менять их в Google Календаре
+    await db.execute("ALTER TABLE calendar_accounts ADD COLUMN calendar_id TEXT")
+    await db.execute("UPDATE calendar_accounts SET calendar_id = email")
+    await db.execute("ALTER TABLE calendar_accounts ADD COLUMN sync_token TEXT")
+    await db.execute("ALTER TABLE calendar_accounts ADD COLUMN next_pull_at REAL NOT NULL DEFAULT 0")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_calendar_accounts_pull ON calendar_accounts (next_pull_at)")
+    await db.execute("ALTER TABLE notes ADD COLUMN event_id TEXT")
+    await db.execute("ALTER TABLE notes ADD COLUMN etag TEXT")
+    await db.execute(
+        "UPDATE notes SET event_id = ? || id WHERE user_id IN (SELECT user_id FROM calendar_accounts)",
+        (EVENT_ID_PREFIX,)
+    )
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_user_event ON notes (user_id, event_id) WHERE event_id IS NOT NULL"
+    )
+    # ID события нужен и после удаления заметки
+    await db.execute("ALTER TABLE outbox ADD COLUMN event_id TEXT")
+    await db.execute("UPDATE outbox SET event_id = ? || note_id", (EVENT_ID_PREFIX,))
+
+
+async def _migrate_recurrence(db: aiosqlite.Connection):
+    """v9: повторяющиеся заметки -- одна строка на серию с правилом RRULE."""
+    await db.execute("ALTER TABLE notes ADD COLUMN rrule TEXT")  # NULL: однократная заметка
+    await db.execute("ALTER TABLE notes ADD COLUMN until_at INTEGER")  # Срок последнего повторения, epoch UTC
+    # Серий у пользователя мало, и при показе списка читаются только они
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_user_series ON notes (user_id, due_at) WHERE rrule IS NOT NULL"
+    )
+
+
+async def _migrate_archive(db: aiosqlite.Connection):
+    """v10: архив прошедших и выполненных заметок, постепенное освобождение места в файле."""
+    # Заметка переносится со своим ID; категория хранится названием
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS notes_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            note_text TEXT NOT NULL,
+            note_type TEXT NOT NULL,
+            note_date TEXT NOT NULL,
+            note_time TEXT NOT NULL,
+            due_at INTEGER,
+            task_complete INTEGER,
+            rrule TEXT,
+            until_at INTEGER,
+            event_id TEXT,
+            archived_at INTEGER NOT NULL -- epoch UTC
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_archive_user_due ON notes_archive (user_id, due_at, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_notes_complete ON notes (id) WHERE task_complete = 1")
+    # auto_vacuum существующей базы меняется только перестройкой всего файла
+    # (VACUUM), которая на время перестройки блокирует базу. Поэтому здесь
+    # ее нет: новые базы создаются с auto_vacuum = INCREMENTAL (init_db), а
+    # существующие переводятся отдельной командой enable_incremental_vacuum
+
+
+async def _migrate_digests(db: aiosqlite.Connection):
+    """v11: ежедневная сводка заметок вместо напоминаний за сутки."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS digests (
+            user_id INTEGER PRIMARY KEY,
+            digest_time TEXT NOT NULL, -- HH:MM
+            next_at INTEGER NOT NULL -- epoch UTC следующей отправки
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_digests_next ON digests (next_at)")
+
+
+async def _migrate_archive_events(db: aiosqlite.Connection):
+    """v12: поиск заметок архива по событию календаря."""
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_archive_user_event ON notes_archive (user_id, event_id) "
+        "WHERE event_id IS NOT NULL"
+    )
+
+
+async def _migrate_category_names(db: aiosqlite.Connection):
+    """v13: названия категорий в заметках, перенесенных миграцией v6 без изменений."""
+    await db.execute('''
+        UPDATE notes SET note_type = (SELECT name FROM categories c WHERE c.id = notes.category_id)
+        WHERE category_id IS NOT NULL
+          AND note_type IS NOT (SELECT name FROM categories c WHERE c.id = notes.category_id)
+    ''')
+    # В архиве нет category_id -- категория находится по ключу, как в v6
+    cursor = await db.execute("SELECT DISTINCT user_id, note_type FROM notes_archive")
+    types = await cursor.fetchall()
+    await cursor.close()
+    for user_id, note_type in types:
+        await db.execute('''
+            UPDATE notes_archive SET note_type = COALESCE(
+                (SELECT name FROM categories WHERE user_id = ? AND key = ?), note_type)
+            WHERE user_id = ? AND note_type = ?
+        ''', (user_id, category_key(note_type), user_id, note_type))
+
+
+# Миграции применяются по порядку; номер версии хранится в PRAGMA user_version
+MIGRATIONS = (
+    _migrate_due_at,
+    _migrate_reminders,
+    _migrate_fsm_storage,
+    _migrate_leases,
+    _migrate_fulltext,
+    _migrate_categories,
+    _migrate_calendar_outbox,
+    _migrate_calendar_pull,
+    _migrate_recurrence,
+    _migrate_archive,
+    _migrate_digests,
+    _migrate_archive_events,
+    _migrate_category_names,
+)
+
+
+async def _migrate(db: aiosqlite.Connection):
+    """Применяет к базе миграции, которые еще не были выполнены."""
+    cursor = await db.execute("PRAGMA user_version")
+    (version,) = await cursor.fetchone()
+    await cursor.close()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        await migration(db)
+        await db.execute(f"PRAGMA user_version = {number}")
+        await db.commit()
+        logger.info(f"Применена миграция базы данных v{number}", extra={"version": number})
+
 
 async def init_db(db_name: str):
-    """Инициализирует базу данных: создает таблицу заметок, если она не существует."""
+    """Инициализирует базу данных: создает таблицу заметок и применяет миграции."""
     async with aiosqlite.connect(db_name) as db:
+        # Действует, только пока в базе нет таблиц, -- то есть для новой базы
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
         await db.execute('''
             CREATE TABLE IF NOT EXISTS notes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 note_text TEXT NOT NULL,
                 note_type TEXT NOT NULL,
-                note_date TEXT NOT NULL, -- Формат YYYY-MM-DD
+                note_date TEXT NOT NULL, -- Формат DD-MM-YYYY
                 note_time TEXT NOT NULL, -- Формат HH:MM
                 task_complete INTEGER DEFAULT 0, -- 0: не выполнено, 1: выполнено
                 reminder_24h_sent INTEGER DEFAULT 0, -- 0: не отправлено, 1: отправлено
@@ -18,124 +554,562 @@ async def init_db(db_name: str):
             )
         ''')
         await db.commit()
-    print("База данных инициализирована.")
+        await _migrate(db)
+    logger.info("База данных инициализирована", extra={"db_name": db_name})
 
-async def add_note(db_name: str, user_id: int, note_text: str, note_type: str, note_date: str, note_time: str):
-    """Добавляет новую заметку в базу данных."""
-    async with aiosqlite.connect(db_name) as db:
-        cursor = await db.cursor()
-        await cursor.execute('''
-            INSERT INTO notes (user_id, note_text, note_type, note_date, note_time)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, note_text, note_type, note_date, note_time))
+@timed_query
+async def add_note(db_name: str, user_id: int, note_text: str, note_type: str, note_date: str, note_time: str,
+                   reminder_leads=DEFAULT_REMINDER_LEADS, rrule: str | None = None):
+    """Добавляет новую заметку с напоминаниями и возвращает её ID.
+
+    Если у пользователя уже есть категория, совпадающая с note_type без учета
+    регистра и лишних пробелов, заметка попадает в нее. С rrule заметка
+    повторяется, а напоминания ставятся к ближайшему повторению.
+
+    Raises:
+        RecurrenceError: rrule не разобрано или не поддерживается.
+    """
+    due_at = to_due_at(note_date, note_time)
+    rrule, until_at = _series_bounds(note_date, note_time, rrule)
+    note = {
+        "user_id": user_id,
+        "note_text": note_text,
+        "note_date": note_date,
+        "note_time": note_time,
+        "due_at": due_at,
+        "rrule": rrule,
+        "until_at": until_at,
+    }
+    async with _connect(db_name) as db:
+        category_id, note_type = await _ensure_category(db, user_id, note_type)
+        cursor = await db.execute('''
+            INSERT INTO notes (user_id, note_text, note_type, category_id, note_date, note_time, due_at, rrule, until_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, note_text, note_type, category_id, note_date, note_time, due_at, rrule, until_at))
+        note.update(id=cursor.lastrowid, note_type=note_type)
+        if rrule is not None:
+            next_due = _next_due(note, time.time())
+            if next_due is not None:
+                note = _occurrence(note, datetime.fromtimestamp(next_due))
+        note["reminders"] = await _insert_reminders(db, note["id"], note["due_at"], reminder_leads)
+        await _enqueue_sync(db, user_id, note["id"], "upsert")
+        await db.commit()
+    note_id = note["id"]
+    _notify("add", note)
+    logger.info("Заметка добавлена", extra={"user_id": user_id, "note_id": note_id})
+    return note_id
+
+async def _ensure_category(db: aiosqlite.Connection, user_id: int, note_type: str) -> tuple[int, str]:
+    """Находит или создает категорию пользователя; возвращает её ID и название."""
+    key = category_key(note_type)
+    await db.execute(
+        "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?) ON CONFLICT (user_id, key) DO NOTHING",
+        (user_id, category_name(note_type), key)
+    )
+    cursor = await db.execute("SELECT id, name FROM categories WHERE user_id = ? AND key = ?", (user_id, key))
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row["id"], row["name"]
+
+_ENQUEUE_SYNC = '''
+    INSERT INTO outbox (note_id, user_id, op, event_id, next_attempt_at)
+    SELECT ?, ?, ?, COALESCE(?, (SELECT event_id FROM notes WHERE id = ?), ? || ?), ?
+    WHERE EXISTS (SELECT 1 FROM calendar_accounts WHERE user_id = ?)
+    ON CONFLICT (note_id) DO UPDATE SET
+        op = excluded.op, event_id = excluded.event_id, seq = outbox.seq + 1, attempts = 0,
+        next_attempt_at = excluded.next_attempt_at, last_error = NULL
+'''
+
+async def _enqueue_sync(db: aiosqlite.Connection, user_id: int, note_id: int, op: str,
+                        event_id: str | None = None):
+    """Ставит заметку в очередь синхронизации, если пользователь подключил календарь.
+
+    Вызывается в транзакции, которая меняет заметку, поэтому изменение и
+    запись о том, что его надо отправить, фиксируются вместе. event_id
+    берется из заметки; для удаления его нужно передать явно.
+    """
+    await db.execute(_ENQUEUE_SYNC, (note_id, user_id, op, event_id, note_id, EVENT_ID_PREFIX, note_id, time.time(), user_id))
+
+async def _enqueue_sync_many(db: aiosqlite.Connection, user_id: int, notes, op: str):
+    """То же, что _enqueue_sync, для пачки заметок (note_id, event_id) одним executemany."""
+    now = time.time()
+    await db.executemany(_ENQUEUE_SYNC, [
+        (note_id, user_id, op, event_id, note_id, EVENT_ID_PREFIX, note_id, now, user_id) for note_id, event_id in notes
+    ])
+
+async def _insert_reminders(db: aiosqlite.Connection, note_id: int, due_at: int, leads) -> list[dict]:
+    """Создает напоминания заметки; для прошедших сроков ничего не создается."""
+    if due_at <= time.time():
+        return []
+    reminders = []
+    for lead in leads:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO reminders (note_id, lead, fire_at) VALUES (?, ?, ?)",
+            (note_id, lead, due_at - lead)
+        )
+        if cursor.rowcount:
+            reminders.append({"id": cursor.lastrowid, "lead": lead, "fire_at": due_at - lead})
+    return reminders
+
+@timed_query
+async def set_note_rrule(db_name: str, user_id: int, note_id: int, rrule: str | None) -> bool:
+    """Делает заметку повторяющейся по правилу rrule, а при None -- однократной.
+
+    Напоминания с прежними упреждениями переносятся на ближайшее
+    повторение (для однократной заметки -- на ее срок).
+    Возвращает False, если заметка не найдена.
+
+    Raises:
+        RecurrenceError: rrule не разобрано или не поддерживается.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            "SELECT user_id, note_text, note_type, note_date, note_time, due_at FROM notes WHERE id = ? AND user_id = ?",
+            (note_id, user_id)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row is None:
+            return False
+        rrule, until_at = _series_bounds(row["note_date"], row["note_time"], rrule)
+        note = {"id": note_id, **dict(row), "rrule": rrule, "until_at": until_at}
+        await db.execute("UPDATE notes SET rrule = ?, until_at = ? WHERE id = ?", (rrule, until_at, note_id))
+        cursor = await db.execute("SELECT lead FROM reminders WHERE note_id = ?", (note_id,))
+        leads = [lead for (lead,) in await cursor.fetchall()]
+        await cursor.close()
+        await db.execute("DELETE FROM reminders WHERE note_id = ?", (note_id,))
+        if rrule is not None:
+            next_due = _next_due(note, time.time())
+            if next_due is not None:
+                note = _occurrence(note, datetime.fromtimestamp(next_due))
+        note["reminders"] = await _insert_reminders(db, note_id, note["due_at"], leads)
+        await _enqueue_sync(db, user_id, note_id, "upsert")
         await db.commit()
-    print(f"Заметка для пользователя {user_id} добавлена.")
+    _notify("edit", note)
+    _notify("reminders", note)
+    logger.info("Повторение заметки изменено", extra={"user_id": user_id, "note_id": note_id, "rrule": rrule})
+    return True
 
+@timed_query
 async def get_user_notes(db_name: str, user_id: int):
     """Возвращает все заметки для конкретного пользователя."""
-    async with aiosqlite.connect(db_name) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.cursor()
-        await cursor.execute('SELECT id, note_text, note_date, note_time, note_type FROM notes WHERE user_id = ? ORDER BY note_date, note_time', (user_id,))
+    async with _connect(db_name) as db:
+        cursor = await db.execute('SELECT id, note_text, note_date, note_time, note_type, rrule FROM notes WHERE user_id = ? ORDER BY due_at, id', (user_id,))
         notes = await cursor.fetchall()
         return notes
 
+async def _user_series(db: aiosqlite.Connection, user_id: int, since: float | None = None,
+                       until: float | None = None) -> list:
+    """Серии пользователя; с since и until -- только те, что идут в [since, until)."""
+    query = '''SELECT id, note_text, note_date, note_time, note_type, due_at, rrule, until_at
+               FROM notes WHERE user_id = ? AND rrule IS NOT NULL'''
+    params = [user_id]
+    if until is not None:
+        query += " AND due_at < ? AND (until_at IS NULL OR until_at >= ?)"
+        params.extend((until, since))
+    cursor = await db.execute(query, params)
+    series = await cursor.fetchall()
+    await cursor.close()
+    return series
+
+
+def _listed_occurrences(series, now: float) -> list[dict]:
+    """Повторения серий, которые показываются в списке заметок.
+
+    Серия раскрывается от начала сегодняшнего дня на RECURRENCE_LIST_DAYS
+    дней вперед. Серия без повторений в этом окне показывается одной
+    строкой: ближайшим повторением или, если она закончилась, последним.
+    """
+    since = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    until = now + RECURRENCE_LIST_DAYS * 24 * 60 * 60
+    listed = []
+    for note in series:
+        items = _series_occurrences(note, since, until)
+        if not items:
+            due_at = _next_due(note, since) or note["until_at"]
+            items = [_occurrence(note, datetime.fromtimestamp(due_at))]
+        listed.extend(items)
+    return listed
+
+@timed_query
+async def get_user_notes_page(db_name: str, user_id: int, cursor: tuple[int, int] | None = None,
+                              backward: bool = False, limit: int = 10):
+    """Возвращает страницу заметок пользователя по ключу (due_at, id).
+
+    cursor -- (due_at, id) последней заметки предыдущей страницы или, при
+    backward=True, первой заметки следующей. Стоимость запроса не зависит
+    от того, насколько далеко страница от начала списка. Повторяющиеся
+    заметки попадают в список повторениями (см. _listed_occurrences) с
+    общим id серии и своим due_at.
+    """
+    query = 'SELECT id, note_text, note_date, note_time, note_type, due_at, rrule FROM notes WHERE user_id = ? AND rrule IS NULL'
+    params = [user_id]
+    if cursor is not None:
+        query += ' AND (due_at, id) < (?, ?)' if backward else ' AND (due_at, id) > (?, ?)'
+        params.extend(cursor)
+    query += ' ORDER BY due_at DESC, id DESC LIMIT ?' if backward else ' ORDER BY due_at, id LIMIT ?'
+    params.append(limit)
+    async with _connect(db_name) as db:
+        cur = await db.execute(query, params)
+        notes = [dict(row) for row in await cur.fetchall()]
+        await cur.close()
+        series = await _user_series(db, user_id)
+    if series:
+        key = lambda note: (note["due_at"], note["id"])
+        items = _listed_occurrences(series, time.time())
+        if cursor is not None:
+            items = [item for item in items if (key(item) < tuple(cursor) if backward else key(item) > tuple(cursor))]
+        notes = sorted(notes + items, key=key, reverse=backward)[:limit]
+    return notes[::-1] if backward else notes
+
+@timed_query
+async def count_user_notes(db_name: str, user_id: int, expand_series: bool = True) -> int:
+    """Возвращает количество заметок пользователя.
+
+    Повторяющаяся заметка считается столько раз, сколько строк занимает в
+    списке заметок, а с expand_series=False -- один раз.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            'SELECT COUNT(*) FROM notes WHERE user_id = ?' + (' AND rrule IS NULL' if expand_series else ''),
+            (user_id,)
+        )
+        (count,) = await cursor.fetchone()
+        await cursor.close()
+        if expand_series:
+            count += len(_listed_occurrences(await _user_series(db, user_id), time.time()))
+        return count
+
+async def iter_user_notes(db_name: str, user_id: int, batch: int = EXPORT_FETCH_SIZE):
+    """Отдает заметки пользователя по сроку пачками по batch строк.
+
+    Строки читаются из курсора по мере того, как их забирают, поэтому в
+    памяти не больше одной пачки. Соединение занято, пока генератор не
+    исчерпан или не закрыт.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            'SELECT id, note_text, note_type, note_date, note_time, rrule FROM notes WHERE user_id = ? ORDER BY due_at, id',
+            (user_id,)
+        )
+        try:
+            while rows := await cursor.fetchmany(batch):
+                yield rows
+        finally:
+            await cursor.close()
+
+@timed_query
+async def import_notes(db_name: str, user_id: int, notes, chunk_size: int = IMPORT_CHUNK_SIZE,
+                       reminder_leads=DEFAULT_REMINDER_LEADS) -> int:
+    """Добавляет заметки из итерируемого notes пачками по chunk_size.
+
+    notes -- словари с note_text, note_type, note_date, note_time и, для
+    повторяющихся, rrule в том виде, в каком его вернул parse_rule; они
+    читаются по мере вставки, так что файл не нужно держать в памяти
+    целиком. Очередная пачка читается из notes в пуле потоков: разбор
+    файла (utils.transfer.NoteReader) не задерживает цикл событий. Каждая
+    пачка -- одна транзакция с executemany, напоминания и очередь
+    синхронизации заполняются для пачки целиком запросами по диапазону ID.
+    Если чтение прервется, уже добавленные пачки останутся.
+
+    Возвращает число добавленных заметок.
+    """
+    notes = iter(notes)
+    categories: dict[str, tuple[int, str]] = {}
+    imported = 0
+    async with _connect(db_name) as db:
+        while chunk := await asyncio.to_thread(list, islice(notes, chunk_size)):
+            rows = []
+            for note in chunk:
+                key = category_key(note["note_type"])
+                if key not in categories:
+                    categories[key] = await _ensure_category(db, user_id, note["note_type"])
+                category_id, note_type = categories[key]
+                rrule, until_at = _series_bounds(note["note_date"], note["note_time"], note.get("rrule"))
+                rows.append((user_id, note["note_text"], note_type, category_id, note["note_date"],
+                             note["note_time"], to_due_at(note["note_date"], note["note_time"]), rrule, until_at))
+            await db.executemany('''
+                INSERT INTO notes (user_id, note_text, note_type, category_id, note_date, note_time, due_at,
+                                   rrule, until_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # Транзакция держит блокировку записи, поэтому ID пачки идут подряд
+            cursor = await db.execute("SELECT last_insert_rowid()")
+            (last_id,) = await cursor.fetchone()
+            await cursor.close()
+            first_id = last_id - len(rows) + 1
+            now = time.time()
+            await db.executemany('''
+                INSERT OR IGNORE INTO reminders (note_id, lead, fire_at)
+                SELECT id, ?, due_at - ? FROM notes WHERE id BETWEEN ? AND ? AND due_at > ? AND rrule IS NULL
+            ''', [(lead, lead, first_id, last_id, now) for lead in reminder_leads])
+            # Напоминания серий -- к ближайшему повторению, его срок считается в Python
+            series_reminders = []
+            for note_id, row in enumerate(rows, first_id):
+                if row[7] is not None:
+                    series = {"note_date": row[4], "note_time": row[5], "rrule": row[7], "until_at": row[8]}
+                    next_due = _next_due(series, now)
+                    if next_due is not None:
+                        series_reminders.extend((note_id, lead, next_due - lead) for lead in reminder_leads)
+            await db.executemany(
+                "INSERT OR IGNORE INTO reminders (note_id, lead, fire_at) VALUES (?, ?, ?)", series_reminders
+            )
+            await db.execute('''
+                INSERT INTO outbox (note_id, user_id, op, event_id, next_attempt_at)
+                SELECT id, user_id, 'upsert', ? || id, ? FROM notes
+                WHERE id BETWEEN ? AND ? AND EXISTS (SELECT 1 FROM calendar_accounts WHERE user_id = ?)
+            ''', (EVENT_ID_PREFIX, now, first_id, last_id, user_id))
+            await db.commit()
+            imported += len(rows)
+            _notify("import", {"user_id": user_id, "count": len(rows)})
+    logger.info("Заметки загружены из файла", extra={"user_id": user_id, "imported": imported})
+    return imported
+
+@timed_query
 async def delete_note(db_name: str, note_id: int, user_id: int):
     """Удаляет заметку по её ID, проверяя, что она принадлежит пользователю."""
-    async with aiosqlite.connect(db_name) as db:
-        cursor = await db.cursor()
-        await cursor.execute('DELETE FROM notes WHERE id = ? AND user_id = ?', (note_id, user_id))
+    async with _connect(db_name) as db:
+        cursor = await db.execute('SELECT event_id FROM notes WHERE id = ? AND user_id = ?', (note_id, user_id))
+        row = await cursor.fetchone()
+        await cursor.close()
+        cursor = await db.execute('DELETE FROM notes WHERE id = ? AND user_id = ?', (note_id, user_id))
+        deleted = cursor.rowcount > 0
+        if deleted:
+            await _enqueue_sync(db, user_id, note_id, "delete", row["event_id"])
+        await db.commit()
+    if deleted:
+        _notify("delete", {"id": note_id, "user_id": user_id})
+    return deleted
+
+async def _user_notes_by_ids(db: aiosqlite.Connection, user_id: int, note_ids, columns: str) -> list:
+    """Заметки пользователя с ID из note_ids; чужие и несуществующие ID пропускаются."""
+    note_ids = list(note_ids)
+    notes = []
+    # SQLite ограничивает число параметров в запросе
+    for start in range(0, len(note_ids), 500):
+        chunk = note_ids[start:start + 500]
+        cursor = await db.execute(
+            f"SELECT {columns} FROM notes WHERE user_id = ? AND id IN ({', '.join('?' * len(chunk))})",
+            (user_id, *chunk)
+        )
+        notes.extend(await cursor.fetchall())
+        await cursor.close()
+    return notes
+
+@timed_query
+async def delete_notes(db_name: str, user_id: int, note_ids) -> int:
+    """Удаляет несколько заметок пользователя одной транзакцией.
+
+    Возвращает число удаленных заметок.
+    """
+    async with _connect(db_name) as db:
+        notes = await _user_notes_by_ids(db, user_id, note_ids, "id, event_id")
+        await db.executemany("DELETE FROM notes WHERE id = ?", [(note["id"],) for note in notes])
+        await _enqueue_sync_many(db, user_id, [(note["id"], note["event_id"]) for note in notes], "delete")
         await db.commit()
-        return cursor.rowcount > 0
+    for note in notes:
+        _notify("delete", {"id": note["id"], "user_id": user_id})
+    logger.info("Заметки удалены", extra={"user_id": user_id, "deleted": len(notes)})
+    return len(notes)
     
+@timed_query
 async def get_note_by_id(db_name: str, note_id: int, user_id: int) -> dict | None:
     """Ищет заметку по ID"""
-    async with aiosqlite.connect(db_name) as db:
+    async with _connect(db_name) as db:
         cursor = await db.execute(
-            """SELECT id, note_text, note_type, note_date, note_time 
-               FROM notes 
+            """SELECT id, note_text, note_type, note_date, note_time, rrule
+               FROM notes
                WHERE id = ? AND user_id = ?""",
             (note_id, user_id)
         )
         row = await cursor.fetchone()
         await cursor.close()
-        
+
         if row:
             return {
                 "id": row[0],
                 "note_text": row[1],
-                "note_date": row[2],
-                "note_type" : row[3],
-                "note_time": row[4]
+                "note_type": row[2],
+                "note_date": row[3],
+                "note_time": row[4],
+                "rrule": row[5]
             }
         return None
 
+@timed_query
 async def get_notes_by_date(db_name: str, user_id: int, search_date: str) -> list[dict]:
     """Ищет заметки пользователя по указанной дате"""
     try:
-        async with aiosqlite.connect(db_name) as db:
-            # Ищем заметки с указанной датой
+        async with _connect(db_name) as db:
+            # Ищем заметки в пределах суток указанной даты
+            day_start = datetime.strptime(search_date, DATE_FORMAT)
+            since, until = int(day_start.timestamp()), int((day_start + timedelta(days=1)).timestamp())
             cursor = await db.execute(
-                """SELECT id, note_text, note_time 
-                   FROM notes 
-                   WHERE user_id = ? AND note_date = ?
-                   ORDER BY note_time""",
-                (user_id, search_date))
-            
+                """SELECT id, note_text, note_time, note_type, due_at
+                   FROM notes
+                   WHERE user_id = ? AND due_at >= ? AND due_at < ? AND rrule IS NULL
+                   ORDER BY due_at""",
+                (user_id, since, until))
+
             notes = []
             async for row in cursor:
                 notes.append({
                     "id": row[0],
                     "note_text": row[1],
-                    "note_time": row[2]
+                    "note_time": row[2],
+                    "note_type": row[3],
+                    "due_at": row[4],
+                    "rrule": None
                 })
-            
+
             await cursor.close()
+            # Повторения серий, которые приходятся на эти сутки
+            for series in await _user_series(db, user_id, since, until):
+                notes.extend(_series_occurrences(series, since, until))
+            notes.sort(key=lambda note: note["due_at"])
             return notes
             
     except aiosqlite.Error as e:
-        print(f"Ошибка при поиске заметок: {e}")
+        logger.error(f"Ошибка при поиске заметок: {e}", extra={"user_id": user_id})
         return []
 
+@timed_query
+async def get_user_categories(db_name: str, user_id: int) -> list[dict]:
+    """Возвращает категории пользователя, в которых есть заметки, по алфавиту."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            """SELECT c.id, c.name FROM categories c
+               WHERE c.user_id = ? AND EXISTS (
+                   SELECT 1 FROM notes n WHERE n.user_id = c.user_id AND n.category_id = c.id
+               )
+               ORDER BY c.key""",
+            (user_id,)
+        )
+        categories = [dict(row) for row in await cursor.fetchall()]
+        await cursor.close()
+        return categories
+
+@timed_query
 async def get_notes_by_type(db_name: str, user_id: int, search_type: str) -> list[dict]:
-    """Ищет заметки пользователя по указанной категории"""
+    """Ищет заметки пользователя по категории без учета регистра и лишних пробелов"""
     try:
-        async with aiosqlite.connect(db_name) as db:
+        async with _connect(db_name) as db:
             cursor = await db.execute(
-                """SELECT id, note_text, note_date, note_time 
-                   FROM notes 
-                   WHERE user_id = ? AND note_type = ?
-                   ORDER BY note_date, note_type""",
-                (user_id, search_type))
-            
+                "SELECT id FROM categories WHERE user_id = ? AND key = ?",
+                (user_id, category_key(search_type)))
+            row = await cursor.fetchone()
+            await cursor.close()
+            if row is None:
+                return []
+            return await _notes_by_category(db, user_id, row["id"])
+    except aiosqlite.Error as e:
+        logger.error(f"Ошибка при поиске заметок: {e}", extra={"user_id": user_id})
+        return []
+
+async def _notes_by_category(db: aiosqlite.Connection, user_id: int, category_id: int) -> list[dict]:
+    # Без timed_query: время учитывается в вызывающей функции
+    cursor = await db.execute(
+        """SELECT id, note_text, note_date, note_time 
+           FROM notes 
+           WHERE user_id = ? AND category_id = ?
+           ORDER BY due_at""",
+        (user_id, category_id))
+
+    notes = []
+    async for row in cursor:
+        notes.append({
+            "id": row[0],
+            "note_text": row[1],
+            "note_date": row[2],
+            "note_time": row[3]
+        })
+
+    await cursor.close()
+    return notes
+
+@timed_query
+async def get_notes_by_category(db_name: str, user_id: int, category_id: int) -> list[dict]:
+    """Ищет заметки пользователя в категории с указанным ID"""
+    try:
+        async with _connect(db_name) as db:
+            return await _notes_by_category(db, user_id, category_id)
+    except aiosqlite.Error as e:
+        logger.error(f"Ошибка при поиске заметок: {e}", extra={"user_id": user_id})
+        return []
+
+# Маркеры начала и конца совпадения в тексте, который возвращает search_notes
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+def _fts_query(user_id: int, text: str) -> str | None:
+    """Строит запрос FTS5: все слова как префиксы, только заметки пользователя."""
+    words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+    if not words:
+        return None
+    return f'owner : "u{user_id}" AND (' + " ".join(f'"{word}"*' for word in words) + ")"
+
+
+def _restore_highlight(original: str, highlighted: str) -> str:
+    """Переносит маркеры совпадений на исходный текст заметки (с буквой ё)."""
+    result = []
+    position = 0
+    for char in highlighted:
+        if char in (HIGHLIGHT_START, HIGHLIGHT_END):
+            result.append(char)
+        else:
+            result.append(original[position])
+            position += 1
+    return "".join(result)
+
+
+@timed_query
+async def search_notes(db_name: str, user_id: int, text: str, offset: int = 0, limit: int = 5) -> list[dict]:
+    """Ищет заметки пользователя по словам и их началам, лучшие совпадения первыми.
+
+    В note_text найденные слова обрамлены HIGHLIGHT_START и HIGHLIGHT_END.
+    """
+    query = _fts_query(user_id, text)
+    if query is None:
+        return []
+    try:
+        async with _connect(db_name) as db:
+            cursor = await db.execute(
+                """SELECT n.id, n.note_text, n.note_type, n.note_date, n.note_time,
+                          highlight(notes_fts, 0, ?, ?) AS highlighted
+                   FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+                   WHERE notes_fts MATCH ?
+                   ORDER BY bm25(notes_fts, 1.0, 0.0)
+                   LIMIT ? OFFSET ?""",
+                (HIGHLIGHT_START, HIGHLIGHT_END, query, limit, offset))
             notes = []
             async for row in cursor:
                 notes.append({
-                    "id": row[0],
-                    "note_text": row[1],
-                    "note_date": row[2],
-                    "note_time": row[3]
+                    "id": row["id"],
+                    "note_text": _restore_highlight(row["note_text"], row["highlighted"]),
+                    "note_type": row["note_type"],
+                    "note_date": row["note_date"],
+                    "note_time": row["note_time"]
                 })
-            
             await cursor.close()
             return notes
-            
+
     except aiosqlite.Error as e:
-        print(f"Ошибка при поиске заметок: {e}")
+        logger.error(f"Ошибка полнотекстового поиска: {e}", extra={"user_id": user_id})
         return []
 
+@timed_query
 async def get_upcoming_notes(db_name: str, user_id: int, limit: int = 10) -> list[dict]:
     """Возвращает ближайшие заметки пользователя, отсортированные по дате и времени.    """
     try:
-        async with aiosqlite.connect(db_name) as db:
-            now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        async with _connect(db_name) as db:
             cursor = await db.execute(
                 """SELECT id, note_text, note_date, note_time 
                    FROM notes 
-                   WHERE user_id = ? AND datetime(note_date || ' ' || note_time) >= datetime(?)
-                   ORDER BY datetime(note_date || ' ' || note_time)
+                   WHERE user_id = ? AND due_at >= ?
+                   ORDER BY due_at
                    LIMIT ?""",
-                (user_id, now, limit))
+                (user_id, int(time.time()), limit))
 
             notes = []
             async for row in cursor:
@@ -150,47 +1124,713 @@ async def get_upcoming_notes(db_name: str, user_id: int, limit: int = 10) -> lis
             return notes
 
     except aiosqlite.Error as e:
-        print(f"Ошибка при поиске ближайших заметок: {e}")
+        logger.error(f"Ошибка при поиске ближайших заметок: {e}", extra={"user_id": user_id})
         return []
 
-async def get_notes_for_reminders(db_name: str):
-    """Возвращает заметки, для которых, возможно, нужно отправить напоминание."""
-    async with aiosqlite.connect(db_name) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.cursor()
-        # Выбираем заметки, для которых еще не отправлены оба напоминания
-        await cursor.execute('SELECT id, user_id, note_text, note_type, note_date, note_time, task_complete, reminder_24h_sent, reminder_1h_sent FROM notes WHERE reminder_24h_sent = 0 OR reminder_1h_sent = 0')
-        notes = await cursor.fetchall()
-        return notes
+@timed_query
+async def get_due_reminders(db_name: str, until: int, limit: int):
+    """Возвращает не больше limit неотправленных напоминаний со временем отправки до until.
 
-async def mark_reminder_sent(db_name: str, note_id: int, reminder_type: str):
-    """Помечает напоминание как отправленное для конкретной заметки."""
-    column_name = f'reminder_{reminder_type}_sent' # 'reminder_24h_sent' или 'reminder_1h_sent'
-    async with aiosqlite.connect(db_name) as db:
-        await db.execute(f'UPDATE notes SET {column_name} = 1 WHERE id = ?', (note_id,))
+    Для повторяющейся заметки дата, время и срок -- того повторения, к
+    которому относится напоминание (fire_at + lead).
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute('''
+            SELECT r.id, r.note_id, r.lead, r.fire_at, n.user_id, n.note_text, n.note_type, n.note_date, n.note_time, n.due_at,
+                   n.rrule
+            FROM reminders r JOIN notes n ON n.id = r.note_id
+            WHERE r.sent_at IS NULL AND r.fire_at <= ?
+            ORDER BY r.fire_at
+            LIMIT ?
+        ''', (until, limit))
+        reminders = await cursor.fetchall()
+        await cursor.close()
+        return [
+            _occurrence(row, datetime.fromtimestamp(row["fire_at"] + row["lead"])) if row["rrule"] else dict(row)
+            for row in reminders
+        ]
+
+@timed_query
+async def mark_reminders_sent(db_name: str, reminder_ids) -> list[int]:
+    """Помечает напоминания как отправленные одной транзакцией.
+
+    Напоминание повторяющейся заметки вместо этого переносится на
+    следующее повторение, до которого еще больше его упреждения, и
+    отмечается отправленным, только когда серия закончилась. Возвращает
+    новые времена отправки перенесенных напоминаний.
+    """
+    reminder_ids = list(reminder_ids)
+    now = time.time()
+    moved = []
+    async with _connect(db_name) as db:
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(reminder_ids), 500):
+            chunk = reminder_ids[start:start + 500]
+            cursor = await db.execute(f'''
+                SELECT r.id, r.lead, r.fire_at, n.note_date, n.note_time, n.rrule, n.until_at
+                FROM reminders r JOIN notes n ON n.id = r.note_id
+                WHERE n.rrule IS NOT NULL AND r.id IN ({", ".join("?" * len(chunk))})
+            ''', chunk)
+            for row in await cursor.fetchall():
+                next_due = _next_due(row, max(row["fire_at"], now) + row["lead"])
+                if next_due is not None:
+                    moved.append((next_due - row["lead"], row["id"]))
+            await cursor.close()
+        await db.executemany('UPDATE reminders SET fire_at = ? WHERE id = ?', moved)
+        moved_ids = {reminder_id for _, reminder_id in moved}
+        await db.executemany(
+            'UPDATE reminders SET sent_at = ? WHERE id = ?',
+            [(int(now), reminder_id) for reminder_id in reminder_ids if reminder_id not in moved_ids]
+        )
         await db.commit()
+    return [fire_at for fire_at, _ in moved]
 
+@timed_query
+async def get_note_reminders(db_name: str, note_id: int, user_id: int) -> list[dict]:
+    """Возвращает напоминания заметки пользователя, отсортированные по упреждению."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            """SELECT r.id, r.lead, r.fire_at, r.sent_at
+               FROM reminders r JOIN notes n ON n.id = r.note_id
+               WHERE r.note_id = ? AND n.user_id = ?
+               ORDER BY r.lead DESC""",
+            (note_id, user_id)
+        )
+        reminders = [dict(row) for row in await cursor.fetchall()]
+        await cursor.close()
+        return reminders
+
+@timed_query
+async def toggle_note_reminder(db_name: str, user_id: int, note_id: int, lead: int) -> bool:
+    """Включает или выключает напоминание заметки за lead секунд до срока.
+
+    Для повторяющейся заметки напоминание ставится к ближайшему повторению.
+    Возвращает True, если напоминание теперь включено.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            """SELECT user_id, note_text, note_type, note_date, note_time, due_at, rrule, until_at
+               FROM notes WHERE id = ? AND user_id = ?""",
+            (note_id, user_id)
+        )
+        note = await cursor.fetchone()
+        await cursor.close()
+        if note is None:
+            return False
+        if note["rrule"] is not None:
+            next_due = _next_due(note, time.time())
+            note = _occurrence(note, datetime.fromtimestamp(next_due if next_due is not None else note["until_at"]))
+        cursor = await db.execute(
+            "DELETE FROM reminders WHERE note_id = ? AND lead = ?", (note_id, lead)
+        )
+        enabled = False
+        if cursor.rowcount == 0:
+            enabled = bool(await _insert_reminders(db, note_id, note["due_at"], (lead,)))
+        await db.commit()
+        cursor = await db.execute(
+            "SELECT id, lead, fire_at FROM reminders WHERE note_id = ? AND sent_at IS NULL",
+            (note_id,)
+        )
+        reminders = [dict(row) for row in await cursor.fetchall()]
+        await cursor.close()
+    _notify("reminders", {"id": note_id, **dict(note), "reminders": reminders})
+    return enabled
+
+@timed_query
 async def edit_notes(db_name: str, user_id: int, note_id: int, new_text: str):
-    async with aiosqlite.connect(db_name) as db:
-        await db.execute(
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
             "UPDATE notes SET note_text = ? WHERE id = ? AND user_id = ?",
             (new_text, note_id, user_id)
         )
+        if cursor.rowcount:
+            await _enqueue_sync(db, user_id, note_id, "upsert")
+        await db.commit()
+    _notify("edit", {"id": note_id, "user_id": user_id, "note_text": new_text})
+    logger.info("Заметка изменена", extra={"user_id": user_id, "note_id": note_id})
+
+@timed_query
+async def save_as_complete(db_name: str, user_id: int, note_id: int, new_text: str) -> bool:
+    """Отмечает заметку выполненной; возвращает False, если заметки нет или она повторяется.
+
+    Отметка относится ко всей строке заметки, а у серии это все ее
+    повторения сразу (и выполненная серия ушла бы в архив целиком),
+    поэтому повторяющиеся заметки так не отмечаются.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            "UPDATE notes SET note_text = ?, task_complete = 1 WHERE id = ? AND user_id = ? AND rrule IS NULL",
+            (new_text, note_id, user_id)
+        )
+        completed = bool(cursor.rowcount)
+        if completed:
+            await _enqueue_sync(db, user_id, note_id, "upsert")
+        await db.commit()
+    if not completed:
+        return False
+    _notify("edit", {"id": note_id, "user_id": user_id, "note_text": new_text})
+    logger.info("Заметка отмечена как выполненная", extra={"user_id": user_id, "note_id": note_id})
+    return True
+
+@timed_query
+async def complete_notes(db_name: str, user_id: int, note_ids) -> int:
+    """Отмечает несколько заметок пользователя выполненными одной транзакцией.
+
+    Как и при отметке по одной, к тексту заметки добавляется "✅"; уже
+    выполненные и повторяющиеся заметки (см. save_as_complete) не
+    меняются. Возвращает число отмеченных заметок.
+    """
+    async with _connect(db_name) as db:
+        notes = await _user_notes_by_ids(db, user_id, note_ids, "id, note_text, task_complete, rrule")
+        completed = [
+            (f"{note['note_text']} ✅", note["id"]) for note in notes
+            if not note["task_complete"] and note["rrule"] is None
+        ]
+        await db.executemany("UPDATE notes SET note_text = ?, task_complete = 1 WHERE id = ?", completed)
+        await _enqueue_sync_many(db, user_id, [(note_id, None) for _, note_id in completed], "upsert")
+        await db.commit()
+    for note_text, note_id in completed:
+        _notify("edit", {"id": note_id, "user_id": user_id, "note_text": note_text})
+    logger.info("Заметки отмечены как выполненные", extra={"user_id": user_id, "completed": len(completed)})
+    return len(completed)
+
+# Условия, по которым заметки переносятся в архив; :cutoff -- граница возраста.
+# Каждое проверяется отдельным запросом, чтобы использовать свой индекс
+_ARCHIVE_CONDITIONS = (
+    # Прошедшие однократные заметки (idx_notes_due)
+    "n.due_at < :cutoff AND n.rrule IS NULL",
+    # Закончившиеся серии (idx_notes_user_series)
+    "n.rrule IS NOT NULL AND n.until_at < :cutoff",
+    # Выполненные однократные заметки (idx_notes_complete). Серию целиком
+    # выполненной не отмечают, но в старых базах такие строки могут быть
+    "n.task_complete = 1 AND n.rrule IS NULL",
+)
+
+@timed_query
+async def archive_notes(db_name: str, cutoff: int, limit: int) -> int:
+    """Переносит в notes_archive не больше limit заметок одной транзакцией.
+
+    Переносятся однократные заметки, выполненные или со сроком раньше
+    cutoff, и серии, последнее повторение которых раньше cutoff. Заметки с
+    неотправленным изменением в outbox остаются до следующего раза: иначе
+    синхронизация приняла бы перенос за удаление и удалила бы событие
+    календаря. Напоминания удаляются вместе с заметкой.
+
+    Возвращает число перенесенных заметок.
+    """
+    now = int(time.time())
+    async with _connect(db_name) as db:
+        notes = {}
+        for condition in _ARCHIVE_CONDITIONS:
+            if len(notes) >= limit:
+                break
+            cursor = await db.execute(f'''
+                SELECT n.id, n.user_id FROM notes n
+                WHERE {condition} AND NOT EXISTS (SELECT 1 FROM outbox o WHERE o.note_id = n.id)
+                LIMIT :limit
+            ''', {"cutoff": cutoff, "limit": limit - len(notes)})
+            notes.update(await cursor.fetchall())
+            await cursor.close()
+        if not notes:
+            return 0
+        placeholders = ", ".join("?" * len(notes))
+        await db.execute(f'''
+            INSERT OR REPLACE INTO notes_archive (id, user_id, note_text, note_type, note_date, note_time, due_at,
+                                                  task_complete, rrule, until_at, event_id, archived_at)
+            SELECT id, user_id, note_text, note_type, note_date, note_time, due_at,
+                   task_complete, rrule, until_at, event_id, ?
+            FROM notes WHERE id IN ({placeholders})
+        ''', (now, *notes))
+        await db.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", tuple(notes))
         await db.commit()
-    print(f"Заметка для пользователя {user_id} изменена.")
+    # Для подписчиков перенос в архив -- то же, что удаление
+    for note_id, user_id in notes.items():
+        _notify("delete", {"id": note_id, "user_id": user_id})
+    return len(notes)
+
+@timed_query
+async def incremental_vacuum(db_name: str, pages: int) -> int:
+    """Возвращает ОС до pages свободных страниц файла базы; возвращает их число.
+
+    Каждый вызов -- короткая операция, поэтому место после архивации
+    освобождается частями, не блокируя запись надолго. В базе без
+    auto_vacuum = INCREMENTAL (см. enable_incremental_vacuum) ничего не
+    освобождается, и возвращается 0.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute("PRAGMA freelist_count")
+        (before,) = await cursor.fetchone()
+        await cursor.close()
+        # sqlite3 выполняет PRAGMA без столбцов результата одним шагом, а
+        # incremental_vacuum освобождает по странице за шаг; executescript
+        # выполняет выражение до конца
+        await db.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        cursor = await db.execute("PRAGMA freelist_count")
+        (after,) = await cursor.fetchone()
+        await cursor.close()
+    return before - after
 
-async def save_as_complete(db_name: str, user_id: int, note_id: int, new_text: str):
+@timed_query
+async def enable_incremental_vacuum(db_name: str) -> bool:
+    """Переводит существующую базу на auto_vacuum = INCREMENTAL.
+
+    Для этого SQLite перестраивает весь файл (VACUUM): это долго на
+    большой базе и блокирует ее на все время перестройки, поэтому
+    выполняется не при запуске бота, а отдельной командой, лучше при
+    остановленном боте (python -m utils.archive --enable-incremental-vacuum).
+    Возвращает False, если база уже переведена.
+    """
     async with aiosqlite.connect(db_name) as db:
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        (mode,) = await cursor.fetchone()
+        await cursor.close()
+        # 2 -- INCREMENTAL
+        if mode == 2:
+            return False
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await db.execute("VACUUM")
+    logger.info("База переведена на auto_vacuum = INCREMENTAL", extra={"db_name": db_name})
+    return True
+
+@timed_query
+async def get_archived_notes_page(db_name: str, user_id: int, cursor: tuple[int, int] | None = None,
+                                  backward: bool = False, limit: int = 10) -> list[dict]:
+    """Возвращает страницу архива пользователя, от новых заметок к старым.
+
+    cursor -- (due_at, id) последней заметки предыдущей страницы или, при
+    backward=True, первой заметки следующей, как в get_user_notes_page.
+    """
+    query = '''SELECT id, note_text, note_type, note_date, note_time, due_at, task_complete, rrule
+               FROM notes_archive WHERE user_id = ?'''
+    params = [user_id]
+    if cursor is not None:
+        query += ' AND (due_at, id) > (?, ?)' if backward else ' AND (due_at, id) < (?, ?)'
+        params.extend(cursor)
+    query += ' ORDER BY due_at, id LIMIT ?' if backward else ' ORDER BY due_at DESC, id DESC LIMIT ?'
+    params.append(limit)
+    async with _connect(db_name) as db:
+        cur = await db.execute(query, params)
+        notes = [dict(row) for row in await cur.fetchall()]
+        await cur.close()
+    return notes[::-1] if backward else notes
+
+@timed_query
+async def count_archived_notes(db_name: str, user_id: int) -> int:
+    """Возвращает количество заметок пользователя в архиве."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute('SELECT COUNT(*) FROM notes_archive WHERE user_id = ?', (user_id,))
+        (count,) = await cursor.fetchone()
+        await cursor.close()
+        return count
+
+def next_digest_at(digest_time: str, after: float) -> int:
+    """Первый момент digest_time (HH:MM) строго позже after, epoch UTC."""
+    day = date.fromtimestamp(after)
+    while True:
+        moment = to_due_at(day.strftime(DATE_FORMAT), digest_time)
+        if moment > after:
+            return moment
+        day += timedelta(days=1)
+
+@timed_query
+async def set_digest(db_name: str, user_id: int, digest_time: str | None):
+    """Включает ежедневную сводку в digest_time (HH:MM) или выключает ее (None)."""
+    async with _connect(db_name) as db:
+        if digest_time is None:
+            await db.execute("DELETE FROM digests WHERE user_id = ?", (user_id,))
+        else:
+            await db.execute('''
+                INSERT INTO digests (user_id, digest_time, next_at) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET digest_time = excluded.digest_time, next_at = excluded.next_at
+            ''', (user_id, digest_time, next_digest_at(digest_time, time.time())))
+        await db.commit()
+
+@timed_query
+async def get_digest_time(db_name: str, user_id: int) -> str | None:
+    """Возвращает время ежедневной сводки пользователя или None, если она выключена."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute("SELECT digest_time FROM digests WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] if row else None
+
+@timed_query
+async def get_digest_users(db_name: str, user_ids) -> set[int]:
+    """Возвращает тех из user_ids, у кого включена ежедневная сводка."""
+    user_ids = list(user_ids)
+    found = set()
+    async with _connect(db_name) as db:
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            cursor = await db.execute(
+                f"SELECT user_id FROM digests WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            found.update(user_id for (user_id,) in await cursor.fetchall())
+            await cursor.close()
+    return found
+
+@timed_query
+async def get_due_digests(db_name: str, now: float, limit: int) -> list[dict]:
+    """Возвращает не больше limit сводок, которым пора уйти, с заметками их дня.
+
+    Все сводки считаются одним запросом с группировкой по пользователю и
+    категории (categories.id, а не текст note_type). Серии попадают в
+    запрос одной строкой, а их повторения за день вычисляются здесь.
+    Сводка -- словарь user_id, digest_time, next_at, date и day_end (дата и
+    конец ее дня) и categories: {название категории: [заметки по времени]};
+    у пользователя без заметок на этот день categories пустой. Выполненные
+    заметки не попадают в сводку.
+    """
+    async with _connect(db_name) as db:
+        # День сводки -- сутки по местному времени, в которые она отправляется;
+        # модификатор 'utc' переводит местную полночь в epoch, как to_due_at
+        cursor = await db.execute('''
+            WITH due AS (
+                SELECT user_id, digest_time, next_at,
+                       CAST(strftime('%s', date(next_at, 'unixepoch', 'localtime'), 'utc') AS INTEGER) AS day_start,
+                       CAST(strftime('%s', date(next_at, 'unixepoch', 'localtime', '+1 day'), 'utc') AS INTEGER) AS day_end
+                FROM digests WHERE next_at <= :now
+                ORDER BY next_at
+                LIMIT :limit
+            ), day_notes AS (
+                SELECT d.user_id, n.category_id, n.note_type, n.note_text, n.note_date, n.note_time, n.due_at,
+                       n.rrule, n.until_at
+                FROM due d JOIN notes n ON n.user_id = d.user_id
+                WHERE n.due_at >= d.day_start AND n.due_at < d.day_end AND n.rrule IS NULL
+                      AND n.task_complete IS NOT 1
+                UNION ALL
+                SELECT d.user_id, n.category_id, n.note_type, n.note_text, n.note_date, n.note_time, n.due_at,
+                       n.rrule, n.until_at
+                FROM due d JOIN notes n ON n.user_id = d.user_id
+                WHERE n.due_at < d.day_end AND n.rrule IS NOT NULL AND (n.until_at IS NULL OR n.until_at >= d.day_start)
+                      AND n.task_complete IS NOT 1
+            )
+            SELECT d.user_id, d.digest_time, d.next_at, d.day_start, d.day_end, n.due_at IS NOT NULL AS has_notes,
+                   COALESCE(c.name, n.note_type) AS category,
+                   json_group_array(json_array(n.note_text, n.note_date, n.note_time, n.due_at, n.rrule, n.until_at))
+                       AS notes
+            FROM due d
+                LEFT JOIN day_notes n ON n.user_id = d.user_id
+                LEFT JOIN categories c ON c.id = n.category_id
+            GROUP BY d.user_id, COALESCE(n.category_id, n.note_type)
+            ORDER BY d.user_id, category
+        ''', {"now": now, "limit": limit})
+        rows = await cursor.fetchall()
+        await cursor.close()
+    digests = {}
+    for row in rows:
+        digest = digests.setdefault(row["user_id"], {
+            "user_id": row["user_id"],
+            "digest_time": row["digest_time"],
+            "next_at": row["next_at"],
+            "date": date.fromtimestamp(row["day_start"]).strftime(DATE_FORMAT),
+            "day_end": row["day_end"],
+            "categories": {},
+        })
+        if not row["has_notes"]:
+            # Заметок на этот день нет
+            continue
+        notes = []
+        for note_text, note_date, note_time, due_at, rrule, until_at in json.loads(row["notes"]):
+            note = {"note_text": note_text, "note_date": note_date, "note_time": note_time, "due_at": due_at,
+                    "rrule": rrule, "until_at": until_at}
+            if rrule:
+                notes.extend(_series_occurrences(note, row["day_start"], row["day_end"]))
+            else:
+                notes.append(note)
+        if notes:
+            digest["categories"][row["category"]] = sorted(notes, key=lambda note: note["due_at"])
+    return list(digests.values())
+
+@timed_query
+async def finish_digests(db_name: str, digests):
+    """Переносит сводки на следующий раз; digests -- тройки (user_id, прежний next_at, новый).
+
+    Сводку, время которой пользователь успел изменить, не трогаем: у нее
+    уже другой next_at.
+    """
+    async with _connect(db_name) as db:
+        await db.executemany(
+            "UPDATE digests SET next_at = ? WHERE user_id = ? AND next_at = ?",
+            [(next_at, user_id, previous) for user_id, previous, next_at in digests]
+        )
+        await db.commit()
+
+@timed_query
+async def get_fsm_record(db_name: str, key: str) -> tuple[str | None, dict] | None:
+    """Возвращает сохраненные состояние и данные FSM по ключу."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        await cursor.close()
+    if row is None:
+        return None
+    return row["state"], json.loads(row["data"])
+
+@timed_query
+async def save_fsm_records(db_name: str, records):
+    """Сохраняет пачку записей FSM (key, state, data) одной транзакцией.
+
+    Записи без состояния и данных удаляются.
+    """
+    records = list(records)
+    async with _connect(db_name) as db:
+        await db.executemany(
+            "DELETE FROM fsm_storage WHERE key = ?",
+            [(key,) for key, state, data in records if state is None and not data]
+        )
+        await db.executemany(
+            """INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data""",
+            [(key, state, json.dumps(data, ensure_ascii=False)) for key, state, data in records if state is not None or data]
+        )
+        await db.commit()
+
+@timed_query
+async def acquire_lease(db_name: str, name: str, holder: str, ttl: float) -> bool:
+    """Берет или продлевает аренду name на ttl секунд.
+
+    Аренда достается holder, если она свободна, истекла или уже принадлежит ему.
+    """
+    now = time.time()
+    async with _connect(db_name) as db:
         await db.execute(
-            "UPDATE notes SET note_text = ? WHERE id = ? AND user_id = ?",
-            (new_text, note_id, user_id)
+            """INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+               WHERE leases.holder = excluded.holder OR leases.expires_at < ?""",
+            (name, holder, now + ttl, now)
         )
         await db.commit()
+        cursor = await db.execute("SELECT holder FROM leases WHERE name = ?", (name,))
+        row = await cursor.fetchone()
+        await cursor.close()
+    return row is not None and row["holder"] == holder
+
+@timed_query
+async def release_lease(db_name: str, name: str, holder: str):
+    """Освобождает аренду, если она принадлежит holder."""
+    async with _connect(db_name) as db:
+        await db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+        await db.commit()
+
+@timed_query
+async def link_calendar(db_name: str, user_id: int, email: str) -> int:
+    """Подключает Google Календарь пользователя и ставит в очередь все его заметки.
+
+    Возвращает число заметок, поставленных в очередь.
+    """
+    now = time.time()
+    async with _connect(db_name) as db:
+        # Другой календарь -- заново полная синхронизация
         await db.execute(
-            "UPDATE notes SET task_complete = 1 WHERE id = ? AND user_id = ?",
-            (note_id, user_id)
+            """INSERT INTO calendar_accounts (user_id, email, calendar_id, linked_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (user_id) DO UPDATE SET
+                   email = excluded.email, calendar_id = excluded.calendar_id,
+                   sync_token = NULL, next_pull_at = 0""",
+            (user_id, email, email, int(now))
         )
-        print(f"Заметка для пользователя {user_id} отмечена как выполненная.")
+        cursor = await db.execute('''
+            INSERT INTO outbox (note_id, user_id, op, event_id, next_attempt_at)
+            SELECT id, user_id, 'upsert', COALESCE(event_id, ? || id), ? FROM notes WHERE user_id = ?
+            ON CONFLICT (note_id) DO UPDATE SET
+                op = excluded.op, event_id = excluded.event_id, seq = outbox.seq + 1, attempts = 0,
+                next_attempt_at = excluded.next_attempt_at, last_error = NULL
+        ''', (EVENT_ID_PREFIX, now, user_id))
+        queued = cursor.rowcount
+        await db.commit()
+    _notify("calendar", {"user_id": user_id, "email": email})
+    logger.info("Google Календарь подключен", extra={"user_id": user_id, "queued": queued})
+    return queued
+
+@timed_query
+async def get_outbox_batch(db_name: str, now: float, limit: int) -> list[dict]:
+    """Возвращает изменения, которые пора отправить, вместе с текущей заметкой.
 
+    Для удаленной заметки поля заметки равны None.
+    """
+    async with _connect(db_name) as db:
+        cursor = await db.execute('''
+            SELECT o.note_id, o.user_id, o.op, o.seq, o.attempts, o.event_id, a.calendar_id,
+                   n.note_text, n.note_date, n.note_time, n.rrule
+            FROM outbox o
+            LEFT JOIN notes n ON n.id = o.note_id
+            LEFT JOIN calendar_accounts a ON a.user_id = o.user_id
+            WHERE o.next_attempt_at <= ?
+            ORDER BY o.next_attempt_at
+            LIMIT ?
+        ''', (now, limit))
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(row) for row in rows]
+
+@timed_query
+async def finish_outbox(db_name: str, done, failed):
+    """Отмечает результаты отправки одной транзакцией.
+
+    done -- (note_id, seq, etag) отправленных изменений (etag события или
+    None для удаления), failed -- (note_id, seq, next_attempt_at, error)
+    неудачных. Если заметка успела измениться (seq другой), строка остается
+    в очереди с новым изменением. Сохраненный etag позволяет не применять
+    к заметке при загрузке из календаря ее же отправленную версию.
+    """
+    done = list(done)
+    async with _connect(db_name) as db:
+        await db.executemany("DELETE FROM outbox WHERE note_id = ? AND seq = ?",
+                             [(note_id, seq) for note_id, seq, etag in done])
+        await db.executemany(
+            "UPDATE notes SET event_id = COALESCE(event_id, ? || id), etag = ? WHERE id = ?",
+            [(EVENT_ID_PREFIX, etag, note_id) for note_id, seq, etag in done if etag is not None]
+        )
+        await db.executemany(
+            """UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+               WHERE note_id = ? AND seq = ?""",
+            [(next_attempt_at, error, note_id, seq) for note_id, seq, next_attempt_at, error in failed]
+        )
+        await db.commit()
+
+@timed_query
+async def get_calendar_pulls(db_name: str, now: float, limit: int) -> list[dict]:
+    """Возвращает подключенные календари, изменения которых пора загрузить."""
+    async with _connect(db_name) as db:
+        cursor = await db.execute(
+            """SELECT user_id, calendar_id, sync_token FROM calendar_accounts
+               WHERE next_pull_at <= ? ORDER BY next_pull_at LIMIT ?""",
+            (now, limit)
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(row) for row in rows]
+
+@timed_query
+async def set_calendar_pull(db_name: str, user_id: int, next_pull_at: float, reset_token: bool = False):
+    """Откладывает загрузку изменений; reset_token -- следующая будет полной."""
+    async with _connect(db_name) as db:
+        await db.execute(
+            """UPDATE calendar_accounts SET next_pull_at = ?,
+                   sync_token = CASE WHEN ? THEN NULL ELSE sync_token END
+               WHERE user_id = ?""",
+            (next_pull_at, reset_token, user_id)
+        )
+        await db.commit()
+
+@timed_query
+async def apply_calendar_changes(db_name: str, user_id: int, changes: list[dict], sync_token: str,
+                                 next_pull_at: float, category: str) -> dict:
+    """Применяет к заметкам изменения событий календаря одной транзакцией.
+
+    changes -- словари с event_id, etag, cancelled и, для неотмененных
+    событий, note_text, note_date и note_time (None, если событие нельзя
+    представить заметкой). Событие с тем же etag, что у заметки, уже
+    применено и пропускается. Заметки с неотправленным изменением в outbox
+    тоже пропускаются: их версия уйдет в календарь и перезапишет событие.
+    События заметок, перенесенных в архив, тоже пропускаются, иначе
+    изменение такого события вернуло бы заметку как новую. Новые события
+    становятся заметками в категории category, если их срок еще не прошел.
+    Вместе с изменениями сохраняется sync_token, поэтому после сбоя те же
+    изменения будут загружены заново.
+
+    Возвращает число добавленных, измененных, удаленных и пропущенных заметок.
+    """
+    now = time.time()
+    event_ids = [change["event_id"] for change in changes]
+    async with _connect(db_name) as db:
+        existing = {}
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(event_ids), 500):
+            chunk = event_ids[start:start + 500]
+            cursor = await db.execute(f'''
+                SELECT n.id, n.event_id, n.etag, n.due_at, n.note_type, o.note_id IS NOT NULL AS pending
+                FROM notes n LEFT JOIN outbox o ON o.note_id = n.id
+                WHERE n.user_id = ? AND n.event_id IN ({", ".join("?" * len(chunk))})
+            ''', (user_id, *chunk))
+            existing.update((row["event_id"], row) for row in await cursor.fetchall())
+            await cursor.close()
+        archived = set()
+        missing = [event_id for event_id in event_ids if event_id not in existing]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            cursor = await db.execute(f'''
+                SELECT event_id FROM notes_archive
+                WHERE user_id = ? AND event_id IN ({", ".join("?" * len(chunk))})
+            ''', (user_id, *chunk))
+            archived.update(event_id for (event_id,) in await cursor.fetchall())
+            await cursor.close()
+
+        deleted, updated, added = [], [], []
+        skipped = 0
+        for change in changes:
+            note = existing.get(change["event_id"])
+            if change["event_id"] in archived or (
+                    note is not None and (note["pending"] or note["etag"] == change["etag"])):
+                skipped += 1
+            elif change["cancelled"]:
+                if note is not None:
+                    deleted.append(note["id"])
+            elif change["note_text"] is None:
+                skipped += 1
+            else:
+                due_at = to_due_at(change["note_date"], change["note_time"])
+                if note is not None:
+                    updated.append({**change, "id": note["id"], "user_id": user_id, "note_type": note["note_type"],
+                                    "due_at": due_at, "moved": due_at != note["due_at"]})
+                elif due_at > now:
+                    added.append({**change, "due_at": due_at})
+
+        await db.executemany("DELETE FROM notes WHERE id = ?", [(note_id,) for note_id in deleted])
+        await db.executemany(
+            "UPDATE notes SET note_text = ?, note_date = ?, note_time = ?, due_at = ?, etag = ? WHERE id = ?",
+            [(note["note_text"], note["note_date"], note["note_time"], note["due_at"], note["etag"], note["id"])
+             for note in updated]
+        )
+        # Напоминания переносятся вслед за сроком; перенесенные в будущее отправятся снова
+        await db.executemany(
+            """UPDATE reminders SET fire_at = ? - lead,
+                   sent_at = CASE WHEN ? - lead > ? THEN NULL ELSE sent_at END
+               WHERE note_id = ?""",
+            [(note["due_at"], note["due_at"], now, note["id"]) for note in updated if note["moved"]]
+        )
+        if added:
+            category_id, note_type = await _ensure_category(db, user_id, category)
+        for note in added:
+            cursor = await db.execute('''
+                INSERT INTO notes (user_id, note_text, note_type, category_id, note_date, note_time, due_at,
+                                   event_id, etag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, note["note_text"], note_type, category_id, note["note_date"], note["note_time"],
+                  note["due_at"], note["event_id"], note["etag"]))
+            note.update(id=cursor.lastrowid, user_id=user_id, note_type=note_type)
+            note["reminders"] = await _insert_reminders(db, note["id"], note["due_at"], DEFAULT_REMINDER_LEADS)
+        await db.execute(
+            "UPDATE calendar_accounts SET sync_token = ?, next_pull_at = ? WHERE user_id = ?",
+            (sync_token, next_pull_at, user_id)
+        )
+        await db.commit()
+
+        moved = {note["id"]: note for note in updated if note["moved"]}
+        for note in moved.values():
+            note["reminders"] = []
+        for start in range(0, len(moved), 500):
+            chunk = list(moved)[start:start + 500]
+            cursor = await db.execute(
+                f"""SELECT id, note_id, lead, fire_at FROM reminders
+                    WHERE sent_at IS NULL AND note_id IN ({", ".join("?" * len(chunk))})""",
+                chunk
+            )
+            for row in await cursor.fetchall():
+                moved[row["note_id"]]["reminders"].append({"id": row["id"], "lead": row["lead"], "fire_at": row["fire_at"]})
+            await cursor.close()
 
+    for note_id in deleted:
+        _notify("delete", {"id": note_id, "user_id": user_id})
+    for note in updated:
+        _notify("edit", note)
+        if note["moved"]:
+            _notify("reminders", note)
+    for note in added:
+        _notify("add", note)
+    result = {"added": len(added), "updated": len(updated), "deleted": len(deleted), "skipped": skipped}
+    if added or updated or deleted:
+        logger.info("Загружены изменения из Google Календаря", extra={"user_id": user_id, **result})
+    return result
 
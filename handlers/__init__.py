@@ -2,8 +2,17 @@ from aiogram import Router
 from .common import router as common_router
 from .notes import router as notes_router
 from .search import router as search_router
+from .transfer import router as transfer_router
+from .digest import router as digest_router
+from utils.metrics_server import MetricsMiddleware
 
 router = Router()
+metrics_middleware = MetricsMiddleware()
+router.message.outer_middleware(metrics_middleware)
+router.callback_query.outer_middleware(metrics_middleware)
 router.include_router(common_router)
-router.include_router(notes_router)
-router.include_router(search_router)
\ No newline at end of file
+router.include_router(search_router)
+router.include_router(transfer_router)
+router.include_router(digest_router)
+# В notes_router есть обработчик любых сообщений, поэтому он подключается последним
+router.include_router(notes_router)
\ No newline at end of file
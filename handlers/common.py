@@ -26,7 +26,13 @@ async def show_help_handler(callback: types.CallbackQuery):
         "• С заметкой можно делать следующие действия:\n"
         "Внести заметку в гугл-календарь можно с помощью кнопки <b>Синхронизировать с гугл-календарем</b>\n"
         "Также заметку можно редактировать, удалить или отметить как выполненную\n"
-        "• Поиск заметок можно делать с помощью кнопок <b>Поиск по категории</b> и <b>Поиск по дате</b>",
+        "Чтобы удалить или отметить выполненными сразу несколько заметок, нажмите <b>Выбрать несколько</b> в списке заметок\n"
+        "Выполненные заметки и заметки, срок которых прошел больше месяца назад, переносятся в <b>Архив</b> -- он открывается кнопкой в списке заметок\n"
+        "Кнопка <b>Напоминания</b> позволяет выбрать, за сколько до срока бот напомнит о заметке\n"
+        "Кнопка <b>Повторение</b> делает заметку повторяющейся: каждый день, по будням, раз в неделю, месяц или год или по своему правилу RRULE\n"
+        "• Кнопка <b>Ежедневная сводка</b> включает одно утреннее сообщение со всеми заметками на день вместо напоминаний за сутки\n"
+        "• Поиск заметок можно делать с помощью кнопок <b>Поиск по категории</b>, <b>Поиск по дате</b> и <b>Поиск по тексту</b>\n"
+        "• Команда /export выгружает все заметки файлом CSV или .ics, а /import загружает заметки из такого файла",
         reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[
                 [
@@ -0,0 +1,49 @@
+from aiogram import Router, types, F
+from keyboards.digest import generate_digest_keyboard
+from database import get_digest_time, set_digest
+from config import DATABASE_NAME, DIGEST_TIMES
+
+router = Router()
+
+
+def digest_text(digest_time):
+    if digest_time is None:
+        state = "Сводка выключена."
+    else:
+        state = f"Сводка приходит каждый день в <b>{digest_time}</b>."
+    return (
+        "<b>Ежедневная сводка</b>\n\n"
+        "Утром бот пришлет одно сообщение со всеми заметками на день по категориям, "
+        "а отдельные напоминания за сутки до срока приходить перестанут.\n\n"
+        f"{state} Выберите время:"
+    )
+
+
+@router.callback_query(F.data == "digest")
+async def digest_handler(callback: types.CallbackQuery):
+    """Показывает настройку ежедневной сводки"""
+    digest_time = await get_digest_time(DATABASE_NAME, callback.from_user.id)
+    await callback.message.edit_text(
+        digest_text(digest_time),
+        reply_markup=generate_digest_keyboard(digest_time),
+        parse_mode="HTML",
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("digest_set_") | (F.data == "digest_off"))
+async def set_digest_handler(callback: types.CallbackQuery):
+    """Включает сводку в выбранное время или выключает ее"""
+    digest_time = None
+    if callback.data != "digest_off":
+        digest_time = callback.data[len("digest_set_"):]
+        if digest_time not in DIGEST_TIMES:
+            await callback.answer("Это время больше недоступно")
+            return
+    await set_digest(DATABASE_NAME, callback.from_user.id, digest_time)
+    await callback.message.edit_text(
+        digest_text(digest_time),
+        reply_markup=generate_digest_keyboard(digest_time),
+        parse_mode="HTML",
+    )
+    await callback.answer("Сводка выключена" if digest_time is None else f"Сводка в {digest_time}")
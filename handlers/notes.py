@@ -1,16 +1,29 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from handlers.states import AddNoteStates
+from handlers.states import AddNoteStates, SelectNotesStates
 from keyboards.calendar import generate_calendar
 from keyboards.time import generate_hours_keyboard, generate_minutes_keyboard
+from keyboards.reminders import generate_reminders_keyboard
+from keyboards.categories import generate_categories_keyboard
+from keyboards.recurrence import RECURRENCE_PRESETS, generate_recurrence_keyboard
+from utils.categories import category_cache
+from utils.note_cache import note_cache
 from database import (
     add_note,
-    get_user_notes,
     delete_note,
-    get_note_by_id,
+    delete_notes,
+    complete_notes,
     edit_notes,
+    save_as_complete as complete_note,
+    get_note_reminders,
+    toggle_note_reminder,
+    set_note_rrule,
+    category_name,
+    get_archived_notes_page,
+    count_archived_notes,
 )
+from utils.recurrence import RecurrenceError, describe_rule, parse_rule
 from datetime import datetime, date, timedelta
 from config import DATABASE_NAME
 
@@ -41,30 +54,68 @@ async def process_note_type(message: types.Message, state: FSMContext):
     """Обрабатывает текст заметки и запрашивает категорию"""
     await state.update_data(note_text=message.text)
     await state.set_state(AddNoteStates.waiting_for_type)
+    categories = await category_cache.get(message.from_user.id)
     await message.answer(
-        "Введите категорию:",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="Отмена", callback_data="back_to_main"
-                    )
-                ]
-            ]
+        "Выберите категорию или введите новую:"
+        if categories
+        else "Введите категорию:",
+        reply_markup=generate_categories_keyboard(
+            categories, "note_category_"
         ),
     )
 
 
-@router.message(AddNoteStates.waiting_for_type)
+@router.message(AddNoteStates.waiting_for_type, F.text)
 async def process_note_type(message: types.Message, state: FSMContext):
     """Обрабатывает категорию заметки и запрашивает часы"""
-    await state.update_data(note_type=message.text)
+    note_type = category_name(message.text)
+    if not note_type:
+        await message.answer("Название категории не может быть пустым")
+        return
+    await state.update_data(note_type=note_type)
     await state.set_state(AddNoteStates.waiting_for_hour)
     await message.answer(
         "Выберите час:", reply_markup=generate_hours_keyboard()
     )
 
 
+@router.callback_query(
+    F.data.startswith("note_category_page_"), AddNoteStates.waiting_for_type
+)
+async def category_page_handler(callback: types.CallbackQuery):
+    """Листает клавиатуру категорий при добавлении заметки"""
+    page = int(callback.data.split("_")[3])
+    categories = await category_cache.get(callback.from_user.id)
+    await callback.message.edit_reply_markup(
+        reply_markup=generate_categories_keyboard(
+            categories, "note_category_", page
+        )
+    )
+    await callback.answer()
+
+
+@router.callback_query(
+    F.data.startswith("note_category_"), AddNoteStates.waiting_for_type
+)
+async def process_category_selection(
+    callback: types.CallbackQuery, state: FSMContext
+):
+    """Обрабатывает выбор существующей категории и запрашивает часы"""
+    category_id = int(callback.data.split("_")[2])
+    note_type = await category_cache.get_name(
+        callback.from_user.id, category_id
+    )
+    if note_type is None:
+        await callback.answer("Категория не найдена", show_alert=True)
+        return
+    await state.update_data(note_type=note_type)
+    await state.set_state(AddNoteStates.waiting_for_hour)
+    await callback.message.edit_text(
+        "Выберите час:", reply_markup=generate_hours_keyboard()
+    )
+    await callback.answer()
+
+
 @router.callback_query(
     F.data.startswith("select_hour_"), AddNoteStates.waiting_for_hour
 )
@@ -219,97 +270,335 @@ async def process_calendar_selection(
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("list_notes"))
-async def list_notes_handler(callback: types.CallbackQuery):
-    """Показывает список заметок с пагинацией по 10 штук"""
-    user_id = callback.from_user.id
-    if callback.data != "list_notes":
-        page = int(callback.data.split("_")[2])
+NOTES_PER_PAGE = 10
+
+
+async def load_notes_page(user_id: int, page_data: str):
+    """Читает страницу списка заметок
+
+    page_data -- часть callback_data после префикса: пустая строка для
+    первой страницы или _{n|p}_{номер}_{due_at}_{id}, где n -- заметки
+    после указанной, p -- перед ней. Возвращает номер страницы, заметки
+    страницы и число страниц.
+    """
+    if page_data:
+        _, direction, page, due_at, note_id = page_data.split("_")
+        page = int(page)
+        notes_page = await note_cache.get_user_notes_page(
+            user_id,
+            (int(due_at), int(note_id)),
+            backward=direction == "p",
+            limit=NOTES_PER_PAGE,
+        )
     else:
         page = 0
-    all_notes = await get_user_notes(DATABASE_NAME, user_id)
+        notes_page = await note_cache.get_user_notes_page(
+            user_id, limit=NOTES_PER_PAGE
+        )
+    total = await note_cache.count_user_notes(user_id)
 
-    if not all_notes:
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="Добавить заметку", callback_data="add_note"
-                    )
-                ],
-                [
-                    InlineKeyboardButton(
-                        text="В главное меню", callback_data="back_to_main"
-                    )
-                ],
-            ]
+    if total and not notes_page:
+        # Заметки страницы успели удалить -- начинаем список сначала
+        page = 0
+        notes_page = await note_cache.get_user_notes_page(
+            user_id, limit=NOTES_PER_PAGE
+        )
+    total_pages = (total + NOTES_PER_PAGE - 1) // NOTES_PER_PAGE
+    page = min(page, max(total_pages - 1, 0))
+    return page, notes_page, total_pages
+
+
+def short_note_text(note):
+    return (
+        note["note_text"][:25] + "..."
+        if len(note["note_text"]) > 25
+        else note["note_text"]
+    )
+
+
+def pagination_row(prefix, page, total_pages, notes_page):
+    """Кнопки перехода между страницами с callback_data {prefix}_{n|p}_{номер}_{due_at}_{id}"""
+    pagination_buttons = []
+    first, last = notes_page[0], notes_page[-1]
+    if page > 0:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"{prefix}_p_{page - 1}_{first['due_at']}_{first['id']}",
+            )
+        )
+    if page < total_pages - 1:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"{prefix}_n_{page + 1}_{last['due_at']}_{last['id']}",
+            )
         )
+    return pagination_buttons
+
+
+def no_notes_kb():
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="Добавить заметку", callback_data="add_note"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="В главное меню", callback_data="back_to_main"
+                )
+            ],
+        ]
+    )
+
+
+@router.callback_query(F.data.startswith("list_notes"))
+async def list_notes_handler(callback: types.CallbackQuery, state: FSMContext):
+    """Показывает список заметок с пагинацией по 10 штук
+
+    callback_data страниц: list_notes_{n|p}_{номер}_{due_at}_{id}, где
+    n -- заметки после указанной, p -- перед ней.
+    """
+    if await state.get_state() == SelectNotesStates.selecting.state:
+        # Возврат к списку завершает режим выбора
+        await state.clear()
+    user_id = callback.from_user.id
+    page_data = callback.data[len("list_notes"):]
+    page, notes_page, total_pages = await load_notes_page(user_id, page_data)
+
+    if not notes_page:
         await callback.message.edit_text(
-            "У вас пока нет заметок", reply_markup=keyboard
+            "У вас пока нет заметок", reply_markup=no_notes_kb()
         )
         await callback.answer()
         return
 
-    total_pages = (len(all_notes) + 9) // 10
-    notes_page = all_notes[page * 10 : (page + 1) * 10]
-
     keyboard_buttons = []
     for note in notes_page:
-        note_text_short = (
-            note["note_text"][:25] + "..."
-            if len(note["note_text"]) > 25
-            else note["note_text"]
-        )
         keyboard_buttons.append(
             [
                 InlineKeyboardButton(
-                    text=f"{note['note_date']}, {note['note_time']} - {note_text_short}, категория: {note['note_type']}",
+                    text=f"{'🔁 ' if note['rrule'] else ''}{note['note_date']}, {note['note_time']} - {short_note_text(note)}, категория: {note['note_type']}",
                     callback_data=f"view_{note['id']}",
                 )
             ]
         )
 
-    pagination_buttons = []
-    if page > 0:
-        pagination_buttons.append(
+    pagination_buttons = pagination_row("list_notes", page, total_pages, notes_page)
+    if pagination_buttons:
+        keyboard_buttons.append(pagination_buttons)
+
+    keyboard_buttons.append(
+        [
             InlineKeyboardButton(
-                text="⬅️ Назад", callback_data=f"list_notes_{page - 1}"
-            )
-        )
-    if page < total_pages - 1:
-        pagination_buttons.append(
+                text="Выбрать несколько", callback_data=f"bulk_start{page_data}"
+            ),
+            InlineKeyboardButton(text="Архив", callback_data="archive"),
+        ]
+    )
+    keyboard_buttons.append(
+        [
             InlineKeyboardButton(
-                text="Вперед ➡️", callback_data=f"list_notes_{page + 1}"
-            )
+                text="Добавить новую заметку", callback_data="add_note"
+            ),
+            InlineKeyboardButton(
+                text="В главное меню", callback_data="back_to_main"
+            ),
+        ]
+    )
+
+    await callback.message.edit_text(
+        f"Ваши заметки (страница {page + 1} из {total_pages}):",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons),
+    )
+    await callback.answer()
+
+
+async def show_selection(callback: types.CallbackQuery, state: FSMContext):
+    """Показывает страницу списка в режиме выбора нескольких заметок
+
+    Выбранные ID и текущая страница хранятся в данных FSM (selected и
+    page), поэтому в callback_data кнопок только ID заметки.
+    """
+    user_data = await state.get_data()
+    selected = set(user_data.get("selected", []))
+    page, notes_page, total_pages = await load_notes_page(
+        callback.from_user.id, user_data.get("page", "")
+    )
+
+    if not notes_page:
+        await state.clear()
+        await callback.message.edit_text(
+            "У вас пока нет заметок", reply_markup=no_notes_kb()
+        )
+        return
+
+    keyboard_buttons = []
+    for note in notes_page:
+        mark = "☑️" if note["id"] in selected else "▫️"
+        keyboard_buttons.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{mark} {note['note_date']}, {note['note_time']} - {short_note_text(note)}",
+                    callback_data=f"bulk_toggle_{note['id']}",
+                )
+            ]
         )
 
+    pagination_buttons = pagination_row("bulk_page", page, total_pages, notes_page)
     if pagination_buttons:
         keyboard_buttons.append(pagination_buttons)
 
     keyboard_buttons.append(
         [
             InlineKeyboardButton(
-                text="Добавить новую заметку", callback_data="add_note"
+                text=f"Удалить ({len(selected)})", callback_data="bulk_delete"
             ),
             InlineKeyboardButton(
-                text="В главное меню", callback_data="back_to_main"
+                text=f"Выполнено ({len(selected)})", callback_data="bulk_complete"
             ),
         ]
     )
+    keyboard_buttons.append(
+        [
+            InlineKeyboardButton(
+                text="Отмена", callback_data=f"list_notes{user_data.get('page', '')}"
+            )
+        ]
+    )
 
     await callback.message.edit_text(
-        f"Ваши заметки (страница {page + 1} из {total_pages}):",
+        f"Выберите заметки (страница {page + 1} из {total_pages}, выбрано: {len(selected)}):",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons),
+    )
+
+
+@router.callback_query(F.data.startswith("archive"))
+async def archive_handler(callback: types.CallbackQuery):
+    """Показывает архив заметок по 10 штук, от новых к старым
+
+    Архив читается из базы только здесь, по запросу. callback_data
+    страниц: archive_{n|p}_{номер}_{due_at}_{id}, как у списка заметок.
+    """
+    user_id = callback.from_user.id
+    page = 0
+    cursor = None
+    backward = False
+    if callback.data != "archive":
+        _, direction, page, due_at, note_id = callback.data.split("_")
+        page = int(page)
+        cursor = (int(due_at), int(note_id))
+        backward = direction == "p"
+    notes_page = await get_archived_notes_page(
+        DATABASE_NAME, user_id, cursor, backward=backward, limit=NOTES_PER_PAGE
+    )
+    total = await count_archived_notes(DATABASE_NAME, user_id)
+    if total and not notes_page:
+        page = 0
+        notes_page = await get_archived_notes_page(
+            DATABASE_NAME, user_id, limit=NOTES_PER_PAGE
+        )
+    total_pages = (total + NOTES_PER_PAGE - 1) // NOTES_PER_PAGE
+    page = min(page, max(total_pages - 1, 0))
+
+    back_button = [
+        InlineKeyboardButton(text="Назад к списку", callback_data="list_notes")
+    ]
+    if not notes_page:
+        await callback.message.edit_text(
+            "Архив пуст",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[back_button]),
+        )
+        await callback.answer()
+        return
+
+    lines = [f"Архив заметок (страница {page + 1} из {total_pages}):"]
+    for note in notes_page:
+        lines.append(
+            f"{'🔁 ' if note['rrule'] else ''}{note['note_date']}, {note['note_time']} - "
+            f"{note['note_text'][:100]}, категория: {note['note_type']}"
+        )
+    keyboard_buttons = []
+    pagination_buttons = pagination_row("archive", page, total_pages, notes_page)
+    if pagination_buttons:
+        keyboard_buttons.append(pagination_buttons)
+    keyboard_buttons.append(back_button)
+
+    await callback.message.edit_text(
+        "\n".join(lines),
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons),
     )
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith(("bulk_start", "bulk_page")))
+async def bulk_page_handler(callback: types.CallbackQuery, state: FSMContext):
+    """Включает режим выбора заметок или листает список в нем"""
+    if callback.data.startswith("bulk_start"):
+        await state.set_state(SelectNotesStates.selecting)
+        await state.update_data(selected=[], page=callback.data[len("bulk_start"):])
+    else:
+        await state.update_data(page=callback.data[len("bulk_page"):])
+    await show_selection(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("bulk_toggle_"), SelectNotesStates.selecting)
+async def bulk_toggle_handler(callback: types.CallbackQuery, state: FSMContext):
+    """Отмечает заметку или снимает отметку"""
+    note_id = int(callback.data.split("_")[2])
+    selected = list((await state.get_data()).get("selected", []))
+    if note_id in selected:
+        selected.remove(note_id)
+    else:
+        selected.append(note_id)
+    await state.update_data(selected=selected)
+    await show_selection(callback, state)
+    await callback.answer()
+
+
+@router.callback_query(F.data.in_({"bulk_delete", "bulk_complete"}), SelectNotesStates.selecting)
+async def bulk_action_handler(callback: types.CallbackQuery, state: FSMContext):
+    """Удаляет выбранные заметки или отмечает их выполненными одной транзакцией"""
+    selected = (await state.get_data()).get("selected", [])
+    if not selected:
+        await callback.answer("Сначала отметьте заметки", show_alert=True)
+        return
+    if callback.data == "bulk_delete":
+        count = await delete_notes(DATABASE_NAME, callback.from_user.id, selected)
+        text = f"Удалено заметок: {count}"
+    else:
+        count = await complete_notes(DATABASE_NAME, callback.from_user.id, selected)
+        text = f"Отмечено выполненными: {count}"
+        if count < len(selected):
+            text += "\nПовторяющиеся и уже выполненные заметки не отмечаются"
+    await state.clear()
+    await callback.message.edit_text(
+        text,
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text="Посмотреть все заметки", callback_data="list_notes")],
+                [InlineKeyboardButton(text="В главное меню", callback_data="back_to_main")],
+            ]
+        ),
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith(("bulk_toggle_", "bulk_delete", "bulk_complete")))
+async def bulk_expired_handler(callback: types.CallbackQuery):
+    """Кнопки режима выбора после того, как он закончился"""
+    await callback.answer("Режим выбора закончился, откройте список заново", show_alert=True)
+
+
 @router.callback_query(F.data.startswith("view_"))
 async def view_note_handler(callback: types.CallbackQuery):
     """Показывает полный текст заметки"""
     note_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
-    note = await get_note_by_id(DATABASE_NAME, note_id, user_id)
+    note = await note_cache.get_note_by_id(note_id, user_id)
 
     if not note:
         await callback.answer("Заметка не найдена", show_alert=True)
@@ -329,11 +618,22 @@ async def view_note_handler(callback: types.CallbackQuery):
                 )
             ],
             [
+                InlineKeyboardButton(
+                    text="Напоминания", callback_data=f"reminders_{note_id}"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="Повторение", callback_data=f"recurrence_{note_id}"
+                )
+            ],
+            # Серию целиком выполненной не отмечают (см. database.save_as_complete)
+            *([] if note["rrule"] else [[
                 InlineKeyboardButton(
                     text="Отметить как выполненное",
                     callback_data=f"complete_{note_id}",
                 )
-            ],
+            ]]),
             [
                 InlineKeyboardButton(
                     text="Удалить", callback_data=f"delete_{note_id}"
@@ -348,13 +648,120 @@ async def view_note_handler(callback: types.CallbackQuery):
     )
 
     await callback.message.edit_text(
-        f"Заметка от {note['note_type']} {note['note_time']} в категории \"{note['note_date']}\":\n\n"
-        f"{note['note_text']}",
+        f"Заметка от {note['note_date']} {note['note_time']} в категории \"{note['note_type']}\":\n\n"
+        f"{note['note_text']}"
+        + (f"\n\n🔁 Повторяется {describe_rule(parse_rule(note['rrule']))}" if note["rrule"] else ""),
         reply_markup=keyboard,
     )
     await callback.answer()
 
 
+def recurrence_text(rrule):
+    if not rrule:
+        return "Заметка не повторяется. Как ее повторять?"
+    return f"Заметка повторяется {describe_rule(parse_rule(rrule))}. Изменить повторение:"
+
+
+@router.callback_query(F.data.startswith("recurrence_"))
+async def recurrence_handler(callback: types.CallbackQuery):
+    """Показывает варианты повторения заметки"""
+    note_id = int(callback.data.split("_")[1])
+    note = await note_cache.get_note_by_id(note_id, callback.from_user.id)
+    if not note:
+        await callback.answer("Заметка не найдена", show_alert=True)
+        return
+    await callback.message.edit_text(
+        recurrence_text(note["rrule"]),
+        reply_markup=generate_recurrence_keyboard(note_id, note["rrule"]),
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("rrule_"))
+async def set_recurrence_handler(callback: types.CallbackQuery, state: FSMContext):
+    """Сохраняет выбранное повторение или просит ввести свое правило"""
+    _, note_id, preset = callback.data.split("_")
+    note_id = int(note_id)
+    if preset == "custom":
+        await state.set_state(AddNoteStates.waiting_for_rrule)
+        await state.update_data(note_id=note_id)
+        await callback.message.edit_text(
+            "Пришлите правило в формате RRULE, например "
+            "<code>FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=10</code>.\n\n"
+            "Поддерживаются FREQ (DAILY, WEEKLY, MONTHLY, YEARLY), INTERVAL, "
+            "BYDAY для WEEKLY, BYMONTHDAY для MONTHLY и YEARLY, COUNT и UNTIL (ГГГГММДД).",
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(text="Отмена", callback_data=f"recurrence_{note_id}")]
+                ]
+            ),
+        )
+        await callback.answer()
+        return
+    rrule = None if preset == "none" else RECURRENCE_PRESETS[preset][1]
+    if not await set_note_rrule(DATABASE_NAME, callback.from_user.id, note_id, rrule):
+        await callback.answer("Заметка не найдена", show_alert=True)
+        return
+    await callback.message.edit_text(
+        recurrence_text(rrule),
+        reply_markup=generate_recurrence_keyboard(note_id, rrule),
+    )
+    await callback.answer("Повторение сохранено")
+
+
+@router.message(AddNoteStates.waiting_for_rrule, F.text)
+async def process_rrule(message: types.Message, state: FSMContext):
+    """Сохраняет правило повторения, введенное текстом"""
+    user_data = await state.get_data()
+    note_id = user_data["note_id"]
+    try:
+        found = await set_note_rrule(DATABASE_NAME, message.from_user.id, note_id, message.text)
+    except RecurrenceError as e:
+        await message.answer(f"Не удалось разобрать правило: {e}. Попробуйте еще раз или нажмите /start")
+        return
+    await state.clear()
+    if not found:
+        await message.answer("Заметка не найдена. Нажмите /start")
+        return
+    note = await note_cache.get_note_by_id(note_id, message.from_user.id)
+    await message.answer(
+        recurrence_text(note["rrule"]),
+        reply_markup=generate_recurrence_keyboard(note_id, note["rrule"]),
+    )
+
+
+@router.callback_query(F.data.startswith("reminders_"))
+async def reminders_handler(callback: types.CallbackQuery):
+    """Показывает напоминания заметки"""
+    note_id = int(callback.data.split("_")[1])
+    reminders = await get_note_reminders(
+        DATABASE_NAME, note_id, callback.from_user.id
+    )
+    await callback.message.edit_text(
+        "Выберите, за сколько до срока напомнить о заметке:",
+        reply_markup=generate_reminders_keyboard(
+            note_id, [reminder["lead"] for reminder in reminders]
+        ),
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("toggle_reminder_"))
+async def toggle_reminder_handler(callback: types.CallbackQuery):
+    """Включает или выключает напоминание заметки"""
+    note_id, lead = map(int, callback.data.split("_")[2:4])
+    user_id = callback.from_user.id
+    await toggle_note_reminder(DATABASE_NAME, user_id, note_id, lead)
+    reminders = await get_note_reminders(DATABASE_NAME, note_id, user_id)
+    await callback.message.edit_reply_markup(
+        reply_markup=generate_reminders_keyboard(
+            note_id, [reminder["lead"] for reminder in reminders]
+        )
+    )
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("delete_"))
 async def delete_note_handler(callback: types.CallbackQuery):
     """Удаляет заметку"""
@@ -436,11 +843,18 @@ async def process_edit(message: types.Message, state: FSMContext):
 async def save_as_complete(callback: types.CallbackQuery):
      """Обработка нажатия кнопки 'Отметить как выполненное'"""
      note_id = int(callback.data.split("_")[1])
-     note_data = await get_note_by_id(
-        DATABASE_NAME, note_id, callback.from_user.id
+     note_data = await note_cache.get_note_by_id(
+        note_id, callback.from_user.id
     )
      new_text = f"{note_data['note_text']} ✅"
-     await edit_notes(DATABASE_NAME, callback.from_user.id, note_id, new_text)
+     if not await complete_note(
+        DATABASE_NAME, callback.from_user.id, note_id, new_text
+    ):
+         await callback.answer(
+             "Повторяющуюся заметку нельзя отметить выполненной: отключите повторение или удалите ее",
+             show_alert=True,
+         )
+         return
      keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
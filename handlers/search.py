@@ -1,11 +1,22 @@
+import html
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from handlers.states import SearchStates, AddNoteStates
 from keyboards.calendar import generate_calendar
-from database import get_notes_by_date, get_notes_by_type
+from keyboards.categories import generate_categories_keyboard
+from utils.categories import category_cache
+from database import (
+    get_notes_by_date,
+    get_notes_by_type,
+    get_notes_by_category,
+    search_notes,
+    link_calendar,
+    HIGHLIGHT_START,
+    HIGHLIGHT_END,
+)
 from datetime import datetime, date, timedelta
-from config import DATABASE_NAME
+from config import DATABASE_NAME, GOOGLE_CALENDAR_ENABLED
 
 router = Router()
 
@@ -27,6 +38,11 @@ async def show_notes_handler(callback: types.CallbackQuery):
                         text="Поиск по дате", callback_data="show_by_date"
                     )
                 ],
+                [
+                    InlineKeyboardButton(
+                        text="Поиск по тексту", callback_data="show_by_text"
+                    )
+                ],
                 [
                     InlineKeyboardButton(
                         text="Назад", callback_data="back_to_main"
@@ -42,31 +58,63 @@ async def show_notes_handler(callback: types.CallbackQuery):
 async def ask_type_for_notes_handler(
     callback: types.CallbackQuery, state: FSMContext
 ):
-    """Запрашивает категорию для поиска задач"""
+    """Предлагает выбрать категорию для поиска задач"""
+    categories = await category_cache.get(callback.from_user.id)
     await callback.message.edit_text(
-        "Введите категорию задач:",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="Отмена", callback_data="back_to_main"
-                    )
-                ]
-            ]
-        ),
+        "Выберите категорию задач или введите её название:"
+        if categories
+        else "Введите категорию задач:",
+        reply_markup=generate_categories_keyboard(categories, "type_search_"),
         parse_mode="HTML",
     )
-    await state.set_state(AddNoteStates.type_input.strip())
+    await state.set_state(AddNoteStates.type_input)
     await callback.answer()
 
 
 @router.message(AddNoteStates.type_input, F.text)
 async def handle_type_search(message: types.Message, state: FSMContext):
-    """Обрабатывает поиск задач по категории"""
+    """Обрабатывает поиск задач по введенной категории"""
     search_type = message.text.strip()
-    user_id = message.from_user.id
-    notes = await get_notes_by_type(DATABASE_NAME, user_id, search_type)
+    notes = await get_notes_by_type(
+        DATABASE_NAME, message.from_user.id, search_type
+    )
+    text, keyboard = build_type_search_result(search_type, notes)
+    await message.answer(text, reply_markup=keyboard)
+    if notes:
+        await state.clear()
+
+
+@router.callback_query(F.data.startswith("type_search_page_"))
+async def type_search_page_handler(callback: types.CallbackQuery):
+    """Листает клавиатуру категорий поиска"""
+    page = int(callback.data.split("_")[3])
+    categories = await category_cache.get(callback.from_user.id)
+    await callback.message.edit_reply_markup(
+        reply_markup=generate_categories_keyboard(categories, "type_search_", page)
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("type_search_"))
+async def type_search_handler(
+    callback: types.CallbackQuery, state: FSMContext
+):
+    """Обрабатывает поиск задач по выбранной на клавиатуре категории"""
+    category_id = int(callback.data.split("_")[2])
+    user_id = callback.from_user.id
+    search_type = await category_cache.get_name(user_id, category_id)
+    if search_type is None:
+        await callback.answer("Категория не найдена", show_alert=True)
+        return
+    notes = await get_notes_by_category(DATABASE_NAME, user_id, category_id)
+    text, keyboard = build_type_search_result(search_type, notes)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await state.clear()
+    await callback.answer()
 
+
+def build_type_search_result(search_type: str, notes: list[dict]):
+    """Возвращает текст и клавиатуру результатов поиска по категории"""
     if not notes:
         keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
@@ -83,11 +131,7 @@ async def handle_type_search(message: types.Message, state: FSMContext):
                 ],
             ]
         )
-        await message.answer(
-            f"В категории {search_type} заметок не найдено",
-            reply_markup=keyboard,
-        )
-        return
+        return f"В категории {search_type} заметок не найдено", keyboard
 
     message_text = f"Заметки в категории {search_type}:\n\n"
     for note in notes:
@@ -113,9 +157,7 @@ async def handle_type_search(message: types.Message, state: FSMContext):
             ],
         ]
     )
-
-    await message.answer(message_text, reply_markup=keyboard)
-    await state.clear()
+    return message_text, keyboard
 
 
 @router.callback_query(F.data == "show_by_date")
@@ -208,7 +250,7 @@ async def handle_date_search(callback: types.CallbackQuery, search_date: date):
 
     message_text = f"Заметки на {search_date.strftime('%d-%m-%Y')}:\n\n"
     for note in notes:
-        message_text += f"{note['note_time']} - {note['note_text']} в категории \"{note['note_type']}\"\n"
+        message_text += f"{'🔁 ' if note['rrule'] else ''}{note['note_time']} - {note['note_text']} в категории \"{note['note_type']}\"\n"
 
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -233,6 +275,126 @@ async def handle_date_search(callback: types.CallbackQuery, search_date: date):
     await callback.message.edit_text(message_text, reply_markup=keyboard)
 
 
+SEARCH_RESULTS_PER_PAGE = 5
+
+
+@router.callback_query(F.data == "show_by_text")
+async def ask_text_for_notes_handler(
+    callback: types.CallbackQuery, state: FSMContext
+):
+    """Запрашивает слова для поиска по тексту заметок"""
+    await state.set_state(SearchStates.waiting_for_text_query)
+    await callback.message.edit_text(
+        "Введите слова для поиска (можно начало слова):",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="Отмена", callback_data="back_to_main"
+                    )
+                ]
+            ]
+        ),
+    )
+    await callback.answer()
+
+
+@router.message(SearchStates.waiting_for_text_query, F.text)
+async def handle_text_search(message: types.Message, state: FSMContext):
+    """Обрабатывает поиск заметок по тексту"""
+    # Запрос остается в данных FSM для перелистывания страниц
+    await state.set_state(None)
+    await state.update_data(search_query=message.text)
+    text, keyboard = await build_text_search_page(
+        message.from_user.id, message.text, 0
+    )
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("text_search_"))
+async def text_search_page_handler(
+    callback: types.CallbackQuery, state: FSMContext
+):
+    """Показывает следующую или предыдущую страницу результатов поиска"""
+    page = int(callback.data.split("_")[2])
+    query = (await state.get_data()).get("search_query")
+    if query is None:
+        await callback.answer("Поиск устарел, начните заново", show_alert=True)
+        return
+    text, keyboard = await build_text_search_page(
+        callback.from_user.id, query, page
+    )
+    await callback.message.edit_text(
+        text, reply_markup=keyboard, parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+async def build_text_search_page(user_id: int, query: str, page: int):
+    """Возвращает текст и клавиатуру страницы результатов поиска по тексту"""
+    notes = await search_notes(
+        DATABASE_NAME,
+        user_id,
+        query,
+        offset=page * SEARCH_RESULTS_PER_PAGE,
+        limit=SEARCH_RESULTS_PER_PAGE + 1,
+    )
+    has_next = len(notes) > SEARCH_RESULTS_PER_PAGE
+    notes = notes[:SEARCH_RESULTS_PER_PAGE]
+
+    keyboard_buttons = []
+    if notes:
+        message_text = f"Найдено по запросу «{html.escape(query)}»:\n\n"
+        for note in notes:
+            note_text = (
+                html.escape(note["note_text"])
+                .replace(HIGHLIGHT_START, "<b>")
+                .replace(HIGHLIGHT_END, "</b>")
+            )
+            message_text += f"{note['note_date']} {note['note_time']} - {note_text}\n"
+            keyboard_buttons.append(
+                [
+                    InlineKeyboardButton(
+                        text=f"{note['note_date']} {note['note_time']} - "
+                        + note["note_text"]
+                        .replace(HIGHLIGHT_START, "")
+                        .replace(HIGHLIGHT_END, "")[:25],
+                        callback_data=f"view_{note['id']}",
+                    )
+                ]
+            )
+    else:
+        message_text = f"По запросу «{html.escape(query)}» заметок не найдено"
+
+    pagination_buttons = []
+    if page > 0:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад", callback_data=f"text_search_{page - 1}"
+            )
+        )
+    if has_next:
+        pagination_buttons.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️", callback_data=f"text_search_{page + 1}"
+            )
+        )
+    if pagination_buttons:
+        keyboard_buttons.append(pagination_buttons)
+
+    keyboard_buttons.append(
+        [
+            InlineKeyboardButton(
+                text="Искать другое", callback_data="show_by_text"
+            ),
+            InlineKeyboardButton(
+                text="В главное меню", callback_data="back_to_main"
+            ),
+        ]
+    )
+    return message_text, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+
 @router.callback_query(F.data.startswith("synchronize_"))
 async def synchronize(callback: types.CallbackQuery, state: FSMContext):
     """Запрашивает ввод почты"""
@@ -261,11 +423,6 @@ async def synchronize(callback: types.CallbackQuery, state: FSMContext):
 async def process_note_text(message: types.Message, state: FSMContext):
     """Обрабатывает почту и запрашивает категорию"""
     mail = message.text.strip().lower()
-    user_data = await state.get_data()
-    note = await get_note_by_id(
-        DATABASE_NAME, user_data["note_id"], message.from_user.id
-    )
-    date_time = f'{note["note_date"]} {note["note_time"]}'
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
@@ -281,8 +438,22 @@ async def process_note_text(message: types.Message, state: FSMContext):
         ]
     )
 
+    if not GOOGLE_CALENDAR_ENABLED:
+        await state.clear()
+        await message.answer(
+            f"Вам на почту придет ссылка, по которой надо перейти для синхронизации.",
+            reply_markup=keyboard,
+            parse_mode="HTML",
+        )
+        return
+
+    # События отправляет фоновая синхронизация, пользователь ее не ждет
+    await link_calendar(DATABASE_NAME, message.from_user.id, mail)
+    await state.clear()
     await message.answer(
-        f"Вам на почту придет ссылка, по которой надо перейти для синхронизации.",
+        f"Заметки появятся в Google Календаре {html.escape(mail)}. "
+        f"Новые и измененные заметки будут синхронизироваться автоматически, "
+        f"а изменения событий в календаре -- попадать в заметки.",
         reply_markup=keyboard,
         parse_mode="HTML",
     )
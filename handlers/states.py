@@ -11,7 +11,17 @@ class AddNoteStates(StatesGroup):
     type_input = State()
     hour_input = State()
     synchronize = State()
+    waiting_for_rrule = State()
+
+
+class SelectNotesStates(StatesGroup):
+    selecting = State()
 
 
 class SearchStates(StatesGroup):
     waiting_for_search_date = State()
+    waiting_for_text_query = State()
+
+
+class TransferStates(StatesGroup):
+    waiting_for_file = State()
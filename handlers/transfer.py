@@ -0,0 +1,100 @@
+import io
+import tempfile
+from aiogram import Bot, Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from handlers.states import TransferStates
+from database import count_user_notes, import_notes
+from utils.transfer import FORMATS, NoteReader, NotesExportFile, detect_format
+from config import DATABASE_NAME, IMPORT_MAX_FILE_SIZE
+
+router = Router()
+
+
+def export_format_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="CSV (таблица)", callback_data="export_csv"),
+                InlineKeyboardButton(text="iCalendar (.ics)", callback_data="export_ics"),
+            ],
+            [InlineKeyboardButton(text="Назад", callback_data="back_to_main")],
+        ]
+    )
+
+
+async def send_export(message: types.Message, user_id: int, fmt: str):
+    """Отправляет заметки пользователя файлом, выгруженным из базы на диск перед отправкой"""
+    count = await count_user_notes(DATABASE_NAME, user_id, expand_series=False)
+    if not count:
+        await message.answer("У вас пока нет заметок для выгрузки")
+        return
+    with NotesExportFile(user_id, fmt, DATABASE_NAME) as document:
+        await document.fill()
+        await message.answer_document(document, caption=f"Заметок в файле: {count}")
+
+
+@router.message(Command("export"))
+async def export_command_handler(message: types.Message, command: CommandObject):
+    """Обработчик команды /export [csv|ics]"""
+    fmt = (command.args or "").strip().lower().lstrip(".")
+    if fmt in FORMATS:
+        await send_export(message, message.from_user.id, fmt)
+        return
+    await message.answer("В каком формате выгрузить заметки?", reply_markup=export_format_kb())
+
+
+@router.callback_query(F.data.in_({"export_csv", "export_ics"}))
+async def export_callback_handler(callback: types.CallbackQuery):
+    """Выгружает заметки в выбранном на клавиатуре формате"""
+    await callback.answer("Готовлю файл...")
+    await send_export(callback.message, callback.from_user.id, callback.data.split("_")[1])
+
+
+@router.message(Command("import"))
+async def import_command_handler(message: types.Message, state: FSMContext):
+    """Обработчик команды /import: ждет файл с заметками"""
+    await message.answer(
+        "Пришлите файл <b>.csv</b> или <b>.ics</b>.\n\n"
+        "В CSV нужны колонки <code>date,time,category,text</code> "
+        "(как в файле из /export), дата в виде ДД-ММ-ГГГГ; в необязательной "
+        "колонке <code>rrule</code> -- правило повторения.\n"
+        "Файл .ics можно выгрузить из Google Календаря или другого календаря.",
+        parse_mode="HTML",
+    )
+    await state.set_state(TransferStates.waiting_for_file)
+
+
+@router.message(TransferStates.waiting_for_file, F.document)
+async def import_file_handler(message: types.Message, state: FSMContext, bot: Bot):
+    """Загружает заметки из присланного файла"""
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await message.answer(f"Файл слишком большой: можно не больше {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ")
+        return
+    await state.clear()
+    with tempfile.TemporaryFile() as data:
+        # Файл скачивается на диск по частям и читается оттуда построчно
+        await bot.download(document, destination=data)
+        fmt = detect_format(document.file_name, data.read(64))
+        data.seek(0)
+        if fmt is None:
+            await message.answer("Не удалось определить формат файла: пришлите .csv или .ics")
+            return
+        progress = await message.answer("Загружаю заметки...")
+        reader = NoteReader(io.TextIOWrapper(data, encoding="utf-8-sig", newline=""), fmt)
+        imported = await import_notes(DATABASE_NAME, message.from_user.id, reader)
+
+    text = f"Загружено заметок: {imported}"
+    if reader.skipped:
+        text += f"\nПропущено записей, которые не удалось разобрать: {reader.skipped}"
+    if reader.error:
+        text += f"\nФайл прочитан не до конца: {reader.error}"
+    await progress.edit_text(text)
+
+
+@router.message(TransferStates.waiting_for_file)
+async def import_waiting_handler(message: types.Message):
+    """Напоминает, что для загрузки нужен файл"""
+    await message.answer("Пришлите файл .csv или .ics документом или нажмите /start")
@@ -1,10 +1,18 @@
 from .builders import main_menu_kb
 from .calendar import generate_calendar
 from .time import generate_hours_keyboard, generate_minutes_keyboard
+from .reminders import generate_reminders_keyboard
+from .categories import generate_categories_keyboard
+from .recurrence import generate_recurrence_keyboard
+from .digest import generate_digest_keyboard
 
 __all__ = [
     'main_menu_kb',
     'generate_calendar',
     'generate_hours_keyboard',
-    'generate_minutes_keyboard'
+    'generate_minutes_keyboard',
+    'generate_reminders_keyboard',
+    'generate_categories_keyboard',
+    'generate_recurrence_keyboard',
+    'generate_digest_keyboard'
 ]
\ No newline at end of file
@@ -5,5 +5,6 @@ def main_menu_kb():
         [InlineKeyboardButton(text="Добавить заметку", callback_data="add_note")],
         [InlineKeyboardButton(text="Мои заметки", callback_data="list_notes")],
         [InlineKeyboardButton(text="Поиск заметок", callback_data="show_notes")],
+        [InlineKeyboardButton(text="Ежедневная сводка", callback_data="digest")],
         [InlineKeyboardButton(text="Помощь", callback_data="show_help")]
     ])
\ No newline at end of file
@@ -1,15 +1,25 @@
 import calendar
 from datetime import datetime, date
+from functools import lru_cache
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
+# Сколько разных месяцев календаря держать готовыми
+CALENDAR_CACHE_SIZE = 64
+
 def generate_calendar(year=None, month=None):
-    now = datetime.now()
+    # Сегодняшняя дата входит в ключ кэша: в полночь прошедший день
+    # становится недоступным, и календарь строится заново.
+    # Возвращаемая клавиатура общая -- её нельзя изменять.
+    today = datetime.now().date()
     if year is None:
-        year = now.year
+        year = today.year
     if month is None:
-        month = now.month
+        month = today.month
+    return _build_calendar(year, month, today)
 
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _build_calendar(year, month, today):
     kb = InlineKeyboardBuilder()
 
     kb.row(
@@ -22,7 +32,6 @@ def generate_calendar(year=None, month=None):
     kb.row(*[InlineKeyboardButton(text=day, callback_data="ignore") for day in week_days])
 
     month_days = calendar.monthcalendar(year, month)
-    today = now.date()
 
     for week in month_days:
         row = []
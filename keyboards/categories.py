@@ -0,0 +1,32 @@
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import InlineKeyboardButton
+
+# Категорий на одной странице клавиатуры: в сообщении Telegram не больше
+# 100 кнопок, а категорий у пользователя может быть сколько угодно
+CATEGORIES_PER_PAGE = 20
+
+
+def generate_categories_keyboard(categories, callback_prefix, page=0):
+    """Клавиатура категорий по CATEGORIES_PER_PAGE на странице.
+
+    Категория присылает {callback_prefix}{ID}, кнопки листания --
+    {callback_prefix}page_{номер}. Категорию с другой страницы можно
+    ввести текстом.
+    """
+    total_pages = max(1, (len(categories) + CATEGORIES_PER_PAGE - 1) // CATEGORIES_PER_PAGE)
+    page = min(max(page, 0), total_pages - 1)
+    kb = InlineKeyboardBuilder()
+    for category in categories[page * CATEGORIES_PER_PAGE:(page + 1) * CATEGORIES_PER_PAGE]:
+        kb.button(text=category["name"], callback_data=f"{callback_prefix}{category['id']}")
+    kb.adjust(2)
+    pagination_buttons = []
+    if page > 0:
+        pagination_buttons.append(
+            InlineKeyboardButton(text="⬅️ Назад", callback_data=f"{callback_prefix}page_{page - 1}"))
+    if page < total_pages - 1:
+        pagination_buttons.append(
+            InlineKeyboardButton(text="Вперед ➡️", callback_data=f"{callback_prefix}page_{page + 1}"))
+    if pagination_buttons:
+        kb.row(*pagination_buttons)
+    kb.row(InlineKeyboardButton(text="Отмена", callback_data="back_to_main"))
+    return kb.as_markup()
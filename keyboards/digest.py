@@ -0,0 +1,14 @@
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import InlineKeyboardButton
+from config import DIGEST_TIMES
+
+def generate_digest_keyboard(digest_time):
+    kb = InlineKeyboardBuilder()
+    for option in DIGEST_TIMES:
+        mark = "✅" if option == digest_time else "▫️"
+        kb.add(InlineKeyboardButton(text=f"{mark} {option}", callback_data=f"digest_set_{option}"))
+    kb.adjust(3)
+    if digest_time:
+        kb.row(InlineKeyboardButton(text="Выключить сводку", callback_data="digest_off"))
+    kb.row(InlineKeyboardButton(text="В главное меню", callback_data="back_to_main"))
+    return kb.as_markup()
@@ -0,0 +1,23 @@
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import InlineKeyboardButton
+
+# Готовые правила повторения заметки: ключ для callback_data -> (название, RRULE).
+# Правила записаны в нормализованном виде, как их сохраняет database.set_note_rrule
+RECURRENCE_PRESETS = {
+    "daily": ("Каждый день", "FREQ=DAILY"),
+    "weekdays": ("По будням", "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"),
+    "weekly": ("Каждую неделю", "FREQ=WEEKLY"),
+    "monthly": ("Каждый месяц", "FREQ=MONTHLY"),
+    "yearly": ("Каждый год", "FREQ=YEARLY"),
+}
+
+def generate_recurrence_keyboard(note_id, rrule):
+    kb = InlineKeyboardBuilder()
+    for preset, (title, preset_rrule) in RECURRENCE_PRESETS.items():
+        mark = "✅" if rrule == preset_rrule else "▫️"
+        kb.row(InlineKeyboardButton(text=f"{mark} {title}", callback_data=f"rrule_{note_id}_{preset}"))
+    kb.row(InlineKeyboardButton(text="Свое правило (RRULE)", callback_data=f"rrule_{note_id}_custom"))
+    if rrule:
+        kb.row(InlineKeyboardButton(text="Не повторять", callback_data=f"rrule_{note_id}_none"))
+    kb.row(InlineKeyboardButton(text="Назад к заметке", callback_data=f"view_{note_id}"))
+    return kb.as_markup()
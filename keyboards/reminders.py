@@ -0,0 +1,23 @@
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import InlineKeyboardButton
+from utils.formatting import format_lead
+
+# Варианты упреждения напоминаний, которые можно выбрать для заметки
+REMINDER_PRESETS = (
+    7 * 24 * 60 * 60,
+    24 * 60 * 60,
+    3 * 60 * 60,
+    60 * 60,
+    15 * 60,
+)
+
+def generate_reminders_keyboard(note_id, active_leads):
+    kb = InlineKeyboardBuilder()
+    for lead in sorted(set(REMINDER_PRESETS) | set(active_leads), reverse=True):
+        mark = "✅" if lead in active_leads else "▫️"
+        kb.row(InlineKeyboardButton(
+            text=f"{mark} за {format_lead(lead)}",
+            callback_data=f"toggle_reminder_{note_id}_{lead}"
+        ))
+    kb.row(InlineKeyboardButton(text="Назад к заметке", callback_data=f"view_{note_id}"))
+    return kb.as_markup()
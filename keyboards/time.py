@@ -1,7 +1,7 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
-def generate_hours_keyboard():
+def _build_hours_keyboard():
     kb = InlineKeyboardBuilder()
     for hour in range(0, 24, 6):
         row = []
@@ -13,7 +13,7 @@ def generate_hours_keyboard():
         kb.row(*row)
     return kb.as_markup()
 
-def generate_minutes_keyboard():
+def _build_minutes_keyboard():
     kb = InlineKeyboardBuilder()
     for minute in range(0, 60, 15):
         row = []
@@ -23,4 +23,15 @@ def generate_minutes_keyboard():
                 callback_data=f"select_minute_{m}"
             ))
         kb.row(*row)
-    return kb.as_markup()
\ No newline at end of file
+    return kb.as_markup()
+
+# Клавиатуры не зависят от даты и пользователя, поэтому строятся один раз
+# при импорте. Возвращаемые объекты общие -- их нельзя изменять.
+HOURS_KEYBOARD = _build_hours_keyboard()
+MINUTES_KEYBOARD = _build_minutes_keyboard()
+
+def generate_hours_keyboard():
+    return HOURS_KEYBOARD
+
+def generate_minutes_keyboard():
+    return MINUTES_KEYBOARD
\ No newline at end of file
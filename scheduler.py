@@ -1,5 +1,6 @@
 from __future__ import print_function
 import datetime
+import logging
 import pickle
 import os.path
 from googleapiclient.discovery import build
@@ -55,8 +56,7 @@ def book_timeslot(event_description, event_time, input_email):
 
     # Call the Calendar API
     # now = datetime.datetime.now().isoformat() + 'Z'  # 'Z' indicates UTC time
-    print('Booking a time slot....')
-    print(start_time)
+    logging.info('Booking a time slot....', extra={"start_time": start_time})
     # events_result = service.events().list(calendarId='primary', timeMin=now,
                                           # maxResults=10, singleEvents=True,
                                           # orderBy='startTime').execute()
@@ -0,0 +1,113 @@
+"""Архивация старых заметок.
+
+Бот запускает ее сам (run_archiver, lead_archiver). Как команда модуль
+выполняет обслуживание вручную, из корня репозитория:
+
+    python -m utils.archive                              # один проход архивации
+    python -m utils.archive --enable-incremental-vacuum  # перевести базу на incremental vacuum
+"""
+import argparse
+import asyncio
+import logging
+import time
+from database import archive_notes, incremental_vacuum, enable_incremental_vacuum, open_pool, close_pool
+from config import (
+    DATABASE_NAME,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH,
+    ARCHIVE_BATCH_PAUSE,
+    ARCHIVE_INTERVAL,
+    ARCHIVE_VACUUM_PAGES,
+)
+from utils.leader import run_as_leader
+from utils.metrics import ARCHIVED_NOTES, VACUUMED_PAGES
+
+logger = logging.getLogger(__name__)
+
+
+class NoteArchiver:
+    """Переносит прошедшие и выполненные заметки в таблицу notes_archive.
+
+    Таблица notes остается небольшой, поэтому список заметок, поиск и
+    выборка напоминаний не замедляются со временем. Заметки переносятся
+    пачками по batch_size, каждая -- своей короткой транзакцией, с паузой
+    batch_pause секунд между ними, чтобы запись обработчиков не ждала
+    архивацию. После переноса освободившиеся страницы файла возвращаются
+    ОС тоже частями, по vacuum_pages за шаг.
+    """
+
+    def __init__(self, db_name: str = DATABASE_NAME, after_days: int = ARCHIVE_AFTER_DAYS,
+                 batch_size: int = ARCHIVE_BATCH, batch_pause: float = ARCHIVE_BATCH_PAUSE,
+                 interval: float = ARCHIVE_INTERVAL, vacuum_pages: int = ARCHIVE_VACUUM_PAGES):
+        self.db_name = db_name
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+
+    async def archive_once(self) -> int:
+        """Переносит все подходящие заметки и освобождает место; возвращает их число."""
+        cutoff = int(time.time()) - self.after_days * 86400
+        total = 0
+        while True:
+            moved = await archive_notes(self.db_name, cutoff, self.batch_size)
+            total += moved
+            ARCHIVED_NOTES.inc(amount=moved)
+            if moved < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+        while True:
+            freed = await incremental_vacuum(self.db_name, self.vacuum_pages)
+            VACUUMED_PAGES.inc(amount=freed)
+            if freed < self.vacuum_pages:
+                break
+            await asyncio.sleep(self.batch_pause)
+        if total:
+            logger.info(f"Перенесено в архив заметок: {total}", extra={"notes": total})
+        return total
+
+    async def run(self):
+        while True:
+            try:
+                await self.archive_once()
+            except Exception as e:
+                logger.error(f"Ошибка архивации заметок: {e}")
+            await asyncio.sleep(self.interval)
+
+
+async def run_archiver():
+    """Фоновая задача архивации заметок."""
+    await NoteArchiver().run()
+
+
+async def lead_archiver():
+    """Архивирует заметки, пока этот процесс держит аренду "archiver"."""
+    await run_as_leader("archiver", run_archiver, "переносит старые заметки в архив")
+
+
+async def _maintain(args):
+    if args.enable_incremental_vacuum:
+        if await enable_incremental_vacuum(args.db):
+            print("База переведена на auto_vacuum = INCREMENTAL")
+        else:
+            print("База уже использует auto_vacuum = INCREMENTAL")
+        return
+    await open_pool(args.db)
+    try:
+        moved = await NoteArchiver(args.db, batch_pause=0).archive_once()
+    finally:
+        await close_pool(args.db)
+    print(f"Перенесено в архив заметок: {moved}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DATABASE_NAME, help="файл базы (по умолчанию DATABASE_NAME из config.py)")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="перестроить базу с auto_vacuum = INCREMENTAL (VACUUM блокирует ее до конца)")
+    asyncio.run(_maintain(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import random
+import time
+from database import (
+    get_outbox_batch,
+    finish_outbox,
+    get_calendar_pulls,
+    set_calendar_pull,
+    apply_calendar_changes,
+    add_note_listener,
+    remove_note_listener,
+)
+from config import (
+    DATABASE_NAME,
+    CALENDAR_SYNC_BATCH,
+    CALENDAR_SYNC_POLL_INTERVAL,
+    CALENDAR_SYNC_RETRY_BASE,
+    CALENDAR_SYNC_RETRY_MAX,
+    CALENDAR_PULL_INTERVAL,
+    CALENDAR_PULL_BATCH,
+    CALENDAR_IMPORT_CATEGORY,
+)
+from utils.google_calendar import CalendarError, build_event, event_to_note, get_calendar_client
+from utils.leader import run_as_leader
+from utils.metrics import CALENDAR_SYNC_PUSHES, CALENDAR_SYNC_PULLS
+
+logger = logging.getLogger(__name__)
+
+
+class CalendarSync:
+    """Двусторонняя синхронизация заметок с Google Календарями пользователей.
+
+    Отправка: изменения заметок из таблицы outbox уходят в календарь.
+    Строки outbox пишутся в той же транзакции, что и изменение заметки,
+    поэтому изменение не теряется, даже если процесс упал до отправки.
+    За один проход читается до batch_size строк; все они отправляются
+    одновременно, и клиент собирает их в пакетные HTTP-запросы. У события
+    заметки постоянный ID (event_id), поэтому повторная отправка после
+    сбоя не создает дубликат. Неудачные отправки повторяются через
+    retry_base * 2^попытка секунд, но не реже чем раз в retry_max.
+
+    Загрузка: раз в pull_interval секунд для каждого календаря
+    запрашиваются только события, измененные после сохраненного syncToken,
+    и применяются к заметкам (см. database.apply_calendar_changes).
+    Запросы до pull_batch календарей уходят одним пакетным запросом.
+    """
+
+    def __init__(self, client=None, db_name: str = DATABASE_NAME, batch_size: int = CALENDAR_SYNC_BATCH,
+                 poll_interval: float = CALENDAR_SYNC_POLL_INTERVAL, retry_base: float = CALENDAR_SYNC_RETRY_BASE,
+                 retry_max: float = CALENDAR_SYNC_RETRY_MAX, pull_interval: float = CALENDAR_PULL_INTERVAL,
+                 pull_batch: int = CALENDAR_PULL_BATCH):
+        self.client = client or get_calendar_client()
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.pull_interval = pull_interval
+        self.pull_batch = pull_batch
+        self._wakeup = asyncio.Event()
+
+    def on_note_changed(self, event: str, note: dict):
+        """Подписчик database.add_note_listener: будит цикл, не дожидаясь poll_interval."""
+        if event in ("add", "edit", "delete", "calendar", "import"):
+            self._wakeup.set()
+
+    def _retry_delay(self, attempts: int, error: Exception) -> float:
+        if isinstance(error, CalendarError) and not error.retryable:
+            # Google отклонил само событие: повтор сразу даст ту же ошибку
+            return self.retry_max
+        delay = min(self.retry_base * 2 ** attempts, self.retry_max)
+        # Разброс, чтобы после сбоя Google повторы не приходили одной волной
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _push(self, change: dict) -> str | None:
+        """Отправляет изменение; возвращает etag события или None для удаления."""
+        if change["calendar_id"] is None:
+            # Календарь отключен -- отправлять некуда
+            return None
+        if change["op"] == "delete" or change["note_text"] is None:
+            await self.client.delete_event(change["event_id"], change["calendar_id"])
+            return None
+        event = await self.client.upsert_event(change["event_id"], build_event(change), change["calendar_id"])
+        return event.get("etag")
+
+    async def sync_once(self) -> int:
+        """Отправляет изменения, которым пора; возвращает число обработанных."""
+        changes = await get_outbox_batch(self.db_name, time.time(), self.batch_size)
+        if not changes:
+            return 0
+        results = await asyncio.gather(*(self._push(change) for change in changes), return_exceptions=True)
+        done, failed = [], []
+        now = time.time()
+        for change, result in zip(changes, results):
+            if isinstance(result, Exception):
+                delay = self._retry_delay(change["attempts"], result)
+                failed.append((change["note_id"], change["seq"], now + delay, str(result)))
+                CALENDAR_SYNC_PUSHES.inc(change["op"], "error")
+                logger.warning("Не удалось синхронизировать заметку", extra={
+                    "user_id": change["user_id"], "note_id": change["note_id"], "op": change["op"],
+                    "attempts": change["attempts"] + 1, "retry_in_s": round(delay), "error": str(result),
+                })
+            else:
+                done.append((change["note_id"], change["seq"], result))
+                CALENDAR_SYNC_PUSHES.inc(change["op"], "ok")
+        await finish_outbox(self.db_name, done, failed)
+        return len(changes)
+
+    async def _pull(self, account: dict, now: float):
+        user_id = account["user_id"]
+        try:
+            events, sync_token = await self.client.list_changes(account["calendar_id"], account["sync_token"])
+        except CalendarError as e:
+            if e.status == 410:
+                # Токен устарел: сразу же полная синхронизация
+                logger.info("Нужна полная синхронизация календаря", extra={"user_id": user_id})
+                await set_calendar_pull(self.db_name, user_id, now, reset_token=True)
+                CALENDAR_SYNC_PULLS.inc("full_sync")
+            else:
+                logger.warning("Не удалось загрузить изменения календаря",
+                               extra={"user_id": user_id, "error": str(e)})
+                await set_calendar_pull(self.db_name, user_id, now + self.pull_interval)
+                CALENDAR_SYNC_PULLS.inc("error")
+            return
+        await apply_calendar_changes(self.db_name, user_id, [event_to_note(event) for event in events],
+                                     sync_token, now + self.pull_interval, CALENDAR_IMPORT_CATEGORY)
+        CALENDAR_SYNC_PULLS.inc("ok" if account["sync_token"] else "full")
+
+    async def pull_once(self) -> int:
+        """Загружает изменения календарей, которым пора; возвращает их число."""
+        now = time.time()
+        accounts = await get_calendar_pulls(self.db_name, now, self.pull_batch)
+        results = await asyncio.gather(*(self._pull(account, now) for account in accounts), return_exceptions=True)
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка загрузки изменений календаря: {result}", extra={"user_id": account["user_id"]})
+        return len(accounts)
+
+    async def run(self):
+        add_note_listener(self.on_note_changed)
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    processed = await self.sync_once()
+                    pulled = await self.pull_once()
+                except Exception as e:
+                    logger.error(f"Ошибка синхронизации с Google Календарем: {e}")
+                    processed = pulled = 0
+                if processed >= self.batch_size or pulled >= self.pull_batch:
+                    # В очереди, скорее всего, есть еще изменения
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            remove_note_listener(self.on_note_changed)
+
+
+async def run_calendar_sync():
+    """Фоновая задача синхронизации заметок с Google Календарем."""
+    await CalendarSync().run()
+
+
+async def lead_calendar_sync():
+    """Синхронизирует календари, пока этот процесс держит аренду "calendar_sync"."""
+    await run_as_leader("calendar_sync", run_calendar_sync, "синхронизирует Google Календари")
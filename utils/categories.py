@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+from database import get_user_categories, add_note_listener
+from config import DATABASE_NAME, CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL
+
+
+class CategoryCache:
+    """Кэш списков категорий пользователей для клавиатуры выбора категории.
+
+    Список читается из базы при первом обращении и держится в памяти,
+    пока пользователь не добавит, не изменит или не удалит заметку, но не
+    дольше ttl секунд. Давно не использованные записи вытесняются сверх
+    cache_size.
+
+    Сбрасывают список только события database.add_note_listener своего
+    процесса. Заметки, которые меняют другие процессы (архиватор,
+    синхронизация с Google Календарем, другие процессы-обработчики в
+    многопроцессном режиме), сюда не сообщаются, поэтому список может
+    отставать от базы -- не дольше ttl.
+    """
+
+    def __init__(self, db_name: str = DATABASE_NAME, cache_size: int = CATEGORY_CACHE_SIZE,
+                 ttl: float = CATEGORY_CACHE_TTL):
+        self.db_name = db_name
+        self.cache_size = cache_size
+        self.ttl = ttl
+        # ID пользователя -> (момент устаревания по time.monotonic(), категории)
+        self._cache: OrderedDict[int, tuple[float, list[dict]]] = OrderedDict()
+
+    async def get(self, user_id: int) -> list[dict]:
+        """Возвращает категории пользователя: [{"id": ..., "name": ...}, ...]."""
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            categories = await get_user_categories(self.db_name, user_id)
+            entry = self._cache[user_id] = (time.monotonic() + self.ttl, categories)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(user_id)
+        return entry[1]
+
+    async def get_name(self, user_id: int, category_id: int) -> str | None:
+        """Возвращает название категории пользователя по её ID."""
+        for category in await self.get(user_id):
+            if category["id"] == category_id:
+                return category["name"]
+        return None
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+    def on_note_changed(self, event: str, note: dict):
+        """Подписчик database.add_note_listener: сбрасывает список владельца заметки."""
+        if event in ("add", "edit", "delete", "import"):
+            self.invalidate(note["user_id"])
+
+
+category_cache = CategoryCache()
+add_note_listener(category_cache.on_note_changed)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from database import get_due_digests, finish_digests, next_digest_at
+from config import (
+    DATABASE_NAME,
+    DIGEST_BATCH,
+    DIGEST_POLL_INTERVAL,
+    REMINDER_SEND_CONCURRENCY,
+)
+from utils.rate_limit import SendRateLimiter
+from utils.leader import run_as_leader
+from utils.metrics import DIGESTS
+from utils.scheduler import RETRY_DELAY, SEND_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# Наибольшая длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+def format_digest(digest: dict) -> str:
+    """Текст сводки: заметки дня по категориям, не длиннее MESSAGE_LIMIT."""
+    lines = [f"Ваши заметки на {digest['date']}:"]
+    total = sum(len(notes) for notes in digest["categories"].values())
+    shown = 0
+    length = len(lines[0])
+    for category, notes in digest["categories"].items():
+        block = ["", f"{category}:"] + [
+            f"{'🔁 ' if note['rrule'] else ''}{note['note_time']} - {note['note_text']}" for note in notes
+        ]
+        for line in block:
+            # Запас на строку о не поместившихся заметках
+            if length + len(line) + 1 > MESSAGE_LIMIT - 40:
+                lines.append(f"... и еще {total - shown}")
+                return "\n".join(lines)
+            lines.append(line)
+            length += len(line) + 1
+        shown += len(notes)
+    return "\n".join(lines)
+
+
+class DigestSender:
+    """Отправляет ежедневные сводки заметок в выбранное пользователями время.
+
+    Раз в poll_interval секунд все наступившие сводки (до batch_size)
+    считаются одним запросом с группировкой по пользователю и категории
+    (database.get_due_digests), а не запросом на каждого пользователя.
+    Сообщения уходят параллельно с теми же лимитами Telegram, что и
+    напоминания. Пользователю без заметок на день сводка не отправляется.
+    """
+
+    def __init__(self, bot, db_name: str = DATABASE_NAME, batch_size: int = DIGEST_BATCH,
+                 poll_interval: float = DIGEST_POLL_INTERVAL):
+        self.bot = bot
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._limiter = SendRateLimiter()
+        self._send_slots = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+
+    async def _send(self, digest: dict, now: float) -> bool:
+        """Отправляет сводку; возвращает False, если отправку нужно повторить."""
+        user_id = digest["user_id"]
+        if now >= digest["day_end"]:
+            # Бот не работал весь день сводки -- присылать ее уже поздно
+            DIGESTS.inc("stale")
+            return True
+        if not digest["categories"]:
+            DIGESTS.inc("empty")
+            return True
+        async with self._send_slots:
+            for _ in range(SEND_ATTEMPTS):
+                await self._limiter.acquire(user_id)
+                try:
+                    await self.bot.send_message(user_id, format_digest(digest))
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой сводок")
+                    self._limiter.pause(e.retry_after)
+                    continue
+                except TelegramForbiddenError:
+                    logger.warning(f"Пользователь {user_id} заблокировал бота, сводка пропущена",
+                                   extra={"user_id": user_id})
+                    DIGESTS.inc("blocked")
+                    return True
+                except Exception as e:
+                    logger.error(f"Ошибка отправки сводки: {e}", extra={"user_id": user_id})
+                    break
+                DIGESTS.inc("sent")
+                return True
+        DIGESTS.inc("error")
+        return False
+
+    async def send_once(self) -> int:
+        """Отправляет наступившие сводки; возвращает их число."""
+        now = time.time()
+        digests = await get_due_digests(self.db_name, now, self.batch_size)
+        if not digests:
+            return 0
+        finished = await asyncio.gather(*(self._send(digest, now) for digest in digests))
+        # Все сводки прохода переносятся одной транзакцией: отправленные --
+        # на следующий день, неудачные -- на повтор через RETRY_DELAY
+        await finish_digests(self.db_name, [
+            (digest["user_id"], digest["next_at"],
+             next_digest_at(digest["digest_time"], max(digest["next_at"], now)) if ok else int(now) + RETRY_DELAY)
+            for digest, ok in zip(digests, finished)
+        ])
+        self._limiter.prune()
+        return len(digests)
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.send_once()
+            except Exception as e:
+                logger.error(f"Ошибка отправки сводок: {e}")
+                processed = 0
+            if processed >= self.batch_size:
+                # Наступивших сводок, скорее всего, больше
+                continue
+            await asyncio.sleep(self.poll_interval)
+
+
+async def run_digests(bot):
+    """Фоновая задача отправки ежедневных сводок."""
+    await DigestSender(bot).run()
+
+
+async def lead_digests(bot):
+    """Отправляет сводки, пока этот процесс держит аренду "digests"."""
+    await run_as_leader("digests", lambda: run_digests(bot), "отправляет ежедневные сводки")
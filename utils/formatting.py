@@ -0,0 +1,27 @@
+"""Числа и сроки словами для сообщений бота.
+
+Модуль ничего не импортирует из проекта, поэтому им пользуются и
+database.py (через utils.recurrence), и клавиатуры, и планировщик.
+"""
+
+
+def plural(number: int, forms: tuple[str, str, str]) -> str:
+    """Форма слова для числа: forms -- для 1, 2 и 5 ("день", "дня", "дней")."""
+    if number % 10 == 1 and number % 100 != 11:
+        return forms[0]
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+def format_lead(lead: int) -> str:
+    """Возвращает упреждение напоминания словами для фразы "за ...", например "1 неделю"."""
+    for unit, forms in (
+        (7 * 24 * 60 * 60, ("неделю", "недели", "недель")),
+        (24 * 60 * 60, ("день", "дня", "дней")),
+        (60 * 60, ("час", "часа", "часов")),
+    ):
+        if lead % unit == 0:
+            return f"{lead // unit} {plural(lead // unit, forms)}"
+    minutes = lead // 60
+    return f"{minutes} {plural(minutes, ('минуту', 'минуты', 'минут'))}"
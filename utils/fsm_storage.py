@@ -0,0 +1,113 @@
+import asyncio
+import copy
+import logging
+from collections import OrderedDict
+from typing import Any, Mapping
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from database import get_fsm_record, save_fsm_records
+from config import DATABASE_NAME, FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в файле базы бота с кэшем в памяти и отложенной записью.
+
+    Чтение идет из кэша, в базу обращаемся только при промахе. Изменения
+    копятся в памяти и раз в FSM_FLUSH_INTERVAL секунд записываются одной
+    транзакцией, поэтому шаги мастера добавления заметки не ждут базу.
+    При перезапуске теряются только изменения последнего интервала.
+    """
+
+    def __init__(self, db_name: str = DATABASE_NAME, cache_size: int = FSM_CACHE_SIZE,
+                 flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.db_name = db_name
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        # ключ -> [состояние, данные]
+        self._cache: OrderedDict[str, list] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flushing: set[str] = set()
+        self._flusher: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny,
+        ))
+
+    async def _load(self, key: str) -> list:
+        record = self._cache.get(key)
+        if record is None:
+            stored = await get_fsm_record(self.db_name, key)
+            # Пока ждали базу, запись могла появиться в кэше
+            record = self._cache.get(key)
+            if record is None:
+                record = list(stored) if stored is not None else [None, {}]
+                self._cache[key] = record
+        self._cache.move_to_end(key)
+        return record
+
+    def _mark_dirty(self, key: str):
+        self._dirty.add(key)
+        self._evict()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def _evict(self):
+        """Вытесняет давно не использованные записи, уже сохраненные в базе."""
+        if len(self._cache) <= self.cache_size:
+            return
+        for key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if key not in self._dirty and key not in self._flushing:
+                del self._cache[key]
+
+    async def _flush_later(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные изменения в базу."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        self._flushing = keys
+        records = [(key, *self._cache[key]) for key in keys]
+        try:
+            await save_fsm_records(self.db_name, records)
+        except asyncio.CancelledError:
+            self._dirty |= keys
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка сохранения состояний FSM: {e}")
+            self._dirty |= keys
+        finally:
+            self._flushing = set()
+        self._evict()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        record = await self._load(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(self._key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = self._key(key)
+        record = await self._load(key)
+        record[1] = copy.deepcopy(dict(data))
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return copy.deepcopy((await self._load(self._key(key)))[1])
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config import (
+    GOOGLE_TOKEN_FILE,
+    GOOGLE_API_ROOT,
+    GOOGLE_CALENDAR_THREADS,
+    GOOGLE_CALENDAR_BATCH_SIZE,
+    GOOGLE_CALENDAR_BATCH_DELAY,
+    GOOGLE_CALENDAR_TIMEZONE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Google принимает в одном пакетном запросе не больше 50 вызовов
+MAX_BATCH_SIZE = 50
+# Событий на одной странице списка (не больше 2500)
+LIST_PAGE_SIZE = 250
+# Начало ID событий, созданных из заметок
+EVENT_ID_PREFIX = "planner"
+# Время заметки для события на весь день
+ALL_DAY_TIME = "09:00"
+
+
+class CalendarError(Exception):
+    """Ошибка обращения к Google Календарю.
+
+    status -- HTTP-статус ответа Google или None, если ответа не было.
+    """
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        """Имеет ли смысл повторить запрос позже."""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+def _calendar_error(error: Exception) -> CalendarError:
+    if isinstance(error, CalendarError):
+        return error
+    response = getattr(error, "resp", None)
+    return CalendarError(str(error), getattr(response, "status", None))
+
+
+def event_id(note_id: int) -> str:
+    """Постоянный ID события заметки: повторная отправка не создает дубликат.
+
+    Google принимает в ID только символы base32hex (0-9, a-v).
+    """
+    return f"{EVENT_ID_PREFIX}{note_id}"
+
+
+def build_event(note: dict, email: str | None = None) -> dict:
+    """Событие Google Календаря для заметки: длительностью час, со временем заметки."""
+    start = datetime.strptime(f"{note['note_date']} {note['note_time']}", "%d-%m-%Y %H:%M")
+    event = {
+        "summary": note["note_text"],
+        "start": {"dateTime": start.isoformat(), "timeZone": GOOGLE_CALENDAR_TIMEZONE},
+        "end": {"dateTime": (start + timedelta(hours=1)).isoformat(), "timeZone": GOOGLE_CALENDAR_TIMEZONE},
+        "reminders": {
+            "useDefault": False,
+            "overrides": [
+                {"method": "email", "minutes": 24 * 60},
+                {"method": "popup", "minutes": 10},
+            ],
+        },
+    }
+    if note.get("rrule"):
+        event["recurrence"] = [f"RRULE:{note['rrule']}"]
+    if email:
+        event["attendees"] = [{"email": email}]
+    return event
+
+
+def event_to_note(event: dict) -> dict:
+    """Изменение заметки по событию календаря, для database.apply_calendar_changes.
+
+    Для повторяющихся событий, их отдельно измененных повторений и событий
+    без начала поля заметки равны None: заметкой их не представить.
+    """
+    change = {
+        "event_id": event["id"],
+        "etag": event.get("etag"),
+        "cancelled": event.get("status") == "cancelled",
+        "note_text": None,
+        "note_date": None,
+        "note_time": None,
+    }
+    start = event.get("start") or {}
+    if (change["cancelled"] or "recurrence" in event or "recurringEventId" in event
+            or not (start.get("dateTime") or start.get("date"))):
+        return change
+    if "dateTime" in start:
+        moment = datetime.fromisoformat(start["dateTime"])
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(ZoneInfo(GOOGLE_CALENDAR_TIMEZONE))
+        note_time = moment.strftime("%H:%M")
+    else:
+        moment = datetime.fromisoformat(start["date"])
+        note_time = ALL_DAY_TIME
+    change.update(
+        note_text=event.get("summary") or "(без названия)",
+        note_date=moment.strftime("%d-%m-%Y"),
+        note_time=note_time,
+    )
+    return change
+
+
+class GoogleCalendarClient:
+    """Асинхронный клиент Google Calendar API.
+
+    Библиотека Google синхронная, поэтому все вызовы выполняются в пуле из
+    threads потоков, а цикл событий только ждет результат. Учетные данные
+    читаются из token_file один раз и обновляются, только когда истекли.
+    Объект сервиса строится из встроенного в библиотеку документа discovery
+    один раз на поток (httplib2 нельзя делить между потоками).
+
+    Вызовы не отправляются сразу: пришедшие в течение batch_delay секунд
+    уходят одним пакетным HTTP-запросом до batch_size вызовов. root_url и credentials позволяют направить клиент на локальный
+    поддельный сервер (см. benchmarks/fake_calendar.py).
+    """
+
+    def __init__(self, token_file: str = GOOGLE_TOKEN_FILE, root_url: str = GOOGLE_API_ROOT,
+                 threads: int = GOOGLE_CALENDAR_THREADS, batch_size: int = GOOGLE_CALENDAR_BATCH_SIZE,
+                 batch_delay: float = GOOGLE_CALENDAR_BATCH_DELAY, credentials=None):
+        self.token_file = token_file
+        self.root_url = root_url.rstrip("/") + "/"
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.batch_delay = batch_delay
+        self._credentials = credentials
+        self._credentials_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="calendar")
+        # (метод events(), его аргументы, future) в ожидании пакетной отправки
+        self._pending: list[tuple[str, dict, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+        self._batches: set[asyncio.Task] = set()
+
+    # Методы ниже выполняются в потоках пула
+
+    def _load_credentials(self):
+        with self._credentials_lock:
+            if self._credentials is None:
+                if not os.path.exists(self.token_file):
+                    raise CalendarError(f"Нет файла с токеном Google: {self.token_file}")
+                with open(self.token_file, "rb") as token:
+                    self._credentials = pickle.load(token)
+            credentials = self._credentials
+            if not credentials.valid and getattr(credentials, "refresh_token", None):
+                from google.auth.transport.requests import Request
+
+                credentials.refresh(Request())
+                with open(self.token_file, "wb") as token:
+                    pickle.dump(credentials, token)
+                logger.info("Токен Google обновлен")
+            return credentials
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            from googleapiclient.discovery import build
+
+            service = build(
+                "calendar", "v3",
+                credentials=self._load_credentials(),
+                client_options={"api_endpoint": self.root_url + "calendar/v3/"},
+                static_discovery=True,
+                cache_discovery=False,
+            )
+            self._local.service = service
+        return service
+
+    def _execute_batch(self, items: list[tuple[str, dict]]) -> list[tuple[dict | None, Exception | None]]:
+        """Выполняет вызовы events() одним запросом; возвращает (ответ, ошибка) для каждого."""
+        from googleapiclient.http import BatchHttpRequest
+
+        self._load_credentials()
+        service = self._service()
+        requests = [getattr(service.events(), method)(**kwargs) for method, kwargs in items]
+        if len(requests) == 1:
+            try:
+                return [(requests[0].execute(), None)]
+            except Exception as e:
+                return [(None, e)]
+
+        results: list = [(None, None)] * len(items)
+
+        def collect(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        batch = BatchHttpRequest(callback=collect, batch_uri=self.root_url + "batch/calendar/v3")
+        for index, request in enumerate(requests):
+            batch.add(request, request_id=str(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            return [(None, e)] * len(items)
+        return results
+
+    # Асинхронный интерфейс
+
+    async def _call(self, method: str, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((method, kwargs, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def insert_event(self, event: dict, calendar_id: str = "primary") -> dict:
+        """Добавляет событие в календарь и возвращает созданное событие.
+
+        Raises:
+            CalendarError: Google не принял событие или недоступен.
+        """
+        return await self._call("insert", calendarId=calendar_id, body=event)
+
+    async def upsert_event(self, event_id: str, event: dict, calendar_id: str = "primary") -> dict:
+        """Создает событие с заданным ID или перезаписывает существующее.
+
+        Повторный вызов с тем же event_id не создает второе событие, поэтому
+        его можно безопасно повторять после ошибки.
+        """
+        try:
+            return await self.insert_event({**event, "id": event_id}, calendar_id)
+        except CalendarError as e:
+            if e.status != 409:
+                raise
+        # Событие уже есть (в том числе удаленное -- обновление его восстанавливает)
+        return await self._call("update", calendarId=calendar_id, eventId=event_id,
+                                body={**event, "id": event_id, "status": "confirmed"})
+
+    async def delete_event(self, event_id: str, calendar_id: str = "primary"):
+        """Удаляет событие; если его уже нет, ничего не делает."""
+        try:
+            await self._call("delete", calendarId=calendar_id, eventId=event_id)
+        except CalendarError as e:
+            if e.status not in (404, 410):
+                raise
+
+    async def list_changes(self, calendar_id: str, sync_token: str | None = None) -> tuple[list[dict], str]:
+        """Возвращает события, измененные после sync_token, и новый токен.
+
+        Без sync_token возвращает все события календаря (полная
+        синхронизация). Страницы запрашиваются через общую очередь, поэтому
+        запросы нескольких календарей уходят одним пакетным запросом.
+
+        Raises:
+            CalendarError: со status 410, если токен устарел и нужна полная синхронизация.
+        """
+        events = []
+        params = {"calendarId": calendar_id, "maxResults": LIST_PAGE_SIZE}
+        if sync_token:
+            params.update(syncToken=sync_token, showDeleted=True)
+        while True:
+            page = await self._call("list", **params)
+            events.extend(page.get("items", []))
+            if "nextPageToken" not in page:
+                return events, page["nextSyncToken"]
+            params["pageToken"] = page["nextPageToken"]
+
+    async def insert_events(self, events: list[dict], calendar_id: str = "primary") -> list[dict | CalendarError]:
+        """Добавляет несколько событий; для неудачных вставок возвращает ошибку."""
+        return await asyncio.gather(
+            *(self.insert_event(event, calendar_id) for event in events), return_exceptions=True
+        )
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_delay)
+        self._flush()
+
+    def _flush(self):
+        while self._pending:
+            items, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            task = asyncio.create_task(self._send(items))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send(self, items: list[tuple[str, dict, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self._execute_batch, [(method, kwargs) for method, kwargs, _ in items]
+            )
+        except Exception as e:
+            results = [(None, e)] * len(items)
+        for (_, _, future), (response, error) in zip(items, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(_calendar_error(error))
+            else:
+                future.set_result(response)
+
+    async def close(self):
+        """Отправляет накопленные события и останавливает пул потоков."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        self._flush()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+
+_client: GoogleCalendarClient | None = None
+
+
+def get_calendar_client() -> GoogleCalendarClient:
+    """Общий клиент процесса; создается при первом обращении."""
+    global _client
+    if _client is None:
+        _client = GoogleCalendarClient()
+    return _client
+
+
+async def close_calendar_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
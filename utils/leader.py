@@ -0,0 +1,37 @@
+import asyncio
+import logging
+import os
+import socket
+from database import acquire_lease, release_lease
+from config import DATABASE_NAME, LEADER_LEASE_TTL, LEADER_RENEW_INTERVAL
+
+
+async def run_as_leader(name: str, start, action: str):
+    """Выполняет фоновую задачу, пока этот процесс держит аренду name.
+
+    Запускается в каждом рабочем процессе; задача start() работает только
+    в одном из них. Если лидер перестает продлевать аренду (например,
+    процесс упал), через LEADER_LEASE_TTL секунд её забирает другой процесс.
+    action -- что делает задача, для логов.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    task = None
+    try:
+        while True:
+            try:
+                leader = await acquire_lease(DATABASE_NAME, name, holder, LEADER_LEASE_TTL)
+            except Exception as e:
+                logging.error(f"Ошибка продления аренды {name}: {e}")
+                leader = False
+            if leader and (task is None or task.done()):
+                logging.info(f"Процесс {holder} стал лидером и {action}")
+                task = asyncio.create_task(start())
+            elif not leader and task is not None:
+                logging.info(f"Процесс {holder} больше не лидер ({name})")
+                task.cancel()
+                task = None
+            await asyncio.sleep(LEADER_RENEW_INTERVAL)
+    finally:
+        if task is not None:
+            task.cancel()
+            await release_lease(DATABASE_NAME, name, holder)
@@ -0,0 +1,65 @@
+import json
+import logging
+import logging.handlers
+import queue
+from config import LOG_LEVEL, LOG_FORMAT
+
+# Атрибуты, которые есть у любой записи лога; все остальные пришли через extra
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """Структурированные поля записи, переданные через extra (user_id, note_id, ...)."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """Обычная строка лога с полями key=value в конце."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога -- один объект JSON в строке."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Настраивает логирование через очередь и возвращает запущенного слушателя.
+
+    Обработчики только кладут запись в очередь, а вывод в stderr делает
+    отдельный поток QueueListener, поэтому логирование не блокирует цикл
+    событий. Перед выходом нужно вызвать stop() у слушателя, чтобы
+    дописать оставшиеся записи.
+    """
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    return listener
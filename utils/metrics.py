@@ -0,0 +1,142 @@
+"""Метрики Prometheus: счетчики, гистограммы и их реестр.
+
+Модуль не зависит от aiogram и aiohttp, поэтому его импортирует
+database.py. Middleware обработчиков и HTTP-сервер /metrics -- в
+utils.metrics_server.
+"""
+import bisect
+import functools
+import time
+
+# Границы корзин гистограмм, в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENESS_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Счетчик Prometheus с метками."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками и фиксированными корзинами.
+
+    observe() -- один bisect и несколько сложений, поэтому гистограммы
+    можно держать включенными постоянно.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики корзин..., +Inf], сумма
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Добавляет функцию, которая при каждом запросе возвращает строки метрик."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "bot_handler_seconds", "Время обработки обновления", ("event", "handler")))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Обновления, обработка которых завершилась исключением", ("event", "handler")))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "bot_db_query_seconds", "Время выполнения функции database.py", ("query",)))
+DB_QUERY_ERRORS = REGISTRY.register(Counter(
+    "bot_db_query_errors_total", "Функции database.py, завершившиеся исключением", ("query",)))
+REMINDER_LATENESS = REGISTRY.register(Histogram(
+    "bot_reminder_lateness_seconds", "Время отправки напоминания минус запланированное",
+    buckets=LATENESS_BUCKETS))
+CALENDAR_SYNC_PUSHES = REGISTRY.register(Counter(
+    "bot_calendar_sync_pushes_total", "Отправки изменений заметок в Google Календарь", ("op", "result")))
+CALENDAR_SYNC_PULLS = REGISTRY.register(Counter(
+    "bot_calendar_sync_pulls_total", "Загрузки изменений из Google Календаря", ("result",)))
+ARCHIVED_NOTES = REGISTRY.register(Counter(
+    "bot_archived_notes_total", "Заметки, перенесенные в архив"))
+VACUUMED_PAGES = REGISTRY.register(Counter(
+    "bot_vacuumed_pages_total", "Свободные страницы файла базы, возвращенные ОС"))
+DIGESTS = REGISTRY.register(Counter(
+    "bot_digests_total", "Ежедневные сводки заметок", ("result",)))
+
+
+def timed_query(func):
+    """Декоратор функций database.py: время выполнения и ошибки по имени функции."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.inc(name)
+            raise
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
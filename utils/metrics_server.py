@@ -0,0 +1,80 @@
+"""Сбор метрик обработчиков и HTTP-сервер, отдающий реестр utils.metrics."""
+import logging
+import time
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+from utils.metrics import REGISTRY, HANDLER_SECONDS, HANDLER_ERRORS
+
+# Сколько разных значений метки handler держать; callback_data присылает
+# клиент, поэтому остальные значения собираются в "other"
+MAX_HANDLER_LABELS = 200
+
+
+def callback_label(data: str | None) -> str:
+    """Метка обработчика по callback_data: начало до первой части с цифрами.
+
+    Например, "view_12" -> "view_", "select_day_2026_5_1" -> "select_day_",
+    "list_notes" -> "list_notes".
+    """
+    if not data:
+        return "empty"
+    parts = data.split("_")
+    for index, part in enumerate(parts):
+        if any(char.isdigit() for char in part):
+            return "_".join(parts[:index]) + "_"
+    return data
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware: время обработки и ошибки обработчиков.
+
+    Нажатия кнопок помечаются началом callback_data (см. callback_label),
+    сообщения -- командой или состоянием FSM, в котором они пришли.
+    """
+
+    def __init__(self):
+        self._labels: set[str] = set()
+
+    def _label(self, event, data: dict) -> tuple[str, str]:
+        if isinstance(event, CallbackQuery):
+            kind, label = "callback_query", callback_label(event.data)
+        elif isinstance(event, Message):
+            kind = "message"
+            if event.text and event.text.startswith("/"):
+                label = event.text.split()[0].split("@")[0]
+            else:
+                label = data.get("raw_state") or "no_state"
+        else:
+            kind, label = type(event).__name__, "other"
+        if label not in self._labels:
+            if len(self._labels) >= MAX_HANDLER_LABELS:
+                return kind, "other"
+            self._labels.add(label)
+        return kind, label
+
+    async def __call__(self, handler, event, data):
+        labels = self._label(event, data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, *labels)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер, отдающий метрики по /metrics в формате Prometheus."""
+    async def handle(request: web.Request):
+        return web.Response(body=REGISTRY.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
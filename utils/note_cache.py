@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from database import (
+    get_note_by_id,
+    get_user_notes,
+    get_user_notes_page,
+    count_user_notes,
+    add_note_listener,
+)
+from config import DATABASE_NAME, NOTE_CACHE_SIZE, NOTE_CACHE_TTL
+from utils.metrics import REGISTRY
+
+
+class NoteCache:
+    """Кэш чтения заметок перед database.py с отдельной записью на пользователя.
+
+    Результаты get_note_by_id, get_user_notes, get_user_notes_page и
+    count_user_notes запоминаются в записи владельца. Запись сбрасывается
+    целиком, когда пользователь добавляет, изменяет, удаляет или выполняет
+    заметку (события database.add_note_listener), а также через ttl секунд.
+    Давно не использованные записи вытесняются сверх cache_size.
+    Возвращаемые объекты общие -- их нельзя изменять.
+    """
+
+    def __init__(self, db_name: str = DATABASE_NAME, cache_size: int = NOTE_CACHE_SIZE,
+                 ttl: float = NOTE_CACHE_TTL):
+        self.db_name = db_name
+        self.cache_size = cache_size
+        self.ttl = ttl
+        # ID пользователя -> {"expires_at": ..., "results": {ключ запроса: результат}}
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, user_id: int) -> dict:
+        entry = self._entries.get(user_id)
+        if entry is None or entry["expires_at"] <= time.monotonic():
+            entry = {"expires_at": time.monotonic() + self.ttl, "results": {}}
+            self._entries[user_id] = entry
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(user_id)
+        return entry
+
+    async def _read(self, user_id: int, key: tuple, loader):
+        entry = self._entry(user_id)
+        if key in entry["results"]:
+            self.hits += 1
+            return entry["results"][key]
+        self.misses += 1
+        result = await loader()
+        # Пока ждали базу, запись могли сбросить -- тогда результат мог устареть
+        if self._entries.get(user_id) is entry:
+            entry["results"][key] = result
+        return result
+
+    async def get_note_by_id(self, note_id: int, user_id: int) -> dict | None:
+        return await self._read(user_id, ("note", note_id),
+                                lambda: get_note_by_id(self.db_name, note_id, user_id))
+
+    async def get_user_notes(self, user_id: int):
+        return await self._read(user_id, ("notes",),
+                                lambda: get_user_notes(self.db_name, user_id))
+
+    async def get_user_notes_page(self, user_id: int, cursor: tuple[int, int] | None = None,
+                                  backward: bool = False, limit: int = 10):
+        return await self._read(user_id, ("page", cursor, backward, limit),
+                                lambda: get_user_notes_page(self.db_name, user_id, cursor, backward, limit))
+
+    async def count_user_notes(self, user_id: int) -> int:
+        return await self._read(user_id, ("count",),
+                                lambda: count_user_notes(self.db_name, user_id))
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def on_note_changed(self, event: str, note: dict):
+        """Подписчик database.add_note_listener: сбрасывает записи владельца заметки."""
+        if event in ("add", "edit", "delete", "import"):
+            self.invalidate(note["user_id"])
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов и число пользователей в кэше."""
+        return {"hits": self.hits, "misses": self.misses, "users": len(self._entries)}
+
+
+def _metrics() -> list[str]:
+    stats = note_cache.stats()
+    return [
+        "# HELP bot_note_cache_requests_total Чтения заметок через кэш",
+        "# TYPE bot_note_cache_requests_total counter",
+        f'bot_note_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'bot_note_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        "# HELP bot_note_cache_users Пользователи, чьи заметки сейчас в кэше",
+        "# TYPE bot_note_cache_users gauge",
+        f'bot_note_cache_users {stats["users"]}',
+    ]
+
+
+note_cache = NoteCache()
+add_note_listener(note_cache.on_note_changed)
+REGISTRY.add_collector(_metrics)
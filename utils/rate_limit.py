@@ -0,0 +1,67 @@
+import asyncio
+import time
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate операций в секунду, всплески до capacity."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ждет, пока появится свободный токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдает токены ближайшие seconds секунд (например, после ответа 429)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        """True, если ведро полное и его можно не хранить."""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+
+class SendRateLimiter:
+    """Общий лимит Telegram на отправку сообщений и отдельный лимит на каждый чат."""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self._chats: dict[int, TokenBucket] = {}
+
+    async def acquire(self, chat_id: int):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate)
+        # Сначала ждем лимит чата, чтобы не занимать общий токен впустую
+        await bucket.acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds: float):
+        self.global_bucket.pause(seconds)
+
+    def prune(self):
+        """Удаляет ведра чатов, которые сейчас ничего не ограничивают."""
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle()]:
+            del self._chats[chat_id]
@@ -0,0 +1,248 @@
+import calendar
+import math
+from datetime import date, datetime, time, timedelta, timezone
+from utils.formatting import plural
+
+# Поддерживаемое подмножество RRULE (RFC 5545, 3.3.10): FREQ=DAILY,
+# WEEKLY, MONTHLY или YEARLY, INTERVAL, BYDAY для WEEKLY (без номеров
+# недель), BYMONTHDAY для MONTHLY и YEARLY (в том числе отрицательные -- с
+# конца месяца), COUNT и UNTIL. BYMONTH не поддерживается, поэтому YEARLY с
+# BYMONTHDAY, как и требует RFC, повторяется в эти дни каждого месяца года
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+WEEKDAY_NAMES = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+# Больше повторений COUNT не разрешается: конец серии считается перебором
+MAX_COUNT = 1000
+# Сколько периодов подряд без повторений (BYMONTHDAY=31 в коротких месяцах)
+# просматривается, прежде чем считать, что повторений больше нет
+MAX_EMPTY_PERIODS = 100
+
+
+class RecurrenceError(ValueError):
+    """Правило повторения не разобрано или не поддерживается."""
+
+
+class Rule:
+    """Правило повторения заметки.
+
+    Повторения -- наивные datetime в том же местном времени, что и срок
+    заметки, поэтому время дня не сдвигается при переходе на летнее время.
+    """
+
+    def __init__(self, freq: str, interval: int = 1, byday: tuple[int, ...] = (),
+                 bymonthday: tuple[int, ...] = (), count: int | None = None, until: datetime | None = None):
+        self.freq = freq
+        self.interval = interval
+        # Дни недели (0 -- понедельник) для WEEKLY
+        self.byday = byday
+        # Дни месяца для MONTHLY и YEARLY; -1 -- последний день
+        self.bymonthday = bymonthday
+        self.count = count
+        # Последний допустимый момент повторения включительно
+        self.until = until
+
+    def __str__(self) -> str:
+        """Правило в виде RRULE без префикса "RRULE:"."""
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.byday:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in self.byday))
+        if self.bymonthday:
+            parts.append("BYMONTHDAY=" + ",".join(map(str, self.bymonthday)))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            if self.until.time() == time.max.replace(microsecond=0):
+                parts.append(f"UNTIL={self.until:%Y%m%d}")
+            else:
+                parts.append(f"UNTIL={self.until:%Y%m%dT%H%M%S}")
+        return ";".join(parts)
+
+
+def _parse_until(value: str) -> datetime:
+    try:
+        if len(value) == 8:
+            # Дата без времени: повторения в этот день еще разрешены
+            return datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59)
+        moment = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise RecurrenceError(f"Неверный UNTIL: {value}") from None
+    if value.endswith("Z"):
+        # UTC -> местное время сервера, в котором хранятся сроки заметок
+        moment = moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    return moment
+
+
+def parse_rule(text: str) -> Rule:
+    """Разбирает RRULE ("FREQ=WEEKLY;BYDAY=MO,WE", префикс "RRULE:" необязателен).
+
+    Raises:
+        RecurrenceError: правило неверное или выходит за поддерживаемое подмножество.
+    """
+    text = text.strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    params = {}
+    for part in filter(None, text.upper().split(";")):
+        name, sep, value = part.partition("=")
+        if not sep or not value:
+            raise RecurrenceError(f"Неверная часть правила: {part}")
+        params[name.strip()] = value.strip()
+    freq = params.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise RecurrenceError("Нужен FREQ: DAILY, WEEKLY, MONTHLY или YEARLY")
+    try:
+        interval = int(params.pop("INTERVAL", "1"))
+        count = int(params.pop("COUNT")) if "COUNT" in params else None
+        bymonthday = tuple(sorted({int(day) for day in params.pop("BYMONTHDAY").split(",")})) \
+            if "BYMONTHDAY" in params else ()
+    except ValueError:
+        raise RecurrenceError("INTERVAL, COUNT и BYMONTHDAY должны быть числами") from None
+    byday = ()
+    if "BYDAY" in params:
+        days = params.pop("BYDAY").split(",")
+        if freq != "WEEKLY" or not set(days) <= set(WEEKDAYS):
+            raise RecurrenceError("BYDAY поддерживается только для WEEKLY, без номеров недель")
+        byday = tuple(sorted({WEEKDAYS.index(day) for day in days}))
+    until = _parse_until(params.pop("UNTIL")) if "UNTIL" in params else None
+    # WKST ни на что не влияет, пока BYDAY не используется с INTERVAL > 1
+    # и неделей не с понедельника; такие правила встречаются редко
+    params.pop("WKST", None)
+    if params:
+        raise RecurrenceError(f"Не поддерживается: {', '.join(sorted(params))}")
+    if interval < 1:
+        raise RecurrenceError("INTERVAL должен быть положительным")
+    if count is not None and not 1 <= count <= MAX_COUNT:
+        raise RecurrenceError(f"COUNT должен быть от 1 до {MAX_COUNT}")
+    if count is not None and until is not None:
+        raise RecurrenceError("COUNT и UNTIL нельзя указывать вместе")
+    if bymonthday and (freq not in ("MONTHLY", "YEARLY") or not all(1 <= abs(day) <= 31 for day in bymonthday)):
+        raise RecurrenceError("BYMONTHDAY поддерживается только для MONTHLY и YEARLY, от -31 до 31")
+    return Rule(freq, interval, byday, bymonthday, count, until)
+
+
+def _month_days(year: int, month: int, days: tuple[int, ...]) -> list[int]:
+    """Существующие в месяце дни из BYMONTHDAY по возрастанию."""
+    length = calendar.monthrange(year, month)[1]
+    resolved = {day if day > 0 else length + day + 1 for day in days}
+    return sorted(day for day in resolved if 1 <= day <= length)
+
+
+def _candidates(start: datetime, rule: Rule, since: datetime):
+    """Повторения по порядку, начиная с периода, в который попадает since.
+
+    Периоды до since пропускаются арифметикой, а не перебором, поэтому
+    стоимость не зависит от того, как давно началась серия. COUNT здесь
+    не учитывается.
+    """
+    at = start.time()
+    if rule.freq == "DAILY":
+        step = timedelta(days=rule.interval)
+        period = max(0, math.ceil((since - start) / step))
+        while True:
+            yield start + period * step
+            period += 1
+    elif rule.freq == "WEEKLY":
+        week = start.date() - timedelta(days=start.weekday())
+        days = rule.byday or (start.weekday(),)
+        step = 7 * rule.interval
+        period = max(0, (since.date() - week).days // step)
+        while True:
+            first = week + timedelta(days=period * step)
+            for day in days:
+                yield datetime.combine(first + timedelta(days=day), at)
+            period += 1
+    else:
+        months = rule.interval * (12 if rule.freq == "YEARLY" else 1)
+        first_month = start.year * 12 + start.month - 1
+        days = rule.bymonthday or (start.day,)
+        # Месяцев в периоде с повторениями: у YEARLY без BYMONTHDAY -- только
+        # месяц start, с BYMONTHDAY -- все месяцы года (RFC 5545, BYMONTHDAY
+        # без BYMONTH расширяет весь год)
+        span = 1
+        if rule.freq == "YEARLY" and rule.bymonthday:
+            first_month, span = start.year * 12, 12
+        period = max(0, (since.year * 12 + since.month - 1 - first_month) // months)
+        empty = 0
+        while empty < MAX_EMPTY_PERIODS:
+            found = False
+            for offset in range(span):
+                year, month = divmod(first_month + period * months + offset, 12)
+                for day in _month_days(year, month + 1, days):
+                    found = True
+                    yield datetime.combine(date(year, month + 1, day), at)
+            empty = 0 if found else empty + 1
+            period += 1
+
+
+def occurrences(start: datetime, rule: Rule, since: datetime | None = None, until: datetime | None = None,
+                end: datetime | None = None):
+    """Лениво перечисляет повторения серии с первым сроком start в [since, until].
+
+    end -- последнее повторение серии (notes.until_at); если не передан,
+    считается по COUNT и UNTIL правила.
+    """
+    if end is None:
+        end = series_end(start, rule)
+    since = max(since or start, start)
+    for moment in _candidates(start, rule, since):
+        if (until is not None and moment > until) or (end is not None and moment > end):
+            return
+        if moment >= since:
+            yield moment
+
+
+def next_occurrence(start: datetime, rule: Rule, after: datetime, end: datetime | None = None) -> datetime | None:
+    """Первое повторение строго позже after или None, если серия закончилась."""
+    for moment in occurrences(start, rule, after, end=end):
+        if moment > after:
+            return moment
+    return None
+
+
+def series_end(start: datetime, rule: Rule) -> datetime | None:
+    """Последнее повторение серии или None для бесконечной.
+
+    Считается один раз при сохранении правила: для COUNT -- перебором
+    (не больше MAX_COUNT повторений), для UNTIL -- поиском назад от UNTIL.
+    """
+    if rule.count is not None:
+        last = None
+        # В первом периоде бывают дни раньше start (BYDAY=MO при старте в среду)
+        moments = (moment for moment in _candidates(start, rule, start) if moment >= start)
+        for last, _ in zip(moments, range(rule.count)):
+            pass
+        return last
+    if rule.until is None:
+        return None
+    if rule.until < start:
+        return start
+    lookback = timedelta(days=32 * rule.interval * (12 if rule.freq == "YEARLY" else 1))
+    while True:
+        since = max(start, rule.until - lookback)
+        last = None
+        for last in occurrences(start, rule, since, rule.until, end=rule.until):
+            pass
+        if last is not None or since == start:
+            return last or start
+        lookback *= 2
+
+
+def describe_rule(rule: Rule) -> str:
+    """Правило по-русски: "каждую неделю (пн, ср) до 31-12-2026"."""
+    first, *forms = {"DAILY": ("каждый день", "день", "дня", "дней"),
+                     "WEEKLY": ("каждую неделю", "неделю", "недели", "недель"),
+                     "MONTHLY": ("каждый месяц", "месяц", "месяца", "месяцев"),
+                     "YEARLY": ("каждый год", "год", "года", "лет")}[rule.freq]
+    text = first if rule.interval == 1 else f"раз в {rule.interval} {plural(rule.interval, forms)}"
+    if rule.byday:
+        text += f" ({', '.join(WEEKDAY_NAMES[day] for day in rule.byday)})"
+    if rule.bymonthday:
+        days = ", ".join("последнего" if day == -1 else str(day) for day in rule.bymonthday)
+        text += f" ({days} числа{' каждого месяца' if rule.freq == 'YEARLY' else ''})"
+    if rule.count is not None:
+        text += f", {rule.count} {plural(rule.count, ('раз', 'раза', 'раз'))}"
+    if rule.until is not None:
+        text += f" до {rule.until:%d-%m-%Y}"
+    return text
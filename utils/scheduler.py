@@ -1,46 +1,243 @@
 import logging
-from datetime import datetime, timedelta
+import heapq
+import time
 import asyncio
-from database import get_notes_for_reminders, mark_reminder_sent
-from config import DATABASE_NAME
-
-async def check_reminders(bot):
-    """Фоновая задача для проверки и отправки напоминаний."""
-    while True:
-        logging.info("Проверка напоминаний...")
-        now = datetime.now()
-        notes_to_check = await get_notes_for_reminders(DATABASE_NAME)
-
-        for note in notes_to_check:
-            note_id = note['id']
-            user_id = note['user_id']
-            note_text = note['note_text']
-            note_type = note["note_type"]
-            note_date_str = note['note_date']
-            note_time_str = note['note_time']
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from database import (
+    get_due_reminders,
+    mark_reminders_sent,
+    get_digest_users,
+    add_note_listener,
+    remove_note_listener,
+)
+from config import (
+    DATABASE_NAME,
+    REMINDER_SEND_CONCURRENCY,
+    DIGEST_REPLACES_LEAD,
+)
+from utils.rate_limit import SendRateLimiter
+from utils.formatting import format_lead
+from utils.leader import run_as_leader
+from utils.metrics import REMINDER_LATENESS
 
-            try:
-                note_datetime = datetime.strptime(f"{note_date_str} {note_time_str}", "%d-%m-%Y %H:%M")
-            except ValueError:
-                logging.error(f"Неверный формат даты/времени для заметки ID {note_id}: {note_date_str} {note_time_str}")
-                continue
+# Насколько вперед планировщик читает напоминания из базы, в секундах
+REMINDER_WINDOW = 15 * 60
+# Сколько напоминаний читается из базы за один запрос
+REMINDER_BATCH = 500
+# Пауза перед повторной попыткой после ошибки отправки, в секундах
+RETRY_DELAY = 60
+# Сколько раз повторять отправку после ответа 429 от Telegram
+SEND_ATTEMPTS = 5
 
-            time_diff = note_datetime - now
 
-            if not note['reminder_24h_sent'] and time_diff <= timedelta(days=1) and time_diff > timedelta(hours=1):
-                try:
-                    await bot.send_message(user_id, f"Напоминание (24 часа): \"{note_text}\" в категории \"{note_type}\" запланировано на {note_date_str} {note_time_str}")
-                    await mark_reminder_sent(DATABASE_NAME, note_id, '24h')
-                    logging.info(f"Отправлено напоминание 24h для заметки ID {note_id} пользователю {user_id}")
-                except Exception as e:
-                    logging.error(f"Ошибка отправки 24h напоминания для заметки ID {note_id}: {e}")
+class ReminderScheduler:
+    """Планировщик напоминаний на основе кучи ближайших сроков.
+
+    В памяти хранятся только напоминания из ближайшего окна REMINDER_WINDOW:
+    они читаются из таблицы reminders по частичному индексу с LIMIT.
+    Новые и измененные напоминания приходят от database.py через
+    add_note_listener. Между напоминаниями планировщик спит ровно до
+    ближайшего срока или до конца окна.
+
+    Если заметки меняют другие процессы, чьи изменения сюда не приходят,
+    окно перечитывается не реже чем раз в refresh_interval секунд.
+    """
+
+    def __init__(self, bot, db_name: str = DATABASE_NAME, refresh_interval: int | None = None):
+        self.bot = bot
+        self.db_name = db_name
+        self.refresh_interval = refresh_interval
+        # (время отправки, ID напоминания)
+        self._heap: list[tuple[int, int]] = []
+        # Напоминания окна по ID; записи кучи, которых здесь нет,
+        # пропускаются при извлечении
+        self._pending: dict[int, dict] = {}
+        self._window_end = 0
+        self._refill_at = 0
+        self._wakeup = asyncio.Event()
+        self._limiter = SendRateLimiter()
+        self._send_slots = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+
+    async def _refill(self, now: int):
+        """Читает из базы напоминания, которые нужно отправить в ближайшем окне."""
+        reminders = await get_due_reminders(self.db_name, now + REMINDER_WINDOW, REMINDER_BATCH)
+        # Окно строится заново: так пропадают напоминания заметок, удаленных
+        # другими процессами. Отложенные после ошибки повторы сохраняют свое время.
+        previous = self._pending
+        self._pending = {}
+        for reminder in map(dict, reminders):
+            if reminder["id"] in previous:
+                reminder["fire_at"] = max(reminder["fire_at"], previous[reminder["id"]]["fire_at"])
+            self._pending[reminder["id"]] = reminder
+        self._heap = [(r["fire_at"], r["id"]) for r in self._pending.values()]
+        heapq.heapify(self._heap)
+        if len(reminders) < REMINDER_BATCH:
+            self._window_end = now + REMINDER_WINDOW
+        else:
+            # Остальное дочитаем, когда дойдем до последнего прочитанного
+            self._window_end = max(reminders[-1]["fire_at"], now + 1)
+        self._refill_at = self._window_end
+        if self.refresh_interval is not None:
+            self._refill_at = min(self._refill_at, now + self.refresh_interval)
+
+    def _push(self, reminder: dict):
+        if reminder["id"] not in self._pending:
+            self._pending[reminder["id"]] = reminder
+            heapq.heappush(self._heap, (reminder["fire_at"], reminder["id"]))
+
+    def _drop_note(self, note_id: int):
+        for reminder_id in [r["id"] for r in self._pending.values() if r["note_id"] == note_id]:
+            del self._pending[reminder_id]
+
+    def on_note_changed(self, event: str, note: dict):
+        """Обрабатывает изменения заметок, о которых сообщает database.py."""
+        if event in ("add", "reminders"):
+            self._drop_note(note["id"])
+            for reminder in note["reminders"]:
+                # Более поздние напоминания прочитаем из базы вместе с их окном
+                if reminder["fire_at"] <= self._window_end:
+                    self._push({
+                        **reminder,
+                        "note_id": note["id"],
+                        "user_id": note["user_id"],
+                        "note_text": note["note_text"],
+                        "note_type": note["note_type"],
+                        "note_date": note["note_date"],
+                        "note_time": note["note_time"],
+                        "due_at": note["due_at"],
+                    })
+            self._wakeup.set()
+        elif event == "edit":
+            for reminder in self._pending.values():
+                if reminder["note_id"] == note["id"]:
+                    reminder["note_text"] = note["note_text"]
+        elif event == "delete":
+            self._drop_note(note["id"])
+        elif event == "import":
+            # О заметках из файла сообщают без напоминаний -- окно перечитывается из базы
+            self._refill_at = 0
+            self._wakeup.set()
+
+    async def _deliver(self, note_id: int, reminders: list[dict], now: int, done: list[int]) -> bool:
+        """Отправляет одно напоминание заметки с учетом лимитов Telegram.
 
-            elif not note['reminder_1h_sent'] and time_diff <= timedelta(hours=1) and time_diff > timedelta(minutes=0):
+        ID обработанных напоминаний добавляются в done; при ошибке
+        напоминания возвращаются в очередь. Возвращает True, если
+        сообщение доставлено.
+        """
+        # Из нескольких наступивших напоминаний одной заметки имеет смысл
+        # только самое позднее, остальные отмечаются без отправки
+        reminder = min(reminders, key=lambda r: r["lead"])
+        if reminder["due_at"] <= now:
+            done.extend(r["id"] for r in reminders)
+            return False
+        user_id = reminder["user_id"]
+        async with self._send_slots:
+            for _ in range(SEND_ATTEMPTS):
+                await self._limiter.acquire(user_id)
                 try:
-                    await bot.send_message(user_id, f"Напоминание (1 час): \"{note_text}\" в категории \"{note_type}\" запланировано на {note_date_str} {note_time_str}")
-                    await mark_reminder_sent(DATABASE_NAME, note_id, '1h')
-                    logging.info(f"Отправлено напоминание 1h для заметки ID {note_id} пользователю {user_id}")
+                    await self.bot.send_message(user_id, f"Напоминание (за {format_lead(reminder['lead'])}): \"{reminder['note_text']}\" в категории \"{reminder['note_type']}\" запланировано на {reminder['note_date']} {reminder['note_time']}")
+                except TelegramRetryAfter as e:
+                    logging.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой напоминаний")
+                    self._limiter.pause(e.retry_after)
+                    continue
+                except TelegramForbiddenError:
+                    logging.warning(f"Пользователь {user_id} заблокировал бота, напоминание для заметки ID {note_id} пропущено",
+                                    extra={"user_id": user_id, "note_id": note_id})
+                    done.extend(r["id"] for r in reminders)
+                    return False
                 except Exception as e:
-                    logging.error(f"Ошибка отправки 1h напоминания для заметки ID {note_id}: {e}")
+                    logging.error(f"Ошибка отправки напоминания для заметки ID {note_id}: {e}",
+                                  extra={"user_id": user_id, "note_id": note_id})
+                    break
+                done.extend(r["id"] for r in reminders)
+                # fire_at мог сдвинуться после ошибки, поэтому время считается от срока
+                lateness = time.time() - (reminder["due_at"] - reminder["lead"])
+                REMINDER_LATENESS.observe(lateness)
+                logging.info(f"Отправлено напоминание за {format_lead(reminder['lead'])} для заметки ID {note_id} пользователю {user_id}",
+                             extra={"user_id": user_id, "note_id": note_id, "lateness_ms": round(lateness * 1000)})
+                return True
+        for r in reminders:
+            r["fire_at"] = now + RETRY_DELAY
+            self._push(r)
+        return False
+
+    async def _fire_due(self, now: int):
+        """Параллельно отправляет наступившие напоминания, по одному сообщению на заметку."""
+        by_note: dict[int, list[dict]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            reminder = self._pending.pop(reminder_id, None)
+            if reminder is not None:
+                by_note.setdefault(reminder["note_id"], []).append(reminder)
+        if not by_note:
+            return
+
+        done: list[int] = []
+        # Напоминания за сутки пользователям с ежедневной сводкой не
+        # отправляются: заметки дня приходят им одним сообщением (utils.digest)
+        daily_users = {r["user_id"] for reminders in by_note.values() for r in reminders
+                       if r["lead"] == DIGEST_REPLACES_LEAD}
+        if daily_users:
+            digest_users = await get_digest_users(self.db_name, daily_users)
+            for note_id, reminders in list(by_note.items()):
+                kept = [r for r in reminders if r["lead"] != DIGEST_REPLACES_LEAD or r["user_id"] not in digest_users]
+                done.extend(r["id"] for r in reminders if r not in kept)
+                if kept:
+                    by_note[note_id] = kept
+                else:
+                    del by_note[note_id]
+
+        started = time.monotonic()
+        delivered = await asyncio.gather(*(
+            self._deliver(note_id, reminders, now, done)
+            for note_id, reminders in by_note.items()
+        ))
+        if done:
+            # Все отправленные напоминания пачки отмечаются одной транзакцией
+            moved = await mark_reminders_sent(self.db_name, done)
+            if moved:
+                # Напоминания серий перенесены на следующие повторения --
+                # окно перечитывается не позже, чем наступит первое из них
+                self._refill_at = min(self._refill_at, min(moved))
+        self._limiter.prune()
+
+        sent = sum(delivered)
+        if sent > 1:
+            elapsed = time.monotonic() - started
+            logging.info(f"Отправлено {sent} напоминаний за {elapsed:.2f} с ({sent / elapsed:.1f} в секунду)",
+                         extra={"sent": sent, "duration_ms": round(elapsed * 1000)})
+
+    async def run(self):
+        """Отправляет напоминания по мере наступления сроков."""
+        while True:
+            self._wakeup.clear()
+            now = int(time.time())
+            if now >= self._refill_at:
+                await self._refill(now)
+            await self._fire_due(now)
+
+            next_at = min(self._heap[0][0], self._refill_at) if self._heap else self._refill_at
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(next_at - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+
+async def check_reminders(bot, scheduler: ReminderScheduler | None = None):
+    """Фоновая задача для отправки напоминаний."""
+    scheduler = scheduler or ReminderScheduler(bot)
+    add_note_listener(scheduler.on_note_changed)
+    try:
+        await scheduler.run()
+    finally:
+        remove_note_listener(scheduler.on_note_changed)
+
 
-        await asyncio.sleep(60)
\ No newline at end of file
+async def lead_reminders(bot, refresh_interval: int | None = None):
+    """Отправляет напоминания, пока этот процесс держит аренду лидера "reminders"."""
+    await run_as_leader(
+        "reminders",
+        lambda: check_reminders(bot, ReminderScheduler(bot, refresh_interval=refresh_interval)),
+        "отправляет напоминания",
+    )
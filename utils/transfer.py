@@ -0,0 +1,325 @@
+import csv
+import io
+import re
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from aiogram.types.input_file import InputFile
+from config import DATABASE_NAME, GOOGLE_CALENDAR_TIMEZONE, IMPORT_CATEGORY
+from database import iter_user_notes, note_start
+from utils.google_calendar import ALL_DAY_TIME, event_id
+from utils.recurrence import parse_rule
+
+FORMATS = ("csv", "ics")
+# Колонки CSV; при загрузке строка с этими названиями считается заголовком
+CSV_FIELDS = ("date", "time", "category", "text", "rrule")
+# Строки iCalendar длиннее 75 байт переносятся (RFC 5545, 3.1)
+ICS_LINE_LIMIT = 75
+UNTITLED = "(без названия)"
+
+# Даты и время разбираются и форматируются без strptime и strftime:
+# при загрузке и выгрузке они вызываются для каждой заметки и занимают
+# большую часть времени.
+
+
+def _format_date(day: date) -> str:
+    return f"{day.day:02d}-{day.month:02d}-{day.year:04d}"
+
+
+def _format_time(moment: datetime | time) -> str:
+    return f"{moment.hour:02d}:{moment.minute:02d}"
+
+
+def _parse_date(value: str) -> str:
+    """Дата заметки из DD-MM-YYYY, DD.MM.YYYY или YYYY-MM-DD."""
+    parts = re.split(r"[-.]", value.strip())
+    if len(parts) != 3:
+        raise ValueError(f"Неизвестный формат даты: {value!r}")
+    year, month, day = parts if len(parts[0]) == 4 else parts[::-1]
+    return _format_date(date(int(year), int(month), int(day)))
+
+
+def _parse_time(value: str) -> str:
+    """Время заметки из HH:MM или HH:MM:SS."""
+    hour, minute = value.strip().split(":")[:2]
+    return _format_time(time(int(hour), int(minute)))
+
+
+def _ics_format(moment: datetime) -> str:
+    return f"{moment.year:04d}{moment.month:02d}{moment.day:02d}T{moment.hour:02d}{moment.minute:02d}00"
+
+
+def _ics_parse(value: str) -> datetime:
+    """Дата и время iCalendar: YYYYMMDD или YYYYMMDDTHHMMSS[Z]."""
+    if len(value) == 8:
+        return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    if len(value) < 15 or value[8] != "T":
+        raise ValueError(f"Неизвестный формат даты: {value!r}")
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]), int(value[9:11]), int(value[11:13]))
+
+
+# Выгрузка
+
+def _csv_text(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_FIELDS)
+    writer.writerows((row["note_date"], row["note_time"], row["note_type"], row["note_text"], row["rrule"] or "")
+                     for row in rows)
+    return buffer.getvalue()
+
+
+def _ics_escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ics_line(line: str) -> str:
+    """Строка iCalendar с CRLF, перенесенная по 75 байт без разрыва символов UTF-8."""
+    data = line.encode()
+    if len(data) <= ICS_LINE_LIMIT:
+        return line + "\r\n"
+    parts = []
+    limit = ICS_LINE_LIMIT
+    while data:
+        end = min(limit, len(data))
+        # Не режем многобайтовый символ: байты продолжения -- 10xxxxxx
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[:end].decode())
+        data = data[end:]
+        # Строка продолжения начинается с пробела, он тоже считается
+        limit = ICS_LINE_LIMIT - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_event(row, stamp: str) -> str:
+    start = note_start(row["note_date"], row["note_time"])
+    # Заметки хранятся в местном времени без пояса, поэтому время "плавающее"
+    lines = (
+        "BEGIN:VEVENT",
+        f"UID:{event_id(row['id'])}@telegram-bot-planner",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_ics_format(start)}",
+        f"DTEND:{_ics_format(start + timedelta(hours=1))}",
+        f"SUMMARY:{_ics_escape(row['note_text'])}",
+        f"CATEGORIES:{_ics_escape(row['note_type'])}",
+        *([f"RRULE:{row['rrule']}"] if row["rrule"] else []),
+        "END:VEVENT",
+    )
+    return "".join(_ics_line(line) for line in lines)
+
+
+async def export_chunks(user_id: int, fmt: str, db_name: str = DATABASE_NAME):
+    """Выгрузка заметок пользователя в формате fmt ("csv" или "ics") по кускам байт.
+
+    Каждый кусок -- одна пачка строк курсора database.iter_user_notes,
+    поэтому выгрузка не собирается в памяти целиком.
+    """
+    if fmt == "csv":
+        # BOM нужен, чтобы Excel открыл кириллицу в UTF-8
+        header = True
+        async for rows in iter_user_notes(db_name, user_id):
+            yield _csv_text(rows, header).encode("utf-8-sig" if header else "utf-8")
+            header = False
+        if header:
+            yield _csv_text([], header).encode("utf-8-sig")
+        return
+    stamp = _ics_format(datetime.now(timezone.utc)) + "Z"
+    yield "".join(map(_ics_line, ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//telegram-bot-planner//RU",
+                                  "CALSCALE:GREGORIAN"))).encode()
+    async for rows in iter_user_notes(db_name, user_id):
+        yield "".join(_ics_event(row, stamp) for row in rows).encode()
+    yield _ics_line("END:VCALENDAR").encode()
+
+
+class NotesExportFile(InputFile):
+    """Выгрузка заметок для отправки в Telegram через временный файл на диске.
+
+    fill() переписывает заметки из курсора базы во временный файл, и только
+    потом aiogram отправляет его, читая кусками по chunk_size. Так
+    соединение из пула занято лишь на время чтения базы, а не на всю
+    загрузку в Telegram, и выгрузка любого размера не занимает память
+    целиком. Файл удаляется в close() или при выходе из with.
+    """
+
+    def __init__(self, user_id: int, fmt: str, db_name: str = DATABASE_NAME):
+        super().__init__(filename=f"notes-{datetime.now():%Y-%m-%d}.{fmt}")
+        self.user_id = user_id
+        self.fmt = fmt
+        self.db_name = db_name
+        self._file = tempfile.TemporaryFile()
+
+    async def fill(self) -> int:
+        """Выгружает заметки во временный файл; возвращает его размер в байтах."""
+        self._file.seek(0)
+        self._file.truncate()
+        async for chunk in export_chunks(self.user_id, self.fmt, self.db_name):
+            self._file.write(chunk)
+        return self._file.tell()
+
+    async def read(self, bot):
+        self._file.seek(0)
+        while chunk := self._file.read(self.chunk_size):
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Загрузка
+
+def detect_format(filename: str | None, head: bytes) -> str | None:
+    """Формат файла по расширению, а если оно незнакомое -- по началу содержимого."""
+    extension = (filename or "").rpartition(".")[2].lower()
+    if extension in FORMATS:
+        return extension
+    if head.lstrip(b"\xef\xbb\xbf \r\n\t").upper().startswith(b"BEGIN:VCALENDAR"):
+        return "ics"
+    return None
+
+
+# NAME;PARAM=value;PARAM="value:with:colons":VALUE
+_ICS_PROPERTY = re.compile(r'([^:;]+)((?:;[^:;=]+=(?:"[^"]*"|[^:;"]*))*):(.*)', re.DOTALL)
+_ICS_PARAM = re.compile(r';([^:;=]+)=("[^"]*"|[^:;"]*)')
+_ICS_ESCAPE = re.compile(r"\\(.)")
+
+
+def _ics_unescape(text: str) -> str:
+    return _ICS_ESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+
+def _ics_split(text: str) -> list[str]:
+    """Значения списка через запятую; экранированные запятые не разделяют."""
+    return [_ics_unescape(part) for part in re.split(r"(?<!\\),", text)]
+
+
+def _ics_start(value: str, params: dict) -> tuple[str, str]:
+    """Дата и время заметки по DTSTART в поясе GOOGLE_CALENDAR_TIMEZONE."""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return _format_date(_ics_parse(value[:8])), ALL_DAY_TIME
+    moment = _ics_parse(value)
+    zone = None
+    if value.endswith("Z"):
+        zone = timezone.utc
+    elif "TZID" in params:
+        try:
+            zone = ZoneInfo(params["TZID"].strip('"'))
+        except (ZoneInfoNotFoundError, ValueError):
+            # Пояс из VTIMEZONE с нестандартным именем -- считаем время местным
+            zone = None
+    if zone is not None:
+        moment = moment.replace(tzinfo=zone).astimezone(ZoneInfo(GOOGLE_CALENDAR_TIMEZONE))
+    return _format_date(moment), _format_time(moment)
+
+
+class NoteReader:
+    """Читает заметки из текстового потока CSV или iCalendar по одной.
+
+    Итерация отдает словари для database.import_notes и не держит файл в
+    памяти. Записи, которые не удалось разобрать, пропускаются и
+    считаются в skipped. Так же пропускаются повторяющиеся события с
+    правилом вне поддерживаемого подмножества RRULE (utils.recurrence) и
+    отдельно измененные повторения (RECURRENCE-ID); исключения из серий
+    (EXDATE) не переносятся. Если сам файл испорчен (не UTF-8, незакрытые
+    кавычки), чтение останавливается, а причина остается в error.
+    """
+
+    def __init__(self, stream, fmt: str, category: str = IMPORT_CATEGORY):
+        self.stream = stream
+        self.fmt = fmt
+        self.category = category
+        self.skipped = 0
+        self.error: str | None = None
+
+    def __iter__(self):
+        try:
+            yield from self._read_csv() if self.fmt == "csv" else self._read_ics()
+        except (UnicodeDecodeError, csv.Error) as e:
+            self.error = str(e)
+
+    def _note(self, text: str, category: str, note_date: str, note_time: str, rrule: str = "") -> dict:
+        return {
+            "note_text": text.strip() or UNTITLED,
+            "note_type": category.strip() or self.category,
+            "note_date": note_date,
+            "note_time": note_time,
+            # RecurrenceError -- подкласс ValueError, такая запись пропускается
+            "rrule": str(parse_rule(rrule)) if rrule.strip() else None,
+        }
+
+    def _read_csv(self):
+        columns = {field: index for index, field in enumerate(CSV_FIELDS)}
+        for number, row in enumerate(csv.reader(self.stream)):
+            header = [cell.strip("\ufeff \t").lower() for cell in row] if number == 0 else []
+            if {"date", "text"} <= set(header):
+                columns = {name: index for index, name in enumerate(header)}
+                continue
+            if not any(cell.strip() for cell in row):
+                continue
+            cells = {name: row[index] for name, index in columns.items() if index < len(row)}
+            try:
+                yield self._note(cells.get("text", ""), cells.get("category", ""), _parse_date(cells.get("date", "")),
+                                 _parse_time(cells.get("time") or ALL_DAY_TIME), cells.get("rrule", ""))
+            except ValueError:
+                self.skipped += 1
+
+    def _lines(self):
+        """Строки iCalendar с уже склеенными переносами."""
+        current = None
+        for line in self.stream:
+            line = line.rstrip("\r\n")
+            if line[:1] in (" ", "\t") and current is not None:
+                current += line[1:]
+                continue
+            if current is not None:
+                yield current
+            current = line
+        if current is not None:
+            yield current
+
+    def _read_ics(self):
+        event = None
+        depth = 0
+        for line in self._lines():
+            match = _ICS_PROPERTY.fullmatch(line)
+            if match is None:
+                continue
+            name, params, value = match.group(1).upper(), match.group(2), match.group(3)
+            if name == "BEGIN":
+                if value.upper() == "VEVENT":
+                    event, depth = {}, 0
+                elif event is not None:
+                    # Вложенные компоненты (VALARM) со своими свойствами
+                    depth += 1
+            elif name == "END":
+                if event is not None and depth:
+                    depth -= 1
+                elif event is not None and value.upper() == "VEVENT":
+                    note = self._event_note(event)
+                    if note is None:
+                        self.skipped += 1
+                    else:
+                        yield note
+                    event = None
+            elif event is not None and not depth and name not in event:
+                event[name] = (value, {key.upper(): val for key, val in _ICS_PARAM.findall(params or "")})
+
+    def _event_note(self, event: dict) -> dict | None:
+        if ("DTSTART" not in event or "RECURRENCE-ID" in event
+                or event.get("STATUS", ("",))[0].upper() == "CANCELLED"):
+            return None
+        try:
+            note_date, note_time = _ics_start(*event["DTSTART"])
+            categories = _ics_split(event["CATEGORIES"][0]) if "CATEGORIES" in event else [""]
+            return self._note(_ics_unescape(event.get("SUMMARY", ("",))[0]), categories[0], note_date, note_time,
+                              event.get("RRULE", ("",))[0])
+        except ValueError:
+            return None
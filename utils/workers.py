@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config import (
+    BOT_TOKEN,
+    DATABASE_NAME,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBAPP_KEEPALIVE_TIMEOUT,
+    REMINDER_REFRESH_INTERVAL,
+    METRICS_HOST,
+    METRICS_PORT,
+    GOOGLE_CALENDAR_ENABLED,
+    ARCHIVE_AFTER_DAYS,
+)
+from database import init_db, open_pool, close_pool
+from handlers import router
+from utils.fsm_storage import SQLiteStorage
+from utils.scheduler import lead_reminders
+from utils.metrics_server import start_metrics_server
+from utils.log import setup_logging
+from utils.google_calendar import close_calendar_client
+from utils.calendar_sync import lead_calendar_sync
+from utils.archive import lead_archiver
+from utils.digest import lead_digests
+
+# Как часто проверять, что рабочие процессы живы, в секундах
+SUPERVISE_INTERVAL = 5
+
+
+def update_user_id(update: dict) -> int:
+    """Возвращает ID пользователя, от которого пришло обновление (или ID чата).
+
+    update -- обновление с ключами как в JSON Telegram ("from", а не
+    from_user): так приходит вебхук и так его выгружает dispatch_update.
+    """
+    for value in update.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or value.get("chat")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return 0
+
+
+async def _worker_main(index: int, queue):
+    await open_pool(DATABASE_NAME)
+    bot = Bot(token=BOT_TOKEN)
+    # Обновления пользователя всегда приходят в один процесс,
+    # поэтому кэш состояний FSM здесь не расходится с другими процессами
+    storage = SQLiteStorage(DATABASE_NAME)
+    dp = Dispatcher(storage=storage)
+    dp.include_router(router)
+    leaders = [
+        asyncio.create_task(lead_reminders(bot, REMINDER_REFRESH_INTERVAL)),
+        asyncio.create_task(lead_digests(bot)),
+    ]
+    if GOOGLE_CALENDAR_ENABLED:
+        leaders.append(asyncio.create_task(lead_calendar_sync()))
+    if ARCHIVE_AFTER_DAYS:
+        leaders.append(asyncio.create_task(lead_archiver()))
+    metrics = None
+    if METRICS_PORT:
+        metrics = await start_metrics_server(METRICS_HOST, METRICS_PORT + index)
+    loop = asyncio.get_running_loop()
+    handling = set()
+    logging.info(f"Рабочий процесс {index} запущен")
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            update = Update.model_validate_json(raw, context={"bot": bot})
+            task = asyncio.create_task(dp.feed_update(bot, update))
+            handling.add(task)
+            task.add_done_callback(handling.discard)
+        await asyncio.gather(*handling, return_exceptions=True)
+    finally:
+        for leader in leaders:
+            leader.cancel()
+        await asyncio.gather(*leaders, return_exceptions=True)
+        if metrics is not None:
+            await metrics.cleanup()
+        await close_calendar_client()
+        await storage.close()
+        await bot.session.close()
+        await close_pool(DATABASE_NAME)
+
+
+def worker_process(index: int, queue):
+    """Точка входа рабочего процесса: обрабатывает обновления из своей очереди."""
+    log_listener = setup_logging()
+    try:
+        asyncio.run(_worker_main(index, queue))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_listener.stop()
+
+
+class WorkerPool:
+    """Рабочие процессы и распределение обновлений между ними по user_id."""
+
+    def __init__(self, count: int, target=worker_process):
+        self.count = count
+        self.target = target
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(count)]
+        self.processes: list = [None] * count
+
+    def _start(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(index, self.queues[index]), daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._start(index)
+
+    def dispatch(self, raw: str, update: dict | None = None):
+        """Отправляет обновление (JSON) процессу, который отвечает за его пользователя."""
+        if update is None:
+            update = json.loads(raw)
+        self.queues[update_user_id(update) % self.count].put(raw)
+
+    def dispatch_update(self, update: Update):
+        """Отправляет процессу обновление, полученное через getUpdates."""
+        # by_alias: без него пользователь лежит в from_user, update_user_id
+        # его не находит, и нажатия кнопок уходили бы в процесс 0, а
+        # сообщения того же пользователя -- в другой
+        data = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+        self.dispatch(json.dumps(data, ensure_ascii=False), data)
+
+    async def supervise(self):
+        """Перезапускает упавшие рабочие процессы."""
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logging.error(f"Рабочий процесс {index} завершился с кодом {process.exitcode}, перезапускаем")
+                    self._start(index)
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+
+
+async def _receive_polling(pool: WorkerPool):
+    bot = Bot(token=BOT_TOKEN)
+    await bot.delete_webhook()
+    offset = None
+    try:
+        while True:
+            updates = await bot.get_updates(offset=offset, timeout=30)
+            for update in updates:
+                pool.dispatch_update(update)
+                offset = update.update_id + 1
+    finally:
+        await bot.session.close()
+
+
+async def _receive_webhook(pool: WorkerPool):
+    async def handle(request: web.Request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        pool.dispatch(await request.text())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    if WEBHOOK_URL:
+        bot = Bot(token=BOT_TOKEN)
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+        await bot.session.close()
+
+    runner = web.AppRunner(app, keepalive_timeout=WEBAPP_KEEPALIVE_TIMEOUT)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logging.info(f"Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _receive(pool: WorkerPool):
+    supervisor = asyncio.create_task(pool.supervise())
+    try:
+        if BOT_MODE == "webhook":
+            await _receive_webhook(pool)
+        else:
+            await _receive_polling(pool)
+    finally:
+        supervisor.cancel()
+
+
+def run_workers(count: int):
+    """Запускает count рабочих процессов и принимает для них обновления.
+
+    Главный процесс только получает обновления и раскладывает их по
+    очередям процессов по user_id, поэтому весь сценарий FSM одного
+    пользователя выполняется в одном процессе. Напоминания отправляет
+    один процесс -- тот, кто держит аренду в базе.
+    """
+    asyncio.run(init_db(DATABASE_NAME))
+    pool = WorkerPool(count)
+    pool.start()
+    try:
+        asyncio.run(_receive(pool))
+    finally:
+        pool.stop()